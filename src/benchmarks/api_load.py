@@ -0,0 +1,265 @@
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from threading import Thread
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from shared.database import DatabaseManager, to_db_timestamp
+from shared.decoders import registry as decoder_registry
+
+from .report import db_size, latency_summary
+from .traffic import TrafficGenerator
+
+# Записей в пачке при заполнении базы (времена приема пачки - равномерно
+# в пределах ее шага)
+SEED_BATCH_SIZE = 5000
+
+# Сколько ждать запуска API, секунды
+STARTUP_TIMEOUT = 60.0
+
+# Доли запросов в нагрузке: страница последних записей, следующая страница
+# по курсору, часовое окно по времени и список топиков
+QUERY_MIX = (
+    ("data_latest", 0.4),
+    ("data_cursor", 0.2),
+    ("data_window", 0.3),
+    ("topics", 0.1),
+)
+
+
+def seed_database(
+    db_path: str, rows: int, generator: TrafficGenerator, days: int = 30
+) -> dict:
+    """
+    Заполняет базу rows записями, равномерно за последние days дней
+
+    Заполненная база помечается файлом {db_path}.seeded с числом записей и
+    переиспользуется следующими прогонами: 50M записей вставляются долго
+    """
+    marker = f"{db_path}.seeded"
+    if os.path.exists(marker) and os.path.exists(db_path):
+        with open(marker, encoding="utf-8") as marker_file:
+            if int(marker_file.read() or 0) == rows:
+                return {"rows": rows, "seed_seconds": 0.0, "reused": True}
+    for path in (db_path, f"{db_path}-wal", f"{db_path}-shm", marker):
+        if os.path.exists(path):
+            os.remove(path)
+
+    db_manager = DatabaseManager(db_path)
+    batches = -(-rows // SEED_BATCH_SIZE)
+    step = timedelta(days=days) // timedelta(milliseconds=1) // batches
+    moment = to_db_timestamp(datetime.now(timezone.utc) - timedelta(days=days))
+    started = time.monotonic()
+    for offset in range(0, rows, SEED_BATCH_SIZE):
+        batch = generator.batch(min(SEED_BATCH_SIZE, rows - offset))
+        decoded = decoder_registry.decode_batch(batch)
+        received = [moment + index * step // len(batch) for index in range(len(batch))]
+        if not db_manager.insert_decoded(decoded, received=received):
+            raise RuntimeError("Failed to seed the benchmark database")
+        moment += step
+    elapsed = time.monotonic() - started
+    db_manager.close()
+    with open(marker, "w", encoding="utf-8") as marker_file:
+        marker_file.write(str(rows))
+    return {"rows": rows, "seed_seconds": round(elapsed, 1), "reused": False}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class APIServer:
+    """mqtt_logs_api в отдельном процессе uvicorn поверх заданной базы"""
+
+    def __init__(self, db_path: str, workers: int = 1):
+        self.db_path = db_path
+        self.workers = workers
+        self.port = _free_port()
+        self.process: Optional[subprocess.Popen] = None
+
+    def __enter__(self) -> "APIServer":
+        source_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = {
+            **os.environ,
+            "DB_PATH": self.db_path,
+            "LOG_LEVEL": "WARNING",
+            "PYTHONPATH": source_dir,
+        }
+        self.process = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "mqtt_logs_api.main:app",
+                "--port",
+                str(self.port),
+                "--workers",
+                str(self.workers),
+                "--no-access-log",
+                "--log-level",
+                "warning",
+            ],
+            cwd=source_dir,
+            env=env,
+        )
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("API server exited during startup")
+            try:
+                status, _, _ = self.get("/api/health")
+                if status == 200:
+                    return self
+            except OSError:
+                pass
+            time.sleep(0.2)
+        self.__exit__()
+        raise RuntimeError("API server did not start in time")
+
+    def __exit__(self, *exc_info) -> None:
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+            self.process = None
+
+    def get(self, path: str) -> Tuple[int, dict, bytes]:
+        connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=30)
+        try:
+            connection.request("GET", path)
+            response = connection.getresponse()
+            return response.status, dict(response.getheaders()), response.read()
+        finally:
+            connection.close()
+
+
+class _LoadClient(Thread):
+    """Клиент с keep-alive соединением: запросы по QUERY_MIX до deadline"""
+
+    def __init__(
+        self,
+        port: int,
+        topics: List[str],
+        window: Tuple[datetime, datetime],
+        seed: int,
+        deadline: float,
+    ):
+        super().__init__(daemon=True)
+        self.port = port
+        self.topics = topics
+        self.window = window
+        self.random = random.Random(seed)
+        self.deadline = deadline
+        self.latencies: Dict[str, List[float]] = {name: [] for name, _ in QUERY_MIX}
+        self.errors: Dict[str, int] = {name: 0 for name, _ in QUERY_MIX}
+
+    def run(self) -> None:
+        connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+        names = [name for name, _ in QUERY_MIX]
+        weights = [weight for _, weight in QUERY_MIX]
+        while time.monotonic() < self.deadline:
+            name = self.random.choices(names, weights)[0]
+            try:
+                if name == "data_cursor":
+                    # Курсор берется из первой страницы, замеряется вторая
+                    _, headers = self._request(connection, self._data_path(), None)
+                    cursor = headers.get("X-Next-Cursor") or headers.get(
+                        "x-next-cursor"
+                    )
+                    self._request(connection, self._data_path(cursor=cursor), name)
+                elif name == "topics":
+                    self._request(connection, "/api/topics", name)
+                elif name == "data_window":
+                    start, end = self.window
+                    since = (
+                        start
+                        + (end - start - timedelta(hours=1)) * self.random.random()
+                    )
+                    self._request(
+                        connection,
+                        self._data_path(
+                            since=since.strftime("%Y-%m-%dT%H:%M:%S"),
+                            until=(since + timedelta(hours=1)).strftime(
+                                "%Y-%m-%dT%H:%M:%S"
+                            ),
+                            order="asc",
+                        ),
+                        name,
+                    )
+                else:
+                    self._request(connection, self._data_path(), name)
+            except (OSError, http.client.HTTPException, RuntimeError):
+                self.errors[name] += 1
+                connection.close()
+                connection = http.client.HTTPConnection(
+                    "127.0.0.1", self.port, timeout=60
+                )
+        connection.close()
+
+    def _data_path(self, **params) -> str:
+        query = {"topic": self.random.choice(self.topics), "limit": 100}
+        query.update({key: value for key, value in params.items() if value})
+        return f"/api/data?{urlencode(query)}"
+
+    def _request(
+        self, connection: http.client.HTTPConnection, path: str, name: Optional[str]
+    ) -> Tuple[int, dict]:
+        started = time.monotonic()
+        connection.request("GET", path)
+        response = connection.getresponse()
+        response.read()
+        elapsed = time.monotonic() - started
+        if response.status != 200:
+            raise RuntimeError(f"{path}: HTTP {response.status}")
+        if name:
+            self.latencies[name].append(elapsed)
+        return response.status, dict(response.getheaders())
+
+
+def bench_api(
+    db_path: str, rows: int, days: int, duration: float, concurrency: int, workers: int
+) -> dict:
+    """Нагрузка на /api/data и /api/topics базы из rows записей"""
+    end = datetime.now(timezone.utc).replace(tzinfo=None)
+    with APIServer(db_path, workers) as server:
+        status, _, body = server.get("/api/topics")
+        if status != 200:
+            raise RuntimeError(f"/api/topics: HTTP {status}")
+        topics = json.loads(body)["topics"]
+        deadline = time.monotonic() + duration
+        clients = [
+            _LoadClient(
+                server.port, topics, (end - timedelta(days=days), end), seed, deadline
+            )
+            for seed in range(concurrency)
+        ]
+        started = time.monotonic()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.monotonic() - started
+
+    metrics: dict = {"rows": rows, "topics": len(topics), "db_bytes": db_size(db_path)}
+    total = 0
+    for name, _ in QUERY_MIX:
+        latencies = [value for client in clients for value in client.latencies[name]]
+        total += len(latencies)
+        metrics[f"{name}_requests"] = len(latencies)
+        metrics[f"{name}_errors"] = sum(client.errors[name] for client in clients)
+        for key, value in latency_summary(latencies).items():
+            metrics[f"{name}_{key}"] = value
+    metrics["requests_per_s"] = round(total / elapsed, 1)
+    metrics["errors"] = sum(sum(client.errors.values()) for client in clients)
+    return metrics
@@ -0,0 +1,191 @@
+import time
+from typing import List, Tuple
+
+from mqtt_logger.batch_writer import BatchWriter
+from mqtt_logger.mqtt_app import MQTTApp
+from mqtt_logger.mqtt_client import MQTTClient
+from shared.database import DatabaseManager, utc_now_ms
+
+from .report import db_size, latency_summary
+from .traffic import TrafficGenerator, paced
+
+# Сколько ждать доставки последних сообщений в сквозном замере, секунды
+DRAIN_TIMEOUT = 60.0
+
+
+def _track_commits(db_manager: DatabaseManager) -> List[Tuple[float, int]]:
+    """Подменяет insert_decoded: список (время коммита, записей в пачке)"""
+    commits: List[Tuple[float, int]] = []
+    insert_decoded = db_manager.insert_decoded
+
+    def timed_insert(decoded, *args, **kwargs):
+        committed = insert_decoded(decoded, *args, **kwargs)
+        if committed:
+            commits.append((time.monotonic(), len(decoded)))
+        return committed
+
+    db_manager.insert_decoded = (
+        timed_insert  # pyright: ignore[reportAttributeAccessIssue]
+    )
+    return commits
+
+
+def _commit_latencies(
+    sent: List[float], commits: List[Tuple[float, int]]
+) -> List[float]:
+    """
+    Задержка от отправки до коммита каждого сообщения
+
+    Сообщения одного отправителя коммитятся по порядку, поэтому i-е
+    отправленное попадает в пачку, на которой общий счет превысил i
+    """
+    latencies = []
+    index = 0
+    for committed_at, count in commits:
+        for sent_at in sent[index : index + count]:
+            latencies.append(committed_at - sent_at)
+        index += count
+    return latencies
+
+
+def bench_insert_batch(
+    db_path: str, generator: TrafficGenerator, messages: int, batch_size: int
+) -> dict:
+    """DatabaseManager.insert_batch напрямую: декодирование и коммит пачек"""
+    db_manager = DatabaseManager(db_path)
+    latencies = []
+    started = time.monotonic()
+    for offset in range(0, messages, batch_size):
+        batch = generator.batch(min(batch_size, messages - offset))
+        batch_started = time.monotonic()
+        if not db_manager.insert_batch(batch):
+            raise RuntimeError("insert_batch failed")
+        latencies.append(time.monotonic() - batch_started)
+    elapsed = time.monotonic() - started
+    db_manager.close()
+    return {
+        "messages": messages,
+        "seconds": round(elapsed, 3),
+        "msgs_per_s": round(messages / elapsed, 1),
+        **{f"batch_{key}": value for key, value in latency_summary(latencies).items()},
+        "db_bytes": db_size(db_path),
+    }
+
+
+def bench_on_message(generator: TrafficGenerator, messages: int, rate: float) -> dict:
+    """
+    MQTTApp.on_mqtt_message без брокера: очередь, декодирование, коммит
+
+    Замеряются время вызова обработчика (то, что занимает сетевой поток
+    paho) и задержка от вызова до коммита
+    """
+    app = MQTTApp()
+    commits = _track_commits(app.db_manager)
+    app.writer.start()
+    sent: List[float] = []
+    call_seconds: List[float] = []
+    started = time.monotonic()
+    for topic, payload in paced(generator.messages(messages), rate):
+        called = time.monotonic()
+        app.on_mqtt_message(topic, payload)
+        sent.append(called)
+        call_seconds.append(time.monotonic() - called)
+    app.writer.stop()
+    elapsed = time.monotonic() - started
+    app.db_manager.close()
+    return {
+        "messages": messages,
+        "seconds": round(elapsed, 3),
+        "msgs_per_s": round(messages / elapsed, 1),
+        **{
+            f"call_{key}": value for key, value in latency_summary(call_seconds).items()
+        },
+        **latency_summary(_commit_latencies(sent, commits)),
+        "db_bytes": db_size(app.db_manager.db_path),
+    }
+
+
+def bench_end_to_end(
+    generator: TrafficGenerator, messages: int, rate: float, qos: int
+) -> dict:
+    """
+    Сквозной прием через брокер в процессе (FakeBroker)
+
+    Отправитель публикует сообщения через paho, MQTTClient принимает их и
+    передает в MQTTApp; задержка - от публикации до коммита в БД
+    """
+    # Тестовый брокер лежит в tests/ корня репозитория (см. run_e2e)
+    from tests.fake_broker import FakeBroker
+
+    broker = FakeBroker()
+    port = broker.start()
+    app = MQTTApp()
+    commits = _track_commits(app.db_manager)
+    app.mqtt_client = MQTTClient(
+        app.on_mqtt_message, [("#", qos)], broker="127.0.0.1", port=port
+    )
+    publisher = MQTTClient(
+        lambda topic, payload, received: None, [("$none", 0)], "127.0.0.1", port
+    )
+    app.writer.start()
+    for client in (app.mqtt_client, publisher):
+        client.connect()
+        client.start()
+    _wait_for(lambda: broker.sessions and all(s.subscriptions for s in broker.sessions))
+
+    sent: List[float] = []
+    started = time.monotonic()
+    for topic, payload in paced(generator.messages(messages), rate):
+        sent.append(time.monotonic())
+        publisher.client.publish(topic, payload, qos=qos)
+    delivered = _wait_for(
+        lambda: sum(count for _, count in commits) >= messages
+        or app.writer.received >= messages
+        and app.writer.queue.empty(),
+        DRAIN_TIMEOUT,
+    )
+    publisher.stop_and_disconnect()
+    app.stop_and_disconnect()
+    broker.stop()
+    elapsed = (commits[-1][0] if commits else time.monotonic()) - started
+    committed = sum(count for _, count in commits)
+    return {
+        "messages": messages,
+        "committed": committed,
+        "complete": bool(delivered) and committed == messages,
+        "seconds": round(elapsed, 3),
+        "msgs_per_s": round(committed / elapsed, 1) if elapsed > 0 else 0.0,
+        **latency_summary(_commit_latencies(sent, commits)),
+        "db_bytes": db_size(app.db_manager.db_path),
+    }
+
+
+def bench_writer(
+    db_path: str, generator: TrafficGenerator, messages: int, decode_workers: int
+) -> dict:
+    """BatchWriter с заданным числом потоков декодирования, без MQTT"""
+    db_manager = DatabaseManager(db_path)
+    writer = BatchWriter(db_manager, spool_path="", decode_workers=decode_workers)
+    batch = generator.batch(messages)
+    writer.start()
+    started = time.monotonic()
+    for topic, payload in batch:
+        writer.submit((topic, payload, utc_now_ms()))
+    writer.stop()
+    elapsed = time.monotonic() - started
+    db_manager.close()
+    return {
+        "messages": messages,
+        "seconds": round(elapsed, 3),
+        "msgs_per_s": round(messages / elapsed, 1),
+        "db_bytes": db_size(db_path),
+    }
+
+
+def _wait_for(condition, timeout: float = 10.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
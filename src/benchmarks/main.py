@@ -0,0 +1,196 @@
+"""
+Бенчмарки приема и API: python -m benchmarks.main <команда> (из каталога src)
+
+    ingest  - insert_batch, MQTTApp.on_mqtt_message и BatchWriter без брокера
+    e2e     - сквозной прием через брокер в процессе (FakeBroker)
+    api     - нагрузка на /api/data и /api/topics баз из --sizes записей
+    all     - все перечисленное
+    compare - сравнение двух файлов результатов (--output разных версий)
+
+Результаты печатаются и дописываются в --output строками JSON; каждая
+строка содержит параметры замера и версию кода (git describe).
+"""
+
+import argparse
+import glob
+import logging
+import os
+import shutil
+import sys
+
+
+def _remove_database(db_path: str) -> None:
+    """Удаляет базу вместе с WAL, журналом приема и файлом вытеснения"""
+    for path in glob.glob(f"{glob.escape(db_path)}*"):
+        if path.endswith(".seeded"):
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+
+def _configure(args: argparse.Namespace) -> None:
+    """
+    Настройки shared.config для прогона - до импорта модулей проекта,
+    которые читают переменные окружения при импорте
+    """
+    os.makedirs(args.workdir, exist_ok=True)
+    os.environ["DB_PATH"] = os.path.join(args.workdir, "ingest.db")
+    os.environ.setdefault("BATCH_TIMEOUT", "1")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+
+def run_ingest(args: argparse.Namespace, results) -> None:
+    from .ingest import bench_insert_batch, bench_on_message, bench_writer
+
+    params = {
+        "messages": args.messages,
+        "topics": args.topics,
+        "radiohead_share": args.radiohead_share,
+        "storage": os.getenv("PAYLOAD_STORAGE", "text"),
+    }
+    db_path = os.path.join(args.workdir, "insert_batch.db")
+    _remove_database(db_path)
+    results.write(
+        "insert_batch",
+        {**params, "batch_size": args.batch_size},
+        bench_insert_batch(db_path, _generator(args), args.messages, args.batch_size),
+    )
+    for workers in sorted({0, args.decode_workers}):
+        _remove_database(db_path)
+        results.write(
+            "batch_writer",
+            {**params, "decode_workers": workers},
+            bench_writer(db_path, _generator(args), args.messages, workers),
+        )
+    _remove_database(os.environ["DB_PATH"])
+    results.write(
+        "on_mqtt_message",
+        {**params, "rate": args.rate},
+        bench_on_message(_generator(args), args.messages, args.rate),
+    )
+
+
+def run_e2e(args: argparse.Namespace, results) -> None:
+    # FakeBroker - тестовый модуль из tests/ корня репозитория, а не из src
+    repo_root = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+    if repo_root not in sys.path:
+        sys.path.append(os.path.abspath(repo_root))
+    from .ingest import bench_end_to_end
+
+    _remove_database(os.environ["DB_PATH"])
+    results.write(
+        "end_to_end",
+        {
+            "messages": args.messages,
+            "topics": args.topics,
+            "radiohead_share": args.radiohead_share,
+            "rate": args.rate,
+            "qos": args.qos,
+            "storage": os.getenv("PAYLOAD_STORAGE", "text"),
+        },
+        bench_end_to_end(_generator(args), args.messages, args.rate, args.qos),
+    )
+
+
+def run_api(args: argparse.Namespace, results) -> None:
+    from .api_load import bench_api, seed_database
+
+    for rows in args.sizes:
+        db_path = os.path.join(args.workdir, f"api_{rows}.db")
+        seeded = seed_database(db_path, rows, _generator(args), args.days)
+        results.write(
+            "api",
+            {
+                "rows": rows,
+                "days": args.days,
+                "topics": args.topics,
+                "concurrency": args.concurrency,
+                "duration": args.duration,
+                "workers": args.workers,
+            },
+            {
+                **seeded,
+                **bench_api(
+                    db_path,
+                    rows,
+                    args.days,
+                    args.duration,
+                    args.concurrency,
+                    args.workers,
+                ),
+            },
+        )
+
+
+def _generator(args: argparse.Namespace):
+    from .traffic import TrafficGenerator
+
+    return TrafficGenerator(args.topics, args.radiohead_share, args.seed)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="mqtt-topics-api benchmarks")
+    parser.add_argument("command", choices=("ingest", "e2e", "api", "all", "compare"))
+    parser.add_argument(
+        "files", nargs="*", help="compare: baseline and candidate result files"
+    )
+    parser.add_argument("--output", default="", help="Append JSON lines to this file")
+    parser.add_argument("--workdir", default="bench-data", help="Benchmark databases")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--topics", type=int, default=100, help="Source topics")
+    parser.add_argument(
+        "--radiohead-share", type=float, default=0.5, help="Share of RadioHead traffic"
+    )
+    parser.add_argument("--messages", type=int, default=100000)
+    parser.add_argument(
+        "--rate", type=float, default=0, help="Messages/s, 0 - unlimited"
+    )
+    parser.add_argument("--batch-size", type=int, default=300)
+    parser.add_argument("--decode-workers", type=int, default=2)
+    parser.add_argument("--qos", type=int, default=0, choices=(0, 1, 2))
+    parser.add_argument(
+        "--sizes",
+        type=lambda value: [int(size) for size in value.split(",")],
+        default=[1_000_000, 10_000_000, 50_000_000],
+        help="Comma-separated database sizes (rows) for the API benchmark",
+    )
+    parser.add_argument("--days", type=int, default=30, help="Seeded time span")
+    parser.add_argument("--concurrency", type=int, default=8, help="API clients")
+    parser.add_argument("--duration", type=float, default=30, help="API load seconds")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument(
+        "--metrics",
+        default="msgs_per_s,requests_per_s,p50_ms,p99_ms,db_bytes",
+        help="compare: metrics to compare",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.command == "compare":
+        from .report import compare_results
+
+        if len(args.files) != 2:
+            print("compare needs baseline and candidate files", file=sys.stderr)
+            return 2
+        return 1 if compare_results(*args.files, args.metrics.split(",")) else 0
+
+    _configure(args)
+    logging.basicConfig(level=os.environ["LOG_LEVEL"])
+    from .report import ResultWriter
+
+    results = ResultWriter(args.output)
+    if args.command in ("ingest", "all"):
+        run_ingest(args, results)
+    if args.command in ("e2e", "all"):
+        run_e2e(args, results)
+    if args.command in ("api", "all"):
+        run_api(args, results)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+# Метрики результата, для которых больше - лучше (для остальных - меньше)
+HIGHER_IS_BETTER = ("msgs_per_s", "requests_per_s")
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Перцентиль (ближайший ранг) по списку значений"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def latency_summary(seconds: List[float]) -> Dict[str, float]:
+    """p50, p99 и максимум задержек в миллисекундах"""
+    return {
+        "p50_ms": round(percentile(seconds, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(seconds, 0.99) * 1000, 3),
+        "max_ms": round(max(seconds, default=0.0) * 1000, 3),
+    }
+
+
+def db_size(db_path: str) -> int:
+    """Размер базы на диске вместе с WAL, байты"""
+    return sum(
+        os.path.getsize(path)
+        for path in (db_path, f"{db_path}-wal")
+        if os.path.exists(path)
+    )
+
+
+def code_version() -> str:
+    """Версия кода: git describe рабочей копии или 'unknown'"""
+    try:
+        return subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class ResultWriter:
+    """
+    Результаты прогона построчно в JSON (JSON Lines)
+
+    Каждая строка - один замер: имя, параметры, метрики, версия кода и
+    время прогона. Файлы разных версий сравнивает compare_results.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.version = code_version()
+
+    def write(self, benchmark: str, params: dict, metrics: dict) -> dict:
+        result = {
+            "benchmark": benchmark,
+            "version": self.version,
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "params": params,
+            **metrics,
+        }
+        line = json.dumps(result, sort_keys=True)
+        print(line, flush=True)
+        if self.path:
+            with open(self.path, "a", encoding="utf-8") as results_file:
+                results_file.write(line + "\n")
+        return result
+
+
+def load_results(path: str) -> Dict[str, dict]:
+    """Последний результат каждого замера: ключ - имя и параметры"""
+    results = {}
+    with open(path, encoding="utf-8") as results_file:
+        for line in results_file:
+            if line.strip():
+                result = json.loads(line)
+                key = f"{result['benchmark']} {json.dumps(result['params'], sort_keys=True)}"
+                results[key] = result
+    return results
+
+
+def compare_results(
+    baseline_path: str, candidate_path: str, metrics: Iterable[str]
+) -> int:
+    """
+    Печатает изменение метрик candidate относительно baseline
+
+    Returns:
+        int: Число ухудшений больше чем на 10%
+    """
+    baseline = load_results(baseline_path)
+    candidate = load_results(candidate_path)
+    regressions = 0
+    for key in sorted(baseline.keys() & candidate.keys()):
+        # Метрика p99_ms сравнивается и в полях вида data_latest_p99_ms
+        fields = [
+            field
+            for field in sorted(baseline[key])
+            if any(
+                field == metric or field.endswith(f"_{metric}") for metric in metrics
+            )
+        ]
+        for field in fields:
+            before = baseline[key].get(field)
+            after = candidate[key].get(field)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            better_higher = any(field.endswith(metric) for metric in HIGHER_IS_BETTER)
+            worse = -change if better_higher else change
+            marker = "REGRESSION" if worse > 0.10 else ""
+            regressions += bool(marker)
+            print(f"{key} {field}: {before} -> {after} ({change:+.1%}) {marker}")
+    missing = baseline.keys() - candidate.keys()
+    for key in sorted(missing):
+        print(f"{key}: missing in {candidate_path}", file=sys.stderr)
+    return regressions
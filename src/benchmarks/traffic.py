@@ -0,0 +1,88 @@
+import json
+import random
+import time
+from typing import Iterator, List, Tuple
+
+from shared.decoders import Record
+
+# Сообщение MQTT, как его получает MQTTApp.on_mqtt_message
+Message = Tuple[str, bytes]
+
+# Датчиков за одним шлюзом RadioHead: декодер дописывает sensor_id к топику,
+# поэтому число топиков в БД - шлюзы * датчики + JSON-топики
+RADIOHEAD_SENSORS = 8
+
+
+class TrafficGenerator:
+    """
+    Синтетический поток MQTT-сообщений
+
+    Два вида топиков, как в эксплуатации: шлюзы RadioHead
+    (radiohead/gw<N>, байты [sensor_id, voltage] в JSON) и обычные JSON-топики
+    датчиков (sensors/<N>/state). Поток детерминирован при одном seed, так
+    что прогоны разных версий получают одинаковые данные.
+    """
+
+    def __init__(self, topics: int = 100, radiohead_share: float = 0.5, seed: int = 1):
+        """
+        Args:
+            topics: Число топиков-источников (шлюзов и JSON-топиков вместе)
+            radiohead_share: Доля сообщений шлюзов RadioHead, 0..1
+            seed: Зерно генератора случайных чисел
+        """
+        self.random = random.Random(seed)
+        self.radiohead_share = radiohead_share
+        gateways = round(topics * radiohead_share)
+        self.gateways = [f"radiohead/gw{n}" for n in range(gateways)]
+        self.sensors = [f"sensors/{n}/state" for n in range(topics - gateways)]
+
+    def message(self) -> Message:
+        """Одно случайное сообщение"""
+        if self.gateways and (
+            not self.sensors or self.random.random() < self.radiohead_share
+        ):
+            sensor_id = self.random.randrange(RADIOHEAD_SENSORS) + 1
+            voltage = self.random.randint(280, 420)
+            payload = {
+                "payload": [
+                    sensor_id & 0xFF,
+                    sensor_id >> 8,
+                    voltage & 0xFF,
+                    voltage >> 8,
+                ],
+                "rssi": self.random.randint(-110, -40),
+            }
+            return self.random.choice(self.gateways), json.dumps(payload).encode()
+        payload = {
+            "payload": {
+                "temperature": round(self.random.uniform(15, 30), 2),
+                "humidity": round(self.random.uniform(20, 80), 1),
+                "voltage": round(self.random.uniform(2.8, 4.2), 2),
+            }
+        }
+        return self.random.choice(self.sensors), json.dumps(payload).encode()
+
+    def messages(self, count: int) -> Iterator[Message]:
+        for _ in range(count):
+            yield self.message()
+
+    def batch(self, count: int) -> List[Record]:
+        return [self.message() for _ in range(count)]
+
+
+def paced(messages: Iterator[Message], rate: float) -> Iterator[Message]:
+    """
+    Выдает сообщения не быстрее rate в секунду (0 - без ограничения)
+
+    Темп держится относительно начала, а не паузами между сообщениями,
+    поэтому неточность sleep не накапливается
+    """
+    if rate <= 0:
+        yield from messages
+        return
+    started = time.monotonic()
+    for index, message in enumerate(messages):
+        delay = started + index / rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        yield message
@@ -0,0 +1,582 @@
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+from typing import Deque, List, Optional, Tuple
+
+from shared.config import (
+    BATCH_SIZE,
+    BATCH_TIMEOUT,
+    DECODE_WORKERS,
+    INGEST_OVERFLOW_POLICY,
+    INGEST_QUEUE_SIZE,
+    INGEST_SPILL_PATH,
+    INGEST_SPOOL_PATH,
+)
+from shared.database import DatabaseManager, utc_now_ms
+from shared.decoders import DecodedRecord, ReceivedRecord, payload_text
+from shared.decoders import registry as decoder_registry
+from shared.metrics import REGISTRY, count_buckets
+
+from .spool import IngestSpool
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "spill")
+
+# Пауза между повторами неудачного коммита, секунды (растет до максимума)
+RETRY_DELAY = 1.0
+RETRY_DELAY_MAX = 30.0
+# Сколько раз повторить коммит при остановке, прежде чем сдаться
+SHUTDOWN_RETRIES = 3
+# Как часто stop() проверяет, жив ли поток записи, пока ждет места в очереди
+STOP_POLL_INTERVAL = 1.0
+
+# Маркер остановки в очереди: все, что было до него, будет записано
+_STOP = object()
+
+# Декодированная пачка: записи и время приема каждой из них
+DecodedBatch = Tuple[List[DecodedRecord], List[int]]
+# Принятая пачка и номер ее последней записи в журнале
+ReceivedBatch = Tuple[List[ReceivedRecord], Optional[int]]
+
+BATCH_RECORDS = REGISTRY.histogram(
+    "mqtt_writer_batch_records",
+    "Records per committed batch",
+    buckets=count_buckets(max(BATCH_SIZE, 1)),
+)
+COMMIT_SECONDS = REGISTRY.histogram(
+    "mqtt_writer_commit_seconds", "Batch commit latency, seconds"
+)
+DECODE_SECONDS = REGISTRY.histogram(
+    "mqtt_writer_decode_seconds", "Batch decode time, seconds"
+)
+COMMITTED = REGISTRY.counter(
+    "mqtt_writer_committed_records_total", "Records committed to the database"
+)
+FAILED_COMMITS = REGISTRY.counter(
+    "mqtt_writer_failed_commits_total", "Batch commits that failed and were retried"
+)
+WRITER_ERRORS = REGISTRY.counter(
+    "mqtt_writer_errors_total",
+    "Unexpected writer errors; batches in progress were retried",
+)
+ABANDONED = REGISTRY.counter(
+    "mqtt_writer_abandoned_records_total",
+    "Records left uncommitted at shutdown (replayed from the spool if enabled)",
+)
+OVERFLOWED = REGISTRY.counter(
+    "mqtt_writer_overflow_records_total",
+    "Records hit by the queue overflow policy",
+    ["action"],
+)
+QUEUE_DEPTH = REGISTRY.gauge(
+    "mqtt_writer_queue_depth", "Records waiting in the writer queue"
+)
+DECODING_BATCHES = REGISTRY.gauge(
+    "mqtt_writer_decoding_batches", "Batches being decoded before commit"
+)
+SPOOL_PENDING = REGISTRY.gauge(
+    "mqtt_writer_spool_pending_records", "Spooled records not yet committed"
+)
+
+
+class BatchWriter:
+    """
+    Единственный поток записи в БД, получающий записи из ограниченной очереди
+
+    Сетевой поток paho только кладет запись в очередь, а коммит пачки
+    выполняется в отдельном потоке, поэтому медленный диск не задерживает
+    keepalive MQTT. Пачка записывается при наборе BATCH_SIZE записей или
+    через BATCH_TIMEOUT секунд после первой записи пачки. При переполнении
+    очереди действует политика INGEST_OVERFLOW_POLICY:
+
+    - block: отправитель ждет, пока в очереди освободится место
+    - drop_oldest: самая старая запись в очереди выбрасывается
+    - spill: запись дописывается в файл INGEST_SPILL_PATH и попадает в базу,
+      когда поток записи разгрузится
+
+    Если задан INGEST_SPOOL_PATH, каждая принятая запись сначала попадает в
+    журнал IngestSpool и после аварийного завершения воспроизводится при
+    следующем старте (см. IngestSpool).
+
+    Собранная пачка декодируется (shared.decoders) в пуле из DECODE_WORKERS
+    потоков, пока поток записи коммитит предыдущие: пачки в работе стоят в
+    очереди pending и коммитятся строго по порядку, поэтому порядок записей
+    и номера журнала не меняются. Коммит SQLite отпускает GIL, так что
+    декодирование и запись идут параллельно.
+    """
+
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        queue_size: int = INGEST_QUEUE_SIZE,
+        batch_size: int = BATCH_SIZE,
+        batch_timeout: float = BATCH_TIMEOUT,
+        overflow_policy: str = INGEST_OVERFLOW_POLICY,
+        spill_path: str = INGEST_SPILL_PATH,
+        spool_path: str = INGEST_SPOOL_PATH,
+        decode_workers: int = DECODE_WORKERS,
+    ):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"Unknown overflow policy {overflow_policy!r}, "
+                f"expected one of {OVERFLOW_POLICIES}"
+            )
+        self.db_manager = db_manager
+        self.queue: "Queue[object]" = Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.overflow_policy = overflow_policy
+        self.spill_path = spill_path
+        self.spill_lock = Lock()
+        self.spill_pending = os.path.exists(spill_path)
+        self.spool = IngestSpool(spool_path) if spool_path else None
+        self.decode_workers = decode_workers
+        self.decoder: Optional[ThreadPoolExecutor] = None
+        # Пачки в декодировании по порядку: (результат, номер в журнале)
+        self.pending: Deque[Tuple["Future[DecodedBatch]", Optional[int]]] = deque()
+        # Принятые пачки из очереди, еще не закоммиченные, по порядку: после
+        # неожиданной ошибки они записываются заново
+        self.in_flight: Deque[ReceivedBatch] = deque()
+        self.thread: Optional[Thread] = None
+        self.stopping = False
+        # Коммит при остановке не удался: следующие пачки не коммитятся,
+        # чтобы номер журнала в БД не ушел дальше незаписанных записей
+        self.gave_up = False
+
+        # Счетчики (каждый изменяется только одним потоком)
+        self.received = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.committed = 0
+        self.batches = 0
+        self.failed_commits = 0
+        self.errors = 0
+        self.abandoned = 0
+        self.last_commit_seconds = 0.0
+        self.max_commit_seconds = 0.0
+        self.total_commit_seconds = 0.0
+
+    def start(self) -> None:
+        """Запускает поток записи"""
+        if self.thread is not None:
+            return
+        if self.decode_workers > 0:
+            self.decoder = ThreadPoolExecutor(
+                self.decode_workers, thread_name_prefix="decoder"
+            )
+        if self.spool is not None:
+            # До подключения к брокеру: воспроизведенные записи идут первыми
+            self._replay_spool()
+            self.spool.open()
+        QUEUE_DEPTH.set_function(self.queue.qsize)
+        DECODING_BATCHES.set_function(lambda: len(self.pending))
+        if self.spool is not None:
+            spool = self.spool
+            SPOOL_PENDING.set_function(lambda: spool.last_seq - spool.committed_seq)
+        self.thread = Thread(target=self._run, name="db-writer", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Записывает все принятые записи и останавливает поток записи"""
+        if self.thread is None or self.stopping:
+            return
+        self.stopping = True
+        # put ждет места, пока поток записи разгружает очередь. Если поток
+        # записи мертв, место не освободится: ждем, только пока он жив
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.thread.is_alive():
+            try:
+                self.queue.put(_STOP, timeout=STOP_POLL_INTERVAL)
+                break
+            except Full:
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+        if deadline is not None:
+            timeout = max(deadline - time.monotonic(), 0)
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            logger.error(
+                f"Writer did not stop in {timeout}s, "
+                f"{self.queue.qsize()} records left in the queue"
+            )
+        else:
+            logger.info(f"Writer stopped, {self.committed} records committed")
+        if self.spool is not None:
+            self.spool.close()
+        if self.decoder is not None:
+            self.decoder.shutdown(wait=False)
+
+    def submit(self, record: ReceivedRecord) -> bool:
+        """
+        Принимает запись для записи в БД (вызывается из сетевого потока)
+
+        payload может быть байтами MQTT как есть: текстом он становится
+        при декодировании пачки. Время приема записи становится ее меткой
+        времени в БД
+
+        Returns:
+            bool: False, если запись выброшена политикой drop_oldest
+        """
+        self.received += 1
+        seq = self.spool.append(record) if self.spool is not None else None
+        item = (seq, record)
+        if self.overflow_policy == "block":
+            self.queue.put(item)
+            return True
+
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except Full:
+            pass
+
+        if self.overflow_policy == "spill":
+            self._spill(record)
+            return True
+
+        # drop_oldest: освобождаем место за счет самой старой записи
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return True
+            except Full:
+                try:
+                    # Из журнала выброшенную запись освободит коммит следующих за ней
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                    OVERFLOWED.inc("dropped")
+                except Empty:
+                    pass
+
+    def get_stats(self) -> dict:
+        """Счетчики очереди и задержки коммитов"""
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.queue.maxsize,
+            "decoding_batches": len(self.pending),
+            "received": self.received,
+            "dropped": self.dropped,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "committed": self.committed,
+            "batches": self.batches,
+            "failed_commits": self.failed_commits,
+            "errors": self.errors,
+            "abandoned": self.abandoned,
+            "last_commit_seconds": round(self.last_commit_seconds, 4),
+            "max_commit_seconds": round(self.max_commit_seconds, 4),
+            "avg_commit_seconds": round(
+                self.total_commit_seconds / self.batches if self.batches else 0.0, 4
+            ),
+        }
+
+    def _run(self) -> None:
+        """
+        Цикл потока записи: собирает пачки из очереди и коммитит их
+
+        Поток записи единственный: если он завершится, очередь заполнится и
+        при политике block остановит сетевой поток. Поэтому неожиданная
+        ошибка не завершает цикл: незакоммиченные пачки (in_flight и
+        собираемая) записываются заново по порядку, до новых записей
+        очереди (см. _recover)
+        """
+        try:
+            # Файл переполнения мог остаться от прошлого запуска
+            self._drain_spill()
+        except Exception:
+            logger.exception("Failed to drain the spill file")
+        batch: List[ReceivedRecord] = []
+        batch_seq: Optional[int] = None
+        deadline = 0.0
+        while True:
+            item = None
+            try:
+                if not batch and self.pending and self.queue.empty():
+                    # Новых записей нет - не держим декодированные пачки
+                    self._commit_pending()
+                timeout = max(deadline - time.monotonic(), 0) if batch else None
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except Empty:
+                    # Истек BATCH_TIMEOUT для неполной пачки
+                    self._dispatch(batch, batch_seq)
+                    batch = []
+                    self._drain_spill_if_idle()
+                    continue
+
+                if item is _STOP:
+                    self._dispatch(batch, batch_seq)
+                    self._commit_pending()
+                    self._drain_spill()
+                    return
+
+                seq, record = item  # pyright: ignore[reportGeneralTypeIssues]
+                if not batch:
+                    deadline = time.monotonic() + self.batch_timeout
+                batch.append(record)
+                batch_seq = seq
+                if len(batch) >= self.batch_size:
+                    self._dispatch(batch, batch_seq)
+                    batch = []
+                    self._drain_spill_if_idle()
+            except Exception:
+                self.errors += 1
+                WRITER_ERRORS.inc()
+                logger.exception("Writer error, retrying batches in progress")
+                retry = list(self.in_flight)
+                # Собираемая пачка, если ошибка случилась до ее отправки
+                if batch and not (retry and retry[-1][0] is batch):
+                    retry.append((batch, batch_seq))
+                self.in_flight.clear()
+                self.pending.clear()
+                batch = []
+                if not self._recover(retry):
+                    # Остановка: записи очереди за незаписанными тоже не
+                    # коммитятся (остаются в журнале)
+                    self._abandon(self._discard_queue())
+                    return
+                if item is _STOP:
+                    return
+
+    def _recover(self, batches: List[ReceivedBatch]) -> bool:
+        """
+        Записывает по порядку пачки, прерванные неожиданной ошибкой
+
+        Повторяет попытки с растущей паузой, пока пачки не будут записаны:
+        новые записи тем временем ждут в очереди, как при неудачном коммите.
+        При остановке сдается после SHUTDOWN_RETRIES попыток - записи
+        остаются в журнале, а номер журнала в БД не проходит дальше них
+
+        Returns:
+            bool: False, если пачки не записаны (только при остановке)
+        """
+        attempt = 0
+        while batches:
+            attempt += 1
+            time.sleep(min(RETRY_DELAY * 2 ** (attempt - 1), RETRY_DELAY_MAX))
+            try:
+                while batches:
+                    records, seq = batches[0]
+                    committed = self._flush(records, seq)
+                    batches.pop(0)
+                    if not committed:
+                        # Коммит при остановке не удался: остальные пачки
+                        # тоже остаются незаписанными
+                        self._abandon(sum(len(rest) for rest, _ in batches))
+                        return False
+                    attempt = 0
+            except Exception:
+                self.errors += 1
+                WRITER_ERRORS.inc()
+                logger.exception("Writer error while retrying batches in progress")
+                if self.stopping and attempt >= SHUTDOWN_RETRIES:
+                    self.gave_up = True
+                    self._abandon(sum(len(records) for records, _ in batches))
+                    return False
+        return True
+
+    def _discard_queue(self) -> int:
+        """Очищает очередь и возвращает число выброшенных записей"""
+        discarded = 0
+        while True:
+            try:
+                if self.queue.get_nowait() is not _STOP:
+                    discarded += 1
+            except Empty:
+                return discarded
+
+    def _abandon(self, count: int) -> None:
+        """Учитывает записи, так и не закоммиченные до остановки"""
+        if not count:
+            return
+        self.abandoned += count
+        ABANDONED.inc(amount=count)
+        logger.error(
+            f"Giving up on {count} records during shutdown"
+            + (", they stay in the spool" if self.spool is not None else "")
+        )
+
+    def _dispatch(self, batch: List[ReceivedRecord], seq: Optional[int] = None) -> None:
+        """Отдает пачку в декодирование и коммитит уже готовые пачки"""
+        if not batch:
+            return
+        self.in_flight.append((batch, seq))
+        if self.decoder is None:
+            self._flush(batch, seq)
+            self.in_flight.popleft()
+            return
+        self.pending.append((self.decoder.submit(self._decode, batch), seq))
+        # В работе не больше пачек, чем потоков декодирования
+        while self.pending and (
+            len(self.pending) > self.decode_workers or self.pending[0][0].done()
+        ):
+            future, pending_seq = self.pending[0]
+            self._commit(*future.result(), pending_seq)
+            self.pending.popleft()
+            self.in_flight.popleft()
+
+    def _commit_pending(self) -> None:
+        """Дожидается декодирования и коммитит все пачки в работе по порядку"""
+        while self.pending:
+            future, seq = self.pending[0]
+            self._commit(*future.result(), seq)
+            self.pending.popleft()
+            self.in_flight.popleft()
+
+    @staticmethod
+    def _decode(batch: List[ReceivedRecord]) -> DecodedBatch:
+        """Декодирует пачку (выполняется в пуле потоков декодирования)"""
+        started = time.monotonic()
+        decoded = decoder_registry.decode_batch(
+            [(topic, payload) for topic, payload, _ in batch]
+        )
+        DECODE_SECONDS.observe(time.monotonic() - started)
+        return decoded, [received for _, _, received in batch]
+
+    def _flush(self, batch: List[ReceivedRecord], seq: Optional[int] = None) -> bool:
+        """
+        Декодирует и коммитит пачку в потоке записи
+
+        Пачки, еще стоящие в pending, коммитятся раньше - порядок сохраняется
+
+        Args:
+            batch: Записи пачки
+            seq: Номер последней записи пачки в журнале (None - без журнала)
+        """
+        self._commit_pending()
+        if not batch:
+            return True
+        return self._commit(*self._decode(batch), seq)
+
+    def _commit(
+        self,
+        batch: List[DecodedRecord],
+        received: List[int],
+        seq: Optional[int] = None,
+    ) -> bool:
+        """
+        Коммитит декодированную пачку, повторяя попытки при ошибках БД
+
+        Args:
+            batch: Записи пачки
+            received: Время приема каждой записи, мс Unix
+            seq: Номер последней записи пачки в журнале (None - без журнала)
+        """
+        if self.gave_up:
+            self._abandon(len(batch))
+            return False
+        attempt = 0
+        while True:
+            started = time.monotonic()
+            if self.db_manager.insert_decoded(batch, seq, received):
+                elapsed = time.monotonic() - started
+                self.batches += 1
+                self.committed += len(batch)
+                self.last_commit_seconds = elapsed
+                self.max_commit_seconds = max(self.max_commit_seconds, elapsed)
+                self.total_commit_seconds += elapsed
+                COMMIT_SECONDS.observe(elapsed)
+                BATCH_RECORDS.observe(len(batch))
+                COMMITTED.inc(amount=len(batch))
+                logger.info(f"Data of len {len(batch)} inserted in {elapsed:.3f}s")
+                if seq is not None and self.spool is not None:
+                    self.spool.mark_committed(seq)
+                return True
+
+            # Пока пачка не записана, очередь заполняется и включается
+            # политика переполнения - память не растет без ограничений
+            self.failed_commits += 1
+            FAILED_COMMITS.inc()
+            attempt += 1
+            if self.stopping and attempt >= SHUTDOWN_RETRIES:
+                # Записи остаются в журнале и будут воспроизведены при старте
+                self.gave_up = True
+                self._abandon(len(batch))
+                return False
+            time.sleep(min(RETRY_DELAY * 2 ** (attempt - 1), RETRY_DELAY_MAX))
+
+    def _replay_spool(self) -> None:
+        """Записывает в БД записи журнала, не закоммиченные до прошлой остановки"""
+        batch: List[ReceivedRecord] = []
+        seq = 0
+        for (
+            seq,
+            record,
+        ) in self.spool.replay(  # pyright: ignore[reportOptionalMemberAccess]
+            self.db_manager.get_spool_seq()
+        ):
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                self._flush(batch, seq)
+                self.replayed += len(batch)
+                batch = []
+        self._flush(batch, seq)
+        self.replayed += len(batch)
+        if self.replayed:
+            logger.info(f"Replayed {self.replayed} spooled records")
+
+    def _spill(self, record: ReceivedRecord) -> None:
+        """Дописывает запись в файл переполнения"""
+        with self.spill_lock:
+            topic, payload, received = record
+            with open(self.spill_path, "a", encoding="utf-8") as spill_file:
+                spill_file.write(
+                    json.dumps([topic, payload_text(payload), received]) + "\n"
+                )
+                # Запись в файле переполнения - единственная копия, если журнал
+                # выключен: после аварии строка должна быть на диске целиком
+                spill_file.flush()
+                os.fsync(spill_file.fileno())
+            self.spilled += 1
+            OVERFLOWED.inc("spilled")
+            self.spill_pending = True
+
+    def _drain_spill_if_idle(self) -> None:
+        """Разгружает файл переполнения, когда очередь опустела"""
+        if self.spill_pending and self.queue.empty():
+            self._drain_spill()
+
+    def _drain_spill(self) -> None:
+        """Переносит записи из файла переполнения в базу"""
+        draining_path = f"{self.spill_path}.draining"
+        while True:
+            with self.spill_lock:
+                # Новые записи переполнения пойдут в свежий файл. Файл .draining
+                # остается от прерванной разгрузки и обрабатывается первым
+                if not os.path.exists(draining_path):
+                    if not os.path.exists(self.spill_path):
+                        self.spill_pending = False
+                        return
+                    os.replace(self.spill_path, draining_path)
+
+            drained = 0
+            batch: List[ReceivedRecord] = []
+            with open(draining_path, encoding="utf-8") as spill_file:
+                for line in spill_file:
+                    try:
+                        # Строки прежнего формата [topic, payload] - без времени приема
+                        topic, payload, *received = json.loads(line)
+                    except ValueError:
+                        # Недописанная последняя строка после аварийного завершения
+                        logger.warning(f"Skipping a torn record in {draining_path}")
+                        continue
+                    batch.append(
+                        (topic, payload, received[0] if received else utc_now_ms())
+                    )
+                    if len(batch) >= self.batch_size:
+                        if not self._flush(batch):
+                            return
+                        drained += len(batch)
+                        batch = []
+            if not self._flush(batch):
+                return
+            drained += len(batch)
+            os.remove(draining_path)
+            logger.info(f"Drained {drained} spilled records")
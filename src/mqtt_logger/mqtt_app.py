@@ -1,9 +1,17 @@
 import logging
 import time
+from typing import Optional
 
-from shared.config import LOG_LEVEL
-from shared.database import DatabaseManager
+from shared.config import (
+    LOG_LEVEL,
+    MESSAGE_LOG_EVERY,
+    METRICS_PORT,
+    WRITER_STATS_INTERVAL,
+)
+from shared.database import DatabaseManager, utc_now_ms
+from shared.metrics import REGISTRY, start_metrics_server
 
+from .batch_writer import BatchWriter
 from .mqtt_client import MQTTClient
 
 # Настройка логирования
@@ -13,20 +21,41 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+MESSAGES_RECEIVED = REGISTRY.counter(
+    "mqtt_messages_received_total", "Messages received from the broker", ["topic"]
+)
+
 
 class MQTTApp:
     def __init__(self):
         self.db_manager = DatabaseManager()
+        self.writer = BatchWriter(self.db_manager)
         self.mqtt_client = MQTTClient(self.on_mqtt_message)
         self.running = False
+        self.stopped = False
+        self.metrics_server = None
+        self.received = 0
+
+    def on_mqtt_message(
+        self, topic: str, payload: bytes, received: Optional[int] = None
+    ):
+        """
+        Обработчик входящих MQTT сообщений (выполняется в сетевом потоке)
 
-    def on_mqtt_message(self, topic: str, payload: str):
-        """Обработчик входящих MQTT сообщений"""
+        received - время приема, мс Unix (UTC); по умолчанию - момент вызова
+        """
         try:
-            # Сохраняем данные в базу
-            success = self.db_manager.insert_sensor_data(topic, payload)
-            if success:
-                logger.info(f"Saved message from {topic}")
+            MESSAGES_RECEIVED.inc(topic)
+            self.received += 1
+            # Лог на каждое сообщение сам по себе дорог: пишем каждое N-е
+            if MESSAGE_LOG_EVERY and self.received % MESSAGE_LOG_EVERY == 0:
+                logger.info(f"Received {self.received} messages, last from {topic}")
+            # Передаем байты сообщения потоку записи как есть: декодирование
+            # выполняется пачками в пуле потоков декодирования BatchWriter
+            if received is None:
+                received = utc_now_ms()
+            if self.writer.submit((topic, payload, received)):
+                logger.debug(f"Queued message from {topic}")
 
         except Exception as e:
             logger.error(f"Error processing MQTT message: {e}")
@@ -35,6 +64,9 @@ class MQTTApp:
         """Запускает приложение"""
         try:
             self.running = True
+            if METRICS_PORT:
+                self.metrics_server = start_metrics_server(METRICS_PORT)
+            self.writer.start()
 
             # Подключаемся к MQTT брокеру
             self.mqtt_client.connect()
@@ -43,8 +75,12 @@ class MQTTApp:
             logger.info("Application started. Press Ctrl+C to stop.")
 
             # Главный цикл
+            last_stats = time.monotonic()
             while self.running:
                 time.sleep(1)
+                if time.monotonic() - last_stats >= WRITER_STATS_INTERVAL:
+                    last_stats = time.monotonic()
+                    logger.info(f"Writer stats: {self.writer.get_stats()}")
 
         except KeyboardInterrupt:
             logger.info("Shutdown signal received")
@@ -56,5 +92,13 @@ class MQTTApp:
     def stop_and_disconnect(self):
         """Останавливает приложение"""
         self.running = False
+        if self.stopped:
+            return
+        self.stopped = True
+        # Сначала перестаем принимать сообщения, затем дописываем очередь в базу
         self.mqtt_client.stop_and_disconnect()
+        self.writer.stop()
+        self.db_manager.close()
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
         logger.info("Application stopped")
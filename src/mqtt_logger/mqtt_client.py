@@ -1,16 +1,100 @@
 import logging
-from typing import Any, Callable
+import time
+from typing import Any, Callable, List, Optional, Tuple
 
 import paho.mqtt.client as mqtt
 
-from shared.config import MQTT_BROKER, MQTT_PASSWORD, MQTT_PORT, MQTT_TOPIC, MQTT_USER
+from shared.config import (
+    MQTT_BROKER,
+    MQTT_CLIENT_ID,
+    MQTT_PASSWORD,
+    MQTT_PORT,
+    MQTT_PROTOCOL,
+    MQTT_QOS,
+    MQTT_SHARED_GROUP,
+    MQTT_SUBSCRIPTIONS,
+    MQTT_USER,
+)
 
 logger = logging.getLogger(__name__)
 
+# Подписка: (фильтр топика, QoS)
+Subscription = Tuple[str, int]
+
+PROTOCOLS = {
+    "3.1": mqtt.MQTTv31,
+    "3.1.1": mqtt.MQTTv311,
+    "5": mqtt.MQTTv5,
+}
+
+
+def parse_subscriptions(
+    spec: str, default_qos: int = MQTT_QOS, shared_group: str = ""
+) -> List[Subscription]:
+    """
+    Разбирает список подписок "фильтр[:qos],..." (см. MQTT_SUBSCRIPTIONS)
+
+    С shared_group фильтры превращаются в общие подписки
+    $share/<группа>/<фильтр>: брокер отдает каждое сообщение только одной
+    реплике группы
+    """
+    subscriptions = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        topic, qos = item, default_qos
+        head, _, tail = item.rpartition(":")
+        if head and tail in ("0", "1", "2"):
+            topic, qos = head, int(tail)
+        if qos not in (0, 1, 2):
+            raise ValueError(f"Invalid QoS {qos} for subscription {topic!r}")
+        if shared_group:
+            topic = f"$share/{shared_group}/{topic}"
+        subscriptions.append((topic, qos))
+    if not subscriptions:
+        raise ValueError("No MQTT subscriptions configured")
+    return subscriptions
+
 
 class MQTTClient:
-    def __init__(self, on_message_callback: Callable[[str, str], None]):
-        self.client = mqtt.Client()
+    def __init__(
+        self,
+        on_message_callback: Callable[[str, bytes, int], None],
+        subscriptions: Optional[List[Subscription]] = None,
+        broker: str = MQTT_BROKER,
+        port: int = MQTT_PORT,
+        protocol: str = MQTT_PROTOCOL,
+        client_id: str = MQTT_CLIENT_ID,
+    ):
+        """
+        Args:
+            on_message_callback: Получает (topic, payload, received) с байтами
+                payload как есть - декодирование выполняется не в сетевом
+                потоке; received - время приема, мс Unix (UTC)
+            subscriptions: Подписки (фильтр, QoS); по умолчанию из
+                MQTT_SUBSCRIPTIONS, MQTT_QOS и MQTT_SHARED_GROUP
+            broker: Адрес брокера
+            port: Порт брокера
+            protocol: Версия MQTT: 3.1, 3.1.1 или 5
+            client_id: Постоянный client id (пусто - случайный и чистая сессия)
+        """
+        if protocol not in PROTOCOLS:
+            raise ValueError(f"Unsupported MQTT protocol {protocol!r}")
+        self.subscriptions = subscriptions or parse_subscriptions(
+            MQTT_SUBSCRIPTIONS, MQTT_QOS, MQTT_SHARED_GROUP
+        )
+        self.broker = broker
+        self.port = port
+        if protocol == "5":
+            # Для v5 вместо clean_session используется clean_start в connect
+            self.client = mqtt.Client(client_id=client_id, protocol=PROTOCOLS[protocol])
+        else:
+            self.client = mqtt.Client(
+                client_id=client_id,
+                clean_session=not client_id,
+                protocol=PROTOCOLS[protocol],
+            )
         self.on_message_callback = on_message_callback
         self.setup_callbacks()
 
@@ -26,27 +110,46 @@ class MQTTClient:
             self._on_disconnect
         )
 
-    def _on_connect(self, client: mqtt.Client, userdata: Any, flags: Any, rc: int):
-        """Callback при подключении к брокеру"""
+    def _on_connect(
+        self,
+        client: mqtt.Client,
+        userdata: Any,
+        flags: Any,
+        rc: Any,
+        properties: Any = None,
+    ):
+        """Callback при подключении к брокеру (properties - только MQTT v5)"""
         if rc == 0:
             logger.info("Connected to MQTT Broker!")
-            # Подписываемся на топик
-            self.client.subscribe(MQTT_TOPIC)
+            # Подписываемся на все топики одним SUBSCRIBE
+            self.client.subscribe(self.subscriptions)
+            logger.info(f"Subscribed to {self.subscriptions}")
         else:
             logger.error(f"Failed to connect, return code {rc}")
 
     def _on_message(self, client: mqtt.Client, userdata: Any, msg: mqtt.MQTTMessage):
-        """Callback при получении сообщения"""
+        """
+        Callback при получении сообщения
+
+        Выполняется в сетевом потоке paho, поэтому только отмечает время
+        приема и передает байты payload дальше: подтверждение QoS 1/2 уходит
+        брокеру после возврата
+        """
+        # Метка времени записи - момент приема, а не коммита пачки
+        received = time.time_ns() // 1_000_000
         try:
-            payload = (
-                msg.payload.decode()  # pyright: ignore[reportAttributeAccessIssue]
+            logger.debug(f"Received message from `{msg.topic}` topic")
+            self.on_message_callback(
+                msg.topic,
+                msg.payload,  # pyright: ignore[reportAttributeAccessIssue]
+                received,
             )
-            logger.info(f"Received `{payload}` from `{msg.topic}` topic")
-            self.on_message_callback(msg.topic, payload)
         except Exception as e:
             logger.error(f"Error processing message: {e}")
 
-    def _on_disconnect(self, client: mqtt.Client, userdata: Any, rc: int):
+    def _on_disconnect(
+        self, client: mqtt.Client, userdata: Any, rc: Any, properties: Any = None
+    ):
         """Callback при отключении от брокера"""
         logger.info("Disconnected from MQTT Broker")
 
@@ -54,10 +157,10 @@ class MQTTClient:
         """Подключается к MQTT брокеру"""
         try:
             logger.info(
-                f"Connecting to MQTT Broker: {MQTT_BROKER}:{MQTT_PORT} and user: {MQTT_USER}"
+                f"Connecting to MQTT Broker: {self.broker}:{self.port} and user: {MQTT_USER}"
             )
             self.client.username_pw_set(MQTT_USER, MQTT_PASSWORD)
-            self.client.connect(MQTT_BROKER, MQTT_PORT, 60)
+            self.client.connect(self.broker, self.port, 60)
         except Exception as e:
             logger.error(f"Connection error: {e}")
             raise
@@ -0,0 +1,167 @@
+import glob
+import json
+import logging
+import os
+import time
+from threading import Event, Lock, Thread
+from typing import Iterator, List, Optional, Tuple
+
+from shared.config import INGEST_SPOOL_FSYNC_INTERVAL, INGEST_SPOOL_SEGMENT_RECORDS
+from shared.database import utc_now_ms
+from shared.decoders import ReceivedRecord, payload_text
+
+logger = logging.getLogger(__name__)
+
+
+class IngestSpool:
+    """
+    Журнал принятых, но еще не закоммиченных сообщений
+
+    Каждое сообщение при приеме получает порядковый номер (seq) и
+    дописывается строкой [seq, topic, payload, received] в файл журнала. Запись
+    сразу уходит в ОС (переживает OOM-kill процесса), а fsync выполняется
+    группой раз в INGEST_SPOOL_FSYNC_INTERVAL секунд (переживает падение узла).
+
+    Поток записи коммитит пачки в порядке seq и сохраняет номер последней
+    записи пачки в той же транзакции (DatabaseManager.insert_batch), после
+    чего вызывает mark_committed. Если закоммичено все принятое, журнал
+    обрезается до нуля; иначе он запечатывается в сегмент {path}.{max_seq},
+    который удаляется, как только его записи будут закоммичены. При старте
+    replay возвращает записи с seq больше закоммиченного в БД - повторной
+    вставки после падения между коммитом и обрезкой не бывает.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        fsync_interval: float = INGEST_SPOOL_FSYNC_INTERVAL,
+        segment_records: int = INGEST_SPOOL_SEGMENT_RECORDS,
+    ):
+        self.path = path
+        self.fsync_interval = fsync_interval
+        self.segment_records = segment_records
+        self.lock = Lock()
+        self.last_seq = 0
+        self.committed_seq = 0
+        self.active_records = 0
+        self.dirty = False
+        self.file = None
+        self.stop_event = Event()
+        self.sync_thread: Optional[Thread] = None
+
+    def _segments(self) -> List[Tuple[int, str]]:
+        """Запечатанные сегменты (max_seq, путь), по возрастанию seq"""
+        segments = []
+        for segment_path in glob.glob(f"{glob.escape(self.path)}.*"):
+            suffix = segment_path.rsplit(".", 1)[1]
+            if suffix.isdigit():
+                segments.append((int(suffix), segment_path))
+        return sorted(segments)
+
+    def _read(self, path: str) -> Iterator[Tuple[int, ReceivedRecord]]:
+        with open(path, encoding="utf-8") as spool_file:
+            for line in spool_file:
+                try:
+                    seq, topic, payload, *received = json.loads(line)
+                except ValueError:
+                    # Недописанная последняя строка после аварийного завершения
+                    logger.warning(f"Skipping a torn record in {path}")
+                    continue
+                # В строках прежнего формата [seq, topic, payload] времени
+                # приема нет: записи получают время воспроизведения
+                yield seq, (topic, payload, received[0] if received else utc_now_ms())
+
+    def replay(self, committed_seq: int) -> Iterator[Tuple[int, ReceivedRecord]]:
+        """
+        Записи журнала, еще не попавшие в БД, в порядке seq
+
+        Вызывается один раз при старте, до open()
+        """
+        self.committed_seq = self.last_seq = committed_seq
+        paths = [path for _, path in self._segments()]
+        if os.path.exists(self.path):
+            paths.append(self.path)
+        for path in paths:
+            for seq, record in self._read(path):
+                self.last_seq = max(self.last_seq, seq)
+                if seq > committed_seq:
+                    yield seq, record
+
+    def open(self) -> None:
+        """Открывает журнал на дозапись и запускает групповой fsync"""
+        # Все, что было в журнале, к этому моменту воспроизведено
+        self.file = open(self.path, "a", encoding="utf-8")
+        self._release(self.last_seq)
+        self.sync_thread = Thread(
+            target=self._sync_loop, name="spool-sync", daemon=True
+        )
+        self.sync_thread.start()
+
+    def append(self, record: ReceivedRecord) -> int:
+        """Дописывает запись в журнал и возвращает ее seq"""
+        topic, payload, received = record
+        with self.lock:
+            self.last_seq += 1
+            self.file.write(  # pyright: ignore[reportOptionalMemberAccess]
+                json.dumps([self.last_seq, topic, payload_text(payload), received])
+                + "\n"
+            )
+            # Сразу в ОС: запись переживает аварийное завершение процесса
+            self.file.flush()  # pyright: ignore[reportOptionalMemberAccess]
+            self.active_records += 1
+            self.dirty = True
+            return self.last_seq
+
+    def mark_committed(self, seq: int) -> None:
+        """Освобождает журнал от записей с номером не больше seq"""
+        with self.lock:
+            if self.file is None:
+                # Воспроизведение при старте: журнал освободит open()
+                self.committed_seq = max(self.committed_seq, seq)
+                return
+            self._release(seq)
+
+    def _release(self, seq: int) -> None:
+        self.committed_seq = max(self.committed_seq, seq)
+        for max_seq, segment_path in self._segments():
+            if max_seq <= self.committed_seq:
+                os.remove(segment_path)
+
+        if self.committed_seq >= self.last_seq:
+            # Все принятое уже в БД: обрезаем журнал
+            self.file.truncate(0)  # pyright: ignore[reportOptionalMemberAccess]
+            self.active_records = 0
+        elif self.active_records >= self.segment_records:
+            # В журнале есть незакоммиченные записи: запечатываем его,
+            # сегмент удалится после коммита последней из них
+            self._fsync()
+            self.file.close()  # pyright: ignore[reportOptionalMemberAccess]
+            os.replace(self.path, f"{self.path}.{self.last_seq}")
+            self.file = open(self.path, "a", encoding="utf-8")
+            self.active_records = 0
+
+    def _fsync(self) -> None:
+        if self.dirty:
+            os.fsync(self.file.fileno())  # pyright: ignore[reportOptionalMemberAccess]
+            self.dirty = False
+
+    def _sync_loop(self) -> None:
+        """Групповой fsync: один системный вызов на все записи за интервал"""
+        while not self.stop_event.wait(self.fsync_interval):
+            started = time.monotonic()
+            with self.lock:
+                self._fsync()
+            elapsed = time.monotonic() - started
+            if elapsed > self.fsync_interval:
+                logger.warning(f"Spool fsync took {elapsed:.3f}s")
+
+    def close(self) -> None:
+        """Останавливает групповой fsync и закрывает журнал"""
+        self.stop_event.set()
+        if self.sync_thread is not None:
+            self.sync_thread.join()
+        with self.lock:
+            if self.file is not None:
+                self._fsync()
+                self.file.close()
+                self.file = None
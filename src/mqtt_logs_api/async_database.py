@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, AsyncIterator, Callable, List, Optional, Tuple, TypeVar
+
+from shared.config import (
+    API_DATA_MAX_TOPICS,
+    API_DB_READERS,
+    DB_PATH,
+    EXPORT_CHUNK_SIZE,
+)
+from shared.database import DatabaseManager, format_timestamp, parse_timestamp
+from shared.metrics import REGISTRY
+
+from .downsample import bucket_width, lttb_points
+from .export import ExportEncoder
+from .latest_cache import LatestValuesCache
+from .response_cache import DataPage, DataQuery, DataResponseCache
+from .topic_cache import TopicCatalogCache, resolve_topics
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+QUERY_SECONDS = REGISTRY.histogram(
+    "api_db_query_seconds", "Database call time in the reader pool", ["query"]
+)
+POOL_WAIT_SECONDS = REGISTRY.histogram(
+    "api_db_pool_wait_seconds", "Time a database call waited for a reader thread"
+)
+
+
+class AsyncDatabaseManager:
+    """
+    Асинхронный доступ к базе данных для эндпоинтов FastAPI
+
+    Синхронные запросы DatabaseManager выполняются в ограниченном пуле
+    потоков, поэтому медленный запрос не блокирует event loop uvicorn.
+    Каждый поток пула держит собственное долгоживущее соединение только для
+    чтения (см. ConnectionManager), а в режиме WAL читатели не ждут писателя.
+    """
+
+    def __init__(self, db_path: str = DB_PATH, max_workers: int = API_DB_READERS):
+        self.db_manager = DatabaseManager(db_path, read_only=True)
+        self.topic_cache = TopicCatalogCache(self.db_manager)
+        self.latest_cache = LatestValuesCache(self.db_manager)
+        self.data_cache = DataResponseCache(self.db_manager)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="db-reader"
+        )
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        """Выполняет синхронную функцию в пуле потоков чтения"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, partial(self._timed, time.monotonic(), func, *args)
+        )
+
+    @staticmethod
+    def _timed(submitted: float, func: Callable[..., T], *args: Any) -> T:
+        """Вызов в потоке пула с замером ожидания потока и времени запроса"""
+        started = time.monotonic()
+        POOL_WAIT_SECONDS.observe(started - submitted)
+        try:
+            return func(*args)
+        finally:
+            QUERY_SECONDS.observe(time.monotonic() - started, func.__qualname__)
+
+    async def get_sensor_data(
+        self, query: DataQuery, not_modified: Callable[[str], bool]
+    ) -> DataPage:
+        """
+        Страница записей топиков (см. DatabaseManager.get_sensor_data) уже в
+        JSON - из кэша ответов DataResponseCache или из базы
+
+        Фильтры MQTT (+, #) в query.topics раскрываются по каталогу топиков
+        в том же вызове пула, что и чтение записей
+
+        Raises:
+            ValueError: Топиков больше API_DATA_MAX_TOPICS
+        """
+        return await self.run(self._get_sensor_data, query, not_modified)
+
+    def _get_sensor_data(
+        self, query: DataQuery, not_modified: Callable[[str], bool]
+    ) -> DataPage:
+        if any("+" in topic or "#" in topic for topic in query.topics):
+            _, names = self.topic_cache.get_names()
+            query = query._replace(topics=tuple(resolve_topics(names, query.topics)))
+        if len(query.topics) > API_DATA_MAX_TOPICS:
+            raise ValueError(
+                f"Too many topics: {len(query.topics)}, "
+                f"the limit is {API_DATA_MAX_TOPICS}"
+            )
+        return self.data_cache.get(query, not_modified)
+
+    async def export(
+        self,
+        topics: List[str],
+        encoder: ExportEncoder,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        chunk_size: int = EXPORT_CHUNK_SIZE,
+    ) -> AsyncIterator[bytes]:
+        """
+        Потоковая выгрузка записей топиков (по топику, от старых к новым)
+
+        Каждая порция - отдельный запрос по ключу (timestamp, id) в пуле
+        потоков: в памяти не больше одной порции, а снимок чтения не держится
+        всю выгрузку и не мешает контрольным точкам WAL
+        """
+        yield encoder.header()
+        for topic in topics:
+            after = None
+            while True:
+                rows, data = await self.run(
+                    self._export_chunk, encoder, topic, chunk_size, since, until, after
+                )
+                if data:
+                    yield data
+                if len(rows) < chunk_size:
+                    break
+                after = (parse_timestamp(rows[-1]["timestamp"]), rows[-1]["id"])
+        yield encoder.finish()
+
+    def _export_chunk(
+        self,
+        encoder: ExportEncoder,
+        topic: str,
+        chunk_size: int,
+        since: Optional[int],
+        until: Optional[int],
+        after: Optional[Tuple[int, int]],
+    ) -> Tuple[list, bytes]:
+        # Чтение и кодирование порции - в потоке пула, а не в event loop
+        rows = self.db_manager.get_sensor_data(
+            topic, chunk_size, since, until, after, True
+        )
+        return rows, encoder.encode(rows) if rows else b""
+
+    async def get_series(
+        self, topic: str, path: str, since: int, until: int, points: int, mode: str
+    ) -> dict:
+        """Ряд значений поля payload, прореженный до points точек"""
+        return await self.run(self._get_series, topic, path, since, until, points, mode)
+
+    def _get_series(
+        self, topic: str, path: str, since: int, until: int, points: int, mode: str
+    ) -> dict:
+        start, end = since // 1000, until // 1000
+        if mode == "lttb":
+            # Точки идут из курсора прямо в LTTB: ряд целиком не материализуется
+            series = self.db_manager.iter_series(topic, path, since, until)
+            return {"points": lttb_points(series, start, end, points)}
+
+        width = bucket_width(start, end, points)
+        rows = self.db_manager.get_series_buckets(topic, path, since, until, width)
+        return {
+            "bucket_seconds": width,
+            "points": [
+                {
+                    "timestamp": format_timestamp((start + bucket * width) * 1000),
+                    "min": low,
+                    "max": high,
+                    "avg": total / count,
+                    "count": count,
+                }
+                for bucket, low, high, total, count in rows
+            ],
+        }
+
+    async def get_rollups(
+        self,
+        topic: str,
+        resolution: str,
+        since: Optional[int],
+        until: Optional[int],
+        limit: int,
+    ) -> List[dict]:
+        """Агрегаты топика по интервалам, уже в виде dict"""
+        return await self.run(self._get_rollups, topic, resolution, since, until, limit)
+
+    def _get_rollups(self, *args: Any) -> List[dict]:
+        return [dict(row) for row in self.db_manager.get_rollups(*args)]
+
+    async def get_topics(
+        self, prefix: Optional[str] = None, details: bool = False
+    ) -> Tuple[str, List[Any]]:
+        """Топики из кэша каталога: (ETag, имена или записи каталога)"""
+        if details:
+            return await self.run(self.topic_cache.get_details, prefix)
+        return await self.run(self.topic_cache.get_names, prefix)
+
+    async def get_latest(self, prefix: Optional[str] = None) -> Tuple[str, bytes]:
+        """Последние сообщения топиков из кэша: (ETag, JSON-тело ответа)"""
+        return await self.run(self.latest_cache.get, prefix)
+
+    async def get_database_stats(self) -> dict:
+        """Статистика базы данных"""
+        return await self.run(self.db_manager.get_database_stats)
+
+    async def get_topic_stats(self, topic: Optional[str] = None) -> List[dict]:
+        """Статистика хранимых записей по топикам"""
+        return await self.run(self._get_topic_stats, topic)
+
+    def _get_topic_stats(self, topic: Optional[str]) -> List[dict]:
+        return [dict(row) for row in self.db_manager.get_topic_stats(topic)]
+
+    async def check_connection(self) -> bool:
+        """Проверка доступности базы данных"""
+        return await self.run(self.db_manager.check_connection)
+
+    def close(self) -> None:
+        """Останавливает пул потоков и закрывает соединения"""
+        self.executor.shutdown(wait=True)
+        self.db_manager.close()
@@ -0,0 +1,71 @@
+from itertools import groupby
+from typing import Iterable, Iterator, List, Tuple
+
+# Точка ряда: (epoch-секунды, timestamp, значение)
+Point = Tuple[int, str, float]
+
+
+def bucket_width(start: int, end: int, buckets: int) -> int:
+    """Ширина интервала (секунды), при которой [start, end) делится не более чем на buckets"""
+    return max(1, -(-(end - start) // buckets))
+
+
+def _area(a: Point, b: Point, c: Tuple[float, float]) -> float:
+    """Удвоенная площадь треугольника a, b, c"""
+    return abs((a[0] - c[0]) * (b[2] - a[2]) - (a[0] - b[0]) * (c[1] - a[2]))
+
+
+def lttb(points: Iterable[Point], start: int, width: int) -> Iterator[Point]:
+    """
+    Largest-Triangle-Three-Buckets за один проход по отсортированным точкам
+
+    Интервалы берутся по времени (start + k * width), а не по числу точек:
+    общее число точек заранее неизвестно, а пустые интервалы просто
+    пропускаются. В памяти только текущий и следующий интервалы. Первая и
+    последняя точки сохраняются всегда, из каждого интервала выбирается
+    точка, образующая наибольший треугольник с предыдущей выбранной и
+    средним следующего интервала. Для n интервалов результат - не более
+    n + 2 точек.
+    """
+    iterator = iter(points)
+    previous = next(iterator, None)
+    if previous is None:
+        return
+    yield previous
+
+    groups = (
+        list(group)
+        for _, group in groupby(iterator, key=lambda point: (point[0] - start) // width)
+    )
+    current = next(groups, None)
+    if current is None:
+        return
+
+    for following in groups:
+        average = (
+            sum(point[0] for point in following) / len(following),
+            sum(point[2] for point in following) / len(following),
+        )
+        previous = max(current, key=lambda point: _area(previous, point, average))
+        yield previous
+        current = following
+
+    # Последний интервал: его последняя точка - конец ряда
+    last = current[-1]
+    if len(current) > 1:
+        anchor = (float(last[0]), float(last[2]))
+        yield max(current[:-1], key=lambda point: _area(previous, point, anchor))
+    yield last
+
+
+def lttb_points(
+    points: Iterable[Point], start: int, end: int, limit: int
+) -> List[dict]:
+    """Не более limit точек ряда на [start, end) методом LTTB"""
+    if limit < 3:
+        raise ValueError("LTTB needs at least 3 points")
+    width = bucket_width(start, end, limit - 2)
+    return [
+        {"timestamp": timestamp, "value": value}
+        for _, timestamp, value in lttb(points, start, width)
+    ]
@@ -0,0 +1,87 @@
+import csv
+import io
+import json
+import re
+import zlib
+from typing import Iterable, Optional
+from urllib.parse import quote
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+EXPORT_COLUMNS = ("id", "topic", "payload", "timestamp")
+
+# Символы, недопустимые в filename="..." без экранирования
+UNSAFE_FILENAME_CHARS = re.compile(r"[^A-Za-z0-9._-]")
+
+
+class ExportEncoder:
+    """
+    Кодирует порции строк выгрузки в байты NDJSON или CSV
+
+    Состояние между порциями - только заголовок CSV и поток gzip, поэтому
+    память не зависит от объема выгрузки. Вызовы encode/finish выполняются
+    по очереди (из пула потоков), одновременно - не более одного.
+    """
+
+    def __init__(self, export_format: str, compress: bool = False):
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format {export_format!r}")
+        self.export_format = export_format
+        # wbits=31: поток в формате gzip, а не голый zlib
+        self.compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def header(self) -> bytes:
+        """Начало выгрузки: заголовок CSV (отдается сразу, до чтения из БД)"""
+        if self.export_format != "csv":
+            return self._compress(b"")
+        return self._encode_csv([EXPORT_COLUMNS])
+
+    def encode(self, rows: Iterable) -> bytes:
+        """Порция строк (id, topic, payload, timestamp)"""
+        if self.export_format == "csv":
+            return self._encode_csv(tuple(row) for row in rows)
+        lines = "".join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n"
+            for row in rows
+        )
+        return self._compress(lines.encode())
+
+    def finish(self) -> bytes:
+        """Хвост потока gzip"""
+        if self.compressor is None:
+            return b""
+        return self.compressor.flush()
+
+    def _encode_csv(self, rows: Iterable) -> bytes:
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        return self._compress(buffer.getvalue().encode())
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compressor is None:
+            return data
+        # Z_SYNC_FLUSH: клиент может распаковывать порцию сразу по получении
+        return self.compressor.compress(data) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def export_filename(export_format: str, compress: bool, name: Optional[str]) -> str:
+    """Имя файла выгрузки по топику или префиксу (может содержать любые символы)"""
+    base = (name or "export").strip("/").replace("/", "_") or "export"
+    return f"{base}.{export_format}" + (".gz" if compress else "")
+
+
+def content_disposition(filename: str) -> str:
+    """
+    Значение Content-Disposition для имени файла из запроса
+
+    filename - только [A-Za-z0-9._-], чтобы кавычки, ";" и не-ASCII символы
+    не ломали заголовок; исходное имя передается в filename* (RFC 5987)
+    """
+    fallback = UNSAFE_FILENAME_CHARS.sub("_", filename).lstrip(".") or "export"
+    return (
+        f'attachment; filename="{fallback}"; '
+        f"filename*=UTF-8''{quote(filename, safe='')}"
+    )
@@ -0,0 +1,33 @@
+import json
+import re
+
+from shared.database import FIELD_PATH_PATTERN, FieldFilter
+
+# Фильтр запроса: "$.путь оператор значение", например $.payload.voltage<3.3
+FILTER_PATTERN = re.compile(r"^(\$[^<>=!]+?)\s*(!=|<=|>=|=|<|>)\s*([^<>=!].*|)$")
+
+
+def parse_field_filter(text: str) -> FieldFilter:
+    """
+    Условие на поле payload из параметра filter запроса /api/data
+
+    Значение разбирается как JSON (3.3, "abc", true); не-JSON значение
+    считается строкой. true/false сравниваются как 1/0 - так их возвращает
+    json_extract
+
+    Raises:
+        ValueError: Некорректный путь, оператор или значение
+    """
+    match = FILTER_PATTERN.match(text.strip())
+    if match is None or not FIELD_PATH_PATTERN.match(match.group(1)):
+        raise ValueError(f"Invalid filter: {text!r}, expected $.path<op>value")
+    path, operator, raw = match.groups()
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        value = raw
+    if isinstance(value, bool):
+        value = int(value)
+    if not isinstance(value, (int, float, str)):
+        raise ValueError(f"Invalid filter value: {text!r}, expected number or string")
+    return path, operator, value
@@ -0,0 +1,47 @@
+import json
+from bisect import insort
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from shared.database import DatabaseManager
+
+from .topic_cache import filter_by_prefix
+
+
+class LatestValuesCache:
+    """
+    Последние сообщения всех топиков в памяти процесса API
+
+    Как и TopicCatalogCache, перед ответом читается только commit_seq. Когда
+    он вырос, из latest_values дочитываются лишь строки, записанные пачками
+    после уже известной (индекс по commit_seq), и заново сериализуется
+    готовое тело ответа - без префикса запрос его только отдает.
+    """
+
+    def __init__(self, db_manager: DatabaseManager):
+        self.db_manager = db_manager
+        self.lock = Lock()
+        self.values: Dict[str, dict] = {}
+        self.names: List[str] = []
+        self.version = -1
+        self.body = b""
+
+    def get(self, prefix: Optional[str] = None) -> Tuple[str, bytes]:
+        """Возвращает (ETag, JSON-тело ответа) для топиков с префиксом"""
+        version = self.db_manager.get_state_versions()["commit_seq"]
+        with self.lock:
+            if version != self.version:
+                for row in self.db_manager.get_latest_values(self.version):
+                    if row["topic"] not in self.values:
+                        insort(self.names, row["topic"])
+                    self.values[row["topic"]] = dict(row)
+                self.body = self._serialize(self.names)
+                self.version = version
+            if not prefix:
+                return f'"latest-{version}"', self.body
+            body = self._serialize(filter_by_prefix(self.names, prefix))
+        return f'"latest-{version}"', body
+
+    def _serialize(self, names: List[str]) -> bytes:
+        latest = [self.values[name] for name in names]
+        return json.dumps({"latest": latest}, ensure_ascii=False).encode()
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+from shared.config import (
+    API_TAIL_BATCH_SIZE,
+    API_TAIL_KEEPALIVE,
+    API_TAIL_POLL_INTERVAL,
+    API_TAIL_QUEUE_SIZE,
+)
+from shared.metrics import REGISTRY
+
+from .async_database import AsyncDatabaseManager
+
+logger = logging.getLogger(__name__)
+
+TAIL_SUBSCRIBERS = REGISTRY.gauge(
+    "api_tail_subscribers", "Open /api/tail streams in this process"
+)
+TAIL_QUERIES = REGISTRY.counter(
+    "api_tail_queries_total", "Reads of new records shared by all /api/tail streams"
+)
+TAIL_DROPPED = REGISTRY.counter(
+    "api_tail_dropped_total", "/api/tail streams closed because the client lagged"
+)
+
+
+class TailSubscriber:
+    """Подписка на новые записи топика или всех топиков с префиксом"""
+
+    def __init__(
+        self,
+        topic: Optional[str],
+        prefix: Optional[str],
+        queue_size: int = API_TAIL_QUEUE_SIZE,
+    ):
+        self.topic = topic
+        self.prefix = prefix
+        # Порции JSON-объектов записей; переполнение - признак отстающего клиента
+        self.queue: "asyncio.Queue[List[str]]" = asyncio.Queue(queue_size)
+        self.dropped = False
+
+    def select(self, rows: list, by_topic: Dict[str, List[str]]) -> List[str]:
+        """Записи порции, относящиеся к подписке, в порядке id"""
+        if self.topic is not None:
+            return by_topic.get(self.topic, [])
+        return [record for _, topic, record in rows if topic.startswith(self.prefix)]
+
+
+class TailWatcher:
+    """
+    Общий наблюдатель новых записей для всех потоков /api/tail процесса
+
+    Пока есть подписчики, раз в poll_interval читается только счетчик
+    last_row_id; когда он превысил уже прочитанный id, новые записи всех
+    топиков читаются одним запросом по id и раздаются в очереди подписчиков.
+    Поэтому N клиентов стоят одного запроса на коммит, а не N опросов
+    /api/data. Без подписчиков наблюдатель останавливается и при следующей
+    подписке начинает с текущего id, не догоняя пропущенное.
+    """
+
+    def __init__(
+        self,
+        db: AsyncDatabaseManager,
+        poll_interval: float = API_TAIL_POLL_INTERVAL,
+        batch_size: int = API_TAIL_BATCH_SIZE,
+        keepalive: float = API_TAIL_KEEPALIVE,
+    ):
+        self.db = db
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.keepalive = keepalive
+        self.subscribers: Set[TailSubscriber] = set()
+        self.task: Optional[asyncio.Task] = None
+        self.last_id = 0
+        TAIL_SUBSCRIBERS.set_function(lambda: len(self.subscribers))
+
+    async def events(
+        self, topic: Optional[str] = None, prefix: Optional[str] = None
+    ) -> AsyncIterator[bytes]:
+        """
+        Поток Server-Sent Events: событие на каждую новую запись
+
+        Подписка живет, пока клиент читает поток: при отключении клиента
+        генератор закрывается, и подписка снимается
+        """
+        subscriber = TailSubscriber(topic, prefix)
+        self.subscribers.add(subscriber)
+        if self.task is None:
+            self.task = asyncio.create_task(self._watch())
+        try:
+            # Комментарий сразу: клиент и прокси получают заголовки ответа
+            yield b": tail started\n\n"
+            while not subscriber.dropped:
+                try:
+                    records = await asyncio.wait_for(
+                        subscriber.queue.get(), self.keepalive
+                    )
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                # Объекты записей собраны json_quote: переводов строк в них нет
+                yield "".join(f"data: {record}\n\n" for record in records).encode()
+            yield b"event: overflow\ndata: {}\n\n"
+        finally:
+            self.subscribers.discard(subscriber)
+
+    def close(self) -> None:
+        """Останавливает наблюдатель (при завершении процесса API)"""
+        if self.task is not None:
+            self.task.cancel()
+
+    async def _watch(self) -> None:
+        """Цикл наблюдателя: работает, пока есть подписчики"""
+        try:
+            self.last_id = await self.db.run(self.db.db_manager.get_last_row_id)
+            while self.subscribers:
+                try:
+                    last_id = await self.db.run(self.db.db_manager.get_last_row_id)
+                    if last_id > self.last_id:
+                        await self._read_new_records()
+                except Exception as e:
+                    logger.error(f"Live tail watcher error: {e}")
+                await asyncio.sleep(self.poll_interval)
+        except Exception as e:
+            logger.error(f"Live tail watcher stopped: {e}")
+        finally:
+            # Без await после проверки подписчиков: новая подписка либо
+            # застанет цикл, либо запустит новый
+            self.task = None
+
+    async def _read_new_records(self) -> None:
+        while self.subscribers:
+            rows = await self.db.run(
+                self.db.db_manager.get_records_after, self.last_id, self.batch_size
+            )
+            TAIL_QUERIES.inc()
+            if rows:
+                self.last_id = rows[-1][0]
+                self._publish(rows)
+            if len(rows) < self.batch_size:
+                return
+
+    def _publish(self, rows: list) -> None:
+        by_topic: Dict[str, List[str]] = {}
+        for _, topic, record in rows:
+            by_topic.setdefault(topic, []).append(record)
+        for subscriber in list(self.subscribers):
+            records = subscriber.select(rows, by_topic)
+            if not records:
+                continue
+            try:
+                subscriber.queue.put_nowait(records)
+            except asyncio.QueueFull:
+                # Клиент не успевает читать: поток закрывается событием
+                # overflow, чтобы не копить записи в памяти процесса
+                logger.warning(
+                    f"Dropping lagging tail subscriber "
+                    f"(topic: '{subscriber.topic}', prefix: '{subscriber.prefix}')"
+                )
+                TAIL_DROPPED.inc()
+                subscriber.dropped = True
+                self.subscribers.discard(subscriber)
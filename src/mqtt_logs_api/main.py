@@ -1,13 +1,36 @@
 import logging
 import sys
 import os
+import time
 from contextlib import asynccontextmanager
-from typing import List
+from datetime import datetime
+from functools import partial
+from typing import List, Literal, Optional, Union
 
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 
-from shared.config import LOG_LEVEL, UNICORN_PORT
-from shared.database import DatabaseManager
+from shared.config import LOG_LEVEL, UNICORN_PORT, UNICORN_WORKERS
+from shared.database import (
+    FIELD_PATH_PATTERN,
+    DatabaseManager,
+    to_db_timestamp,
+    utc_now_ms,
+)
+from shared.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from shared.metrics import REGISTRY
+
+from .async_database import AsyncDatabaseManager
+from .export import (
+    EXPORT_FORMATS,
+    ExportEncoder,
+    content_disposition,
+    export_filename,
+)
+from .filters import parse_field_filter
+from .live_tail import TailWatcher
+from .pagination import decode_cursor
+from .response_cache import DataQuery
 
 # Настройка логирования
 logging.basicConfig(
@@ -16,16 +39,29 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-db_manager = DatabaseManager()
+db_manager = AsyncDatabaseManager()
+tail_watcher = TailWatcher(db_manager)
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "api_request_seconds",
+    "Time to the response start, by endpoint",
+    ["endpoint", "method", "status"],
+)
 
 
 # Функции для работы с жизненным циклом приложения
 @asynccontextmanager
 async def check_database_health(app: FastAPI):
-    # Startup: Проверяем подключение к БД
-    # Показываем статистику to confirm connection
-    db_manager.get_database_stats()
+    # Startup: создаем/мигрируем схему соединением на запись и сразу его закрываем,
+    # дальше процесс API работает только через пул соединений для чтения
+    DatabaseManager().close()
+    # Проверяем соединение пула чтения: без чтения данных
+    if not await db_manager.check_connection():
+        logger.error("Database is not available at startup")
     yield
+    # Shutdown: останавливаем наблюдатель /api/tail, пул чтения и соединения
+    tail_watcher.close()
+    db_manager.close()
 
 
 # Создание FastAPI приложения
@@ -37,43 +73,159 @@ app = FastAPI(
 )
 
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Время ответа по шаблону пути эндпоинта (а не по самому пути)"""
+    started = time.monotonic()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    REQUEST_SECONDS.observe(
+        time.monotonic() - started,
+        getattr(route, "path", "unmatched"),
+        request.method,
+        str(response.status_code),
+    )
+    return response
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Проверяет, совпадает ли ETag с заголовком If-None-Match запроса"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [value.strip().removeprefix("W/") for value in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
 # Эндпоинт 1: Получение данных по topic
-@app.get("/api/data")
+@app.get("/api/data", response_model=List[dict])
 async def get_sensor_data(
-    topic: str = Query(..., description="Topic name", examples=["device/mqtt"]),
+    request: Request,
+    topics: List[str] = Query(
+        ...,
+        alias="topic",
+        description="Topic name or MQTT filter with + and #, repeatable",
+        examples=["radiohead/+"],
+    ),
     limit: int = Query(
-        100, ge=1, le=1000, description="Amount of records", examples=[100]
+        100,
+        ge=1,
+        le=1000,
+        description="Amount of records (per topic with group=true)",
+        examples=[100],
     ),
-) -> List[dict]:
+    since: Optional[datetime] = Query(
+        None, description="Lower time bound, inclusive (UTC if no offset)"
+    ),
+    until: Optional[datetime] = Query(
+        None, description="Upper time bound, exclusive (UTC if no offset)"
+    ),
+    cursor: Optional[str] = Query(
+        None, description="X-Next-Cursor header of the previous page"
+    ),
+    order: Literal["desc", "asc"] = Query(
+        "desc", description="desc - newest first, asc - oldest first"
+    ),
+    filters: Optional[List[str]] = Query(
+        None,
+        alias="filter",
+        description="Payload field condition, repeatable: $.path<op>value, "
+        "op is one of = != < <= > >=",
+        examples=["$.payload.voltage<3.3"],
+    ),
+    raw: bool = Query(
+        False, description="Embed JSON payloads as JSON values instead of strings"
+    ),
+    group: bool = Query(
+        False, description="Return {topic: records} instead of one merged list"
+    ),
+) -> Response:
     """
-    Получить последние N записей для указанного топика.
+    Получить записи для указанных топиков, по умолчанию последние N.
+
+    Параметр topic повторяется и принимает фильтры MQTT (radiohead/+,
+    home/#), которые раскрываются по списку топиков. Записи нескольких
+    топиков сливаются в одну ленту по времени; с group=true ответ - объект
+    {топик: записи} с limit записями на каждый топик (без курсора).
+
+    Следующая страница запрашивается с cursor из заголовка X-Next-Cursor.
+    С order=asc курсор позволяет опрашивать только новые записи.
+    Параметры filter отбирают записи по полям payload (все условия сразу);
+    поля из PAYLOAD_INDEXES ищутся по индексу.
+    С raw=true payload, являющийся JSON, вложен в ответ как есть, и клиенту
+    не нужно разбирать его второй раз.
+    Ответ берется из кэша ответов и поддерживает If-None-Match: ETag
+    меняется, только когда у топиков появляются новые записи.
     """
-    logger.info(f"Request received for topic: '{topic}' with limit: {limit}")
+    logger.info(f"Request received for topics: {topics} with limit: {limit}")
+    if group and cursor:
+        raise HTTPException(
+            status_code=400, detail="cursor is not supported with group=true"
+        )
 
     try:
-        rows = db_manager.get_sensor_data(topic, limit)
-        # Конвертируем строки Row в обычные dict
-        result = [dict(row) for row in rows]
-        logger.info(f"Returning {len(result)} records for topic '{topic}'")
-        return result
+        after = decode_cursor(cursor) if cursor else None
+        conditions = tuple(parse_field_filter(text) for text in filters or ())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
+    try:
+        page = await db_manager.get_sensor_data(
+            DataQuery(
+                tuple(topics),
+                limit,
+                to_db_timestamp(since) if since else None,
+                to_db_timestamp(until) if until else None,
+                after,
+                order == "asc",
+                conditions,
+                raw,
+                group,
+            ),
+            partial(etag_matches, request),
+        )
+        if page.body is None:
+            return Response(status_code=304, headers={"ETag": page.etag})
+        # Курсор последней записи; на пустой странице остается прежним,
+        # чтобы опрашивающий клиент мог повторить запрос позже
+        headers = {"ETag": page.etag}
+        next_cursor = page.next_cursor or cursor
+        if next_cursor:
+            headers["X-Next-Cursor"] = next_cursor
+        logger.info(f"Returning records for topics {topics}")
+        return Response(page.body, media_type="application/json", headers=headers)
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Request error in /api/data: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
 # Эндпоинт 2: Получение списка всех уникальных топиков
-@app.get("/api/topics")
-async def get_all_topics() -> dict:
+@app.get("/api/topics", response_model=None)
+async def get_all_topics(
+    request: Request,
+    response: Response,
+    prefix: Optional[str] = Query(
+        None, description="Topic name prefix", examples=["radiohead/"]
+    ),
+    details: bool = Query(
+        False, description="Include first_seen, last_seen and message_count"
+    ),
+) -> Union[dict, Response]:
     """
     Получить список всех уникальных топиков, представленных в базе данных.
+
+    Ответ берется из кэша каталога топиков и поддерживает If-None-Match.
     """
-    logger.info("Request received for all topics")
+    logger.info(f"Request received for topics with prefix: '{prefix or ''}'")
 
     try:
-        rows = db_manager.get_all_topics()
-        # Извлекаем только значения топиков в список
-        topics = [row["topic"] for row in rows]
+        etag, topics = await db_manager.get_topics(prefix, details)
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
         logger.info(f"Returning {len(topics)} unique topics")
         return {"topics": topics}
 
@@ -82,14 +234,269 @@ async def get_all_topics() -> dict:
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+# Эндпоинт 3: Последнее сообщение каждого топика
+@app.get("/api/latest", response_model=None)
+async def get_latest(
+    request: Request,
+    prefix: Optional[str] = Query(
+        None, description="Topic name prefix", examples=["radiohead/"]
+    ),
+) -> Response:
+    """
+    Получить последнее сообщение каждого топика одним запросом.
+
+    Ответ берется из кэша в памяти, который дочитывает только изменения
+    после новых коммитов, и поддерживает If-None-Match.
+    """
+    try:
+        etag, body = await db_manager.get_latest(prefix)
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(
+            content=body, media_type="application/json", headers={"ETag": etag}
+        )
+
+    except Exception as e:
+        logger.error(f"Request error in /api/latest: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+# Эндпоинт 4: Потоковая выгрузка записей
+@app.get("/api/export", response_model=None)
+async def export_sensor_data(
+    topic: Optional[str] = Query(
+        None, description="Topic name", examples=["device/mqtt"]
+    ),
+    prefix: Optional[str] = Query(
+        None, description="Topic name prefix", examples=["radiohead/"]
+    ),
+    since: Optional[datetime] = Query(
+        None, description="Lower time bound, inclusive (UTC if no offset)"
+    ),
+    until: Optional[datetime] = Query(
+        None, description="Upper time bound, exclusive (UTC if no offset)"
+    ),
+    export_format: Literal["ndjson", "csv"] = Query(
+        "ndjson", alias="format", description="Output format"
+    ),
+    compress: bool = Query(
+        False, alias="gzip", description="Compress the output as a .gz file"
+    ),
+) -> StreamingResponse:
+    """
+    Выгрузить записи топика или всех топиков с префиксом за период.
+
+    Строки передаются порциями по мере чтения из базы (по топикам, от старых
+    к новым), поэтому объем выгрузки не ограничен памятью сервера.
+    """
+    if (topic is None) == (prefix is None):
+        raise HTTPException(
+            status_code=400, detail="Exactly one of topic or prefix is required"
+        )
+    logger.info(f"Export requested for topic: '{topic}', prefix: '{prefix}'")
+
+    try:
+        if topic is not None:
+            topics = [topic]
+        else:
+            _, topics = await db_manager.get_topics(prefix)
+    except Exception as e:
+        logger.error(f"Request error in /api/export: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+    filename = export_filename(export_format, compress, topic or prefix)
+    return StreamingResponse(
+        db_manager.export(
+            topics,
+            ExportEncoder(export_format, compress),
+            to_db_timestamp(since) if since else None,
+            to_db_timestamp(until) if until else None,
+        ),
+        media_type="application/gzip" if compress else EXPORT_FORMATS[export_format],
+        headers={"Content-Disposition": content_disposition(filename)},
+    )
+
+
+# Эндпоинт 5: Живой поток новых записей
+@app.get("/api/tail", response_model=None)
+async def tail_sensor_data(
+    topic: Optional[str] = Query(
+        None, description="Topic name", examples=["device/mqtt"]
+    ),
+    prefix: Optional[str] = Query(
+        None, description="Topic name prefix", examples=["radiohead/"]
+    ),
+) -> StreamingResponse:
+    """
+    Подписаться на новые записи топика или всех топиков с префиксом.
+
+    Ответ - поток Server-Sent Events: каждая закоммиченная запись приходит
+    событием с JSON-объектом записи, как в /api/data. Все подписчики
+    процесса обслуживаются одним наблюдателем, который читает новые записи
+    один раз на коммит. Отстающий клиент получает событие overflow, и поток
+    закрывается; после переподключения записи идут с текущего момента.
+    """
+    if (topic is None) == (prefix is None):
+        raise HTTPException(
+            status_code=400, detail="Exactly one of topic or prefix is required"
+        )
+    logger.info(f"Tail requested for topic: '{topic}', prefix: '{prefix}'")
+
+    return StreamingResponse(
+        tail_watcher.events(topic, prefix),
+        media_type="text/event-stream",
+        # Прокси (nginx) не должны буферизовать поток
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+# Эндпоинт 6: Прореженный ряд значений для графиков
+@app.get("/api/series")
+async def get_series(
+    topic: str = Query(..., description="Topic name", examples=["radiohead/1"]),
+    since: datetime = Query(
+        ..., description="Range start, inclusive (UTC if no offset)"
+    ),
+    until: Optional[datetime] = Query(
+        None, description="Range end, exclusive (UTC if no offset), now if omitted"
+    ),
+    field: str = Query(
+        "$.payload.voltage",
+        description="JSON path of a numeric payload field",
+        examples=["$.payload.voltage"],
+    ),
+    points: int = Query(500, ge=3, le=5000, description="Maximum number of points"),
+    mode: Literal["buckets", "lttb"] = Query(
+        "buckets",
+        description="buckets - min/max/avg/count per interval, lttb - shape-preserving",
+    ),
+) -> dict:
+    """
+    Получить не более points точек числового поля payload за период.
+
+    buckets: агрегаты по равным интервалам времени считает SQLite.
+    lttb: выбранные исходные точки (Largest-Triangle-Three-Buckets).
+    """
+    if not FIELD_PATH_PATTERN.match(field):
+        raise HTTPException(status_code=400, detail=f"Invalid field path: {field!r}")
+    since_timestamp = to_db_timestamp(since)
+    until_timestamp = to_db_timestamp(until) if until else utc_now_ms()
+    if since_timestamp >= until_timestamp:
+        raise HTTPException(status_code=400, detail="since must be before until")
+    logger.info(f"Series requested for topic: '{topic}', mode: {mode}")
+
+    try:
+        series = await db_manager.get_series(
+            topic, field, since_timestamp, until_timestamp, points, mode
+        )
+        return {"topic": topic, "field": field, "mode": mode, **series}
+
+    except Exception as e:
+        logger.error(f"Request error in /api/series: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+# Эндпоинт 7: Агрегаты по минутам и часам
+@app.get("/api/rollups")
+async def get_rollups(
+    topic: str = Query(..., description="Topic name", examples=["radiohead/1"]),
+    resolution: Literal["1m", "1h"] = Query("1h", description="Interval length"),
+    since: Optional[datetime] = Query(
+        None, description="Intervals starting at or after (UTC if no offset)"
+    ),
+    until: Optional[datetime] = Query(
+        None, description="Intervals starting before (UTC if no offset)"
+    ),
+    limit: int = Query(1000, ge=1, le=10000, description="Amount of intervals"),
+) -> List[dict]:
+    """
+    Получить агрегаты топика: количество сообщений, min/max/avg и последнее
+    значение за каждую минуту или час, от старых интервалов к новым.
+
+    Значение записи - числовое поле payload, заданное для топика в
+    ROLLUP_VALUE_PATHS (по умолчанию ROLLUP_VALUE_PATH), либо сам payload,
+    если это число. Агрегаты хранятся дольше сырых данных
+    (ROLLUP_*_RETENTION_DAYS).
+    """
+    logger.info(f"Rollups requested for topic: '{topic}', resolution: {resolution}")
+
+    try:
+        return await db_manager.get_rollups(
+            topic,
+            resolution,
+            to_db_timestamp(since) if since else None,
+            to_db_timestamp(until) if until else None,
+            limit,
+        )
+
+    except Exception as e:
+        logger.error(f"Request error in /api/rollups: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+# Эндпоинт 8: Статистика хранимых записей
+@app.get("/api/stats")
+async def get_stats(
+    topic: Optional[str] = Query(
+        None, description="Topic name, all topics if omitted", examples=["device/mqtt"]
+    ),
+) -> dict:
+    """
+    Получить статистику базы данных или по топикам.
+
+    Значения берутся из счетчиков daily_stats и не требуют просмотра данных.
+    """
+    try:
+        if topic is None:
+            stats = await db_manager.get_database_stats()
+        else:
+            stats = {}
+        stats["topics"] = await db_manager.get_topic_stats(topic)
+        return stats
+
+    except Exception as e:
+        logger.error(f"Request error in /api/stats: {e}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
+# Эндпоинт 9: Проверка доступности базы данных
+@app.get("/api/health")
+async def health() -> dict:
+    """
+    Проверка готовности: база данных доступна для чтения.
+    """
+    if not await db_manager.check_connection():
+        raise HTTPException(status_code=503, detail="Database unavailable")
+    return {"status": "ok"}
+
+
+# Эндпоинт 10: Метрики процесса API в формате Prometheus
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    """
+    Метрики этого процесса. При UNICORN_WORKERS > 1 у каждого процесса
+    свои счетчики, и ответ дает процесс, принявший запрос.
+    """
+    return Response(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+
 # Корневой эндпоинт для проверки работы сервера
 @app.get("/")
 async def root() -> dict:
     return {
         "message": "Sensor Data API is running",
         "endpoints": {
-            "get_data": "/api/data?topic=sensor_1&limit=100",
-            "get_topics": "/api/topics",
+            "get_data": "/api/data?topic=sensor_1&limit=100&since=2024-01-01T00:00:00Z",
+            "get_data_many": "/api/data?topic=radiohead/%2B&limit=1&group=true",
+            "get_topics": "/api/topics?prefix=radiohead/&details=false",
+            "get_latest": "/api/latest?prefix=radiohead/",
+            "export": "/api/export?prefix=radiohead/&since=2024-01-01&format=csv",
+            "tail": "/api/tail?prefix=radiohead/",
+            "get_series": "/api/series?topic=radiohead/1&since=2024-01-01&points=500",
+            "get_rollups": "/api/rollups?topic=radiohead/1&resolution=1h",
+            "get_stats": "/api/stats?topic=sensor_1",
+            "health": "/api/health",
+            "metrics": "/metrics",
         },
     }
 
@@ -98,9 +505,14 @@ async def root() -> dict:
 if __name__ == "__main__":
     import uvicorn
 
+    # Несколько процессов uvicorn читают одну базу: WAL позволяет им работать
+    # параллельно. Для workers > 1 uvicorn нужна строка импорта приложения
+    app_path = f"{__spec__.name}:app" if __spec__ else "mqtt_logs_api.main:app"
+
     uvicorn.run(
-        app,
+        app if UNICORN_WORKERS == 1 else app_path,
         host="0.0.0.0",  # Слушать на всех интерфейсах
         port=UNICORN_PORT,  # Порт по умолчанию для FastAPI
+        workers=UNICORN_WORKERS,
         log_level="info",
     )
@@ -0,0 +1,33 @@
+import base64
+import json
+from typing import Tuple
+
+from shared.database import parse_timestamp
+
+
+def encode_cursor(timestamp: int, record_id: int) -> str:
+    """Непрозрачный курсор страницы из ключа (timestamp, id) записи"""
+    raw = json.dumps([timestamp, record_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int]:
+    """
+    Ключ (timestamp, id) из курсора; timestamp - мс Unix
+
+    Курсоры, выданные до перехода на миллисекунды, хранят текст метки
+    времени и по-прежнему принимаются
+
+    Raises:
+        ValueError: Курсор поврежден или выдан не этим API
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        timestamp, record_id = json.loads(base64.urlsafe_b64decode(padded))
+        if isinstance(timestamp, str):
+            timestamp = parse_timestamp(timestamp)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if not isinstance(timestamp, int) or not isinstance(record_id, int):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return timestamp, record_id
@@ -0,0 +1,182 @@
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+from shared.config import API_DATA_CACHE_MB, API_DATA_CACHE_TTL
+from shared.database import DatabaseManager, FieldFilter
+from shared.metrics import REGISTRY
+
+from .pagination import encode_cursor
+
+CACHE_REQUESTS = REGISTRY.counter(
+    "api_data_cache_requests_total",
+    "/api/data responses by cache result",
+    ["result"],
+)
+
+
+class DataQuery(NamedTuple):
+    """Параметры запроса /api/data - ключ кэша; topics - уже без подстановок"""
+
+    topics: Tuple[str, ...]
+    limit: int
+    since: Optional[int] = None
+    until: Optional[int] = None
+    after: Optional[Tuple[int, int]] = None
+    ascending: bool = False
+    filters: Tuple[FieldFilter, ...] = ()
+    raw_payload: bool = False
+    group: bool = False
+
+
+class DataPage(NamedTuple):
+    """Ответ /api/data: body - None, если у клиента уже есть эта версия"""
+
+    etag: str
+    body: Optional[bytes]
+    next_cursor: Optional[str]
+
+
+class _Entry(NamedTuple):
+    page: DataPage
+    size: int
+    created: float
+
+
+class DataResponseCache:
+    """
+    Готовые ответы /api/data в памяти процесса API (LRU с TTL)
+
+    Версия ответа - номер последней пачки с записями топика (commit_seq из
+    latest_values) и номер удаления purge_seq. Как и TopicCatalogCache,
+    перед ответом читается только строка счетчиков ingest_state; когда
+    commit_seq вырос, дочитываются номера лишь изменившихся топиков. Ответ
+    из кэша отдается, пока у его топика не появилась новая пачка, а
+    удаление старых записей сбрасывает кэш целиком. Версия же служит ETag:
+    на If-None-Match с текущей версией запрос в БД не выполняется вовсе.
+
+    Объем ограничен max_bytes (вытесняются давно не запрошенные ответы), а
+    срок жизни - ttl: он только подстраховывает от изменений базы в обход
+    DatabaseManager.
+    """
+
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        max_bytes: int = API_DATA_CACHE_MB * 1024 * 1024,
+        ttl: float = API_DATA_CACHE_TTL,
+    ):
+        self.db_manager = db_manager
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.lock = Lock()
+        self.entries: "OrderedDict[DataQuery, _Entry]" = OrderedDict()
+        self.size = 0
+        self.commit_seq = -1
+        self.purge_seq = -1
+        self.topic_seqs: Dict[str, int] = {}
+
+    def get(
+        self, query: DataQuery, not_modified: Callable[[str], bool] = lambda etag: False
+    ) -> DataPage:
+        """
+        Возвращает ответ на запрос из кэша или из базы
+
+        Args:
+            query: Параметры запроса
+            not_modified: Проверка ETag по If-None-Match запроса; если она
+                прошла, ответ возвращается без тела
+        """
+        purge_seq, topic_seq = self._versions(query.topics)
+        etag = f'"data-{purge_seq}-{topic_seq}"'
+        if not_modified(etag):
+            CACHE_REQUESTS.inc("not_modified")
+            return DataPage(etag, None, None)
+
+        with self.lock:
+            entry = self.entries.get(query)
+            if entry is not None:
+                if (
+                    entry.page.etag == etag
+                    and time.monotonic() - entry.created < self.ttl
+                ):
+                    self.entries.move_to_end(query)
+                    CACHE_REQUESTS.inc("hit")
+                    return entry.page
+                self._evict(query)
+
+        # Запрос выполняется после чтения версии: если пачка закоммичена
+        # между ними, ответ новее своей версии и будет перечитан
+        CACHE_REQUESTS.inc("miss")
+        body, next_cursor = self._read(query)
+        page = DataPage(etag, body, next_cursor)
+        if len(body) <= self.max_bytes:
+            with self.lock:
+                if query in self.entries:
+                    self._evict(query)
+                self.entries[query] = _Entry(page, len(body), time.monotonic())
+                self.size += len(body)
+                while self.size > self.max_bytes:
+                    self._evict(next(iter(self.entries)))
+        return page
+
+    def _read(self, query: DataQuery) -> Tuple[bytes, Optional[str]]:
+        """Тело ответа и курсор следующей страницы - из базы"""
+        # Записи приходят из базы уже JSON-объектами: тело - их склейка
+        if query.group:
+            groups = []
+            for topic in query.topics:
+                rows = self.db_manager.get_sensor_data_json(
+                    topic,
+                    query.limit,
+                    query.since,
+                    query.until,
+                    query.after,
+                    query.ascending,
+                    query.filters,
+                    query.raw_payload,
+                )
+                records = ",".join(record for _, _, record in rows)
+                groups.append(f"{json.dumps(topic, ensure_ascii=False)}:[{records}]")
+            return ("{" + ",".join(groups) + "}").encode(), None
+
+        rows = self.db_manager.get_sensor_data_merged(
+            query.topics,
+            query.limit,
+            query.since,
+            query.until,
+            query.after,
+            query.ascending,
+            query.filters,
+            query.raw_payload,
+        )
+        body = ("[" + ",".join(record for _, _, record in rows) + "]").encode()
+        return body, encode_cursor(rows[-1][1], rows[-1][0]) if rows else None
+
+    def _versions(self, topics: Tuple[str, ...]) -> Tuple[int, int]:
+        """
+        (purge_seq, номер последней пачки среди топиков); после удаления
+        старых записей сбрасывает кэш
+
+        Номера пачек растут глобально, поэтому наибольший из них меняется при
+        новой пачке любого из топиков
+        """
+        versions = self.db_manager.get_state_versions()
+        with self.lock:
+            if versions["purge_seq"] != self.purge_seq:
+                self.entries.clear()
+                self.size = 0
+                self.purge_seq = versions["purge_seq"]
+            if versions["commit_seq"] != self.commit_seq:
+                for row in self.db_manager.get_topic_versions(max(self.commit_seq, 0)):
+                    self.topic_seqs[row["topic"]] = row["commit_seq"]
+                self.commit_seq = versions["commit_seq"]
+            return self.purge_seq, max(
+                (self.topic_seqs.get(topic, 0) for topic in topics), default=0
+            )
+
+    def _evict(self, query: DataQuery) -> None:
+        entry = self.entries.pop(query)
+        self.size -= entry.size
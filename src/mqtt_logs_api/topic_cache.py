@@ -0,0 +1,85 @@
+from bisect import bisect_left
+from threading import Lock
+from typing import Dict, List, Optional, Tuple
+
+from shared.database import DatabaseManager
+from shared.utils.topic_matches import topic_matches
+
+
+def filter_by_prefix(names: List[str], prefix: Optional[str]) -> List[str]:
+    """Отбирает из отсортированного списка имена с префиксом за O(log n + k)"""
+    if not prefix:
+        return names
+    start = bisect_left(names, prefix)
+    end = start
+    while end < len(names) and names[end].startswith(prefix):
+        end += 1
+    return names[start:end]
+
+
+def resolve_topics(names: List[str], topic_filters: List[str]) -> List[str]:
+    """
+    Топики запроса: имена как есть, фильтры MQTT (+, #) - по каталогу
+
+    Совпадения фильтра ищутся только среди имен с его буквальным префиксом
+    (до первого уровня с подстановкой). Повторы убираются с сохранением
+    порядка
+    """
+    topics: Dict[str, None] = {}
+    for topic_filter in topic_filters:
+        levels = topic_filter.split("/")
+        wildcard = next(
+            (index for index, level in enumerate(levels) if level in ("+", "#")),
+            None,
+        )
+        if wildcard is None:
+            topics[topic_filter] = None
+            continue
+        prefix = "/".join(levels[:wildcard])
+        for name in filter_by_prefix(names, prefix):
+            if topic_matches(topic_filter, name):
+                topics[name] = None
+    return list(topics)
+
+
+class TopicCatalogCache:
+    """
+    Каталог топиков в памяти процесса API
+
+    Перед ответом читается только строка счетчиков из ingest_state (поиск
+    по первичному ключу). Список имен перечитывается, когда растет
+    catalog_version (появился новый топик), а каталог со счетчиками - когда
+    растет commit_seq (закоммичена новая пачка). Версия же служит ETag.
+    """
+
+    def __init__(self, db_manager: DatabaseManager):
+        self.db_manager = db_manager
+        self.lock = Lock()
+        self.names: List[str] = []
+        self.names_version = -1
+        self.details: List[dict] = []
+        self.details_version = -1
+
+    def get_names(self, prefix: Optional[str] = None) -> Tuple[str, List[str]]:
+        """Возвращает (ETag, имена топиков с префиксом)"""
+        version = self.db_manager.get_state_versions()["catalog_version"]
+        with self.lock:
+            if version != self.names_version:
+                rows = self.db_manager.get_all_topics()
+                self.names = [row["topic"] for row in rows]
+                self.names_version = version
+            names = self.names
+        return f'"topics-{version}"', filter_by_prefix(names, prefix)
+
+    def get_details(self, prefix: Optional[str] = None) -> Tuple[str, List[dict]]:
+        """Возвращает (ETag, записи каталога со счетчиками для топиков с префиксом)"""
+        version = self.db_manager.get_state_versions()["commit_seq"]
+        with self.lock:
+            if version != self.details_version:
+                rows = self.db_manager.get_topic_catalog()
+                self.details = [dict(row) for row in rows]
+                self.details_version = version
+            details = self.details
+        if prefix:
+            details = [item for item in details if item["topic"].startswith(prefix)]
+        return f'"catalog-{version}"', details
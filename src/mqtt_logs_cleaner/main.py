@@ -1,25 +1,75 @@
 #!/usr/bin/env python3
+import argparse
 import logging
+import sys
+import time
 
+from shared.config import CLEANER_METRICS_TEXTFILE
 from shared.database import DatabaseManager
+from shared.metrics import REGISTRY
 
 logging.basicConfig(level=logging.INFO)
 
+# Процесс живет один запуск, поэтому все метрики - значения последнего запуска
+DELETED = REGISTRY.gauge(
+    "cleaner_deleted_rows", "Rows deleted by the last cleanup, by kind", ["kind"]
+)
+DURATION = REGISTRY.gauge(
+    "cleaner_duration_seconds", "Duration of the last cleanup step", ["step"]
+)
+THROUGHPUT = REGISTRY.gauge(
+    "cleaner_deleted_records_per_second", "Record deletion rate of the last cleanup"
+)
+LAST_RUN = REGISTRY.gauge(
+    "cleaner_last_run_timestamp_seconds", "Unix time the last cleanup finished"
+)
+
 
 def main():
     """Ручная очистка старых записей"""
+    parser = argparse.ArgumentParser(description="Delete expired sensor data")
+    parser.add_argument(
+        "--convert-auto-vacuum",
+        action="store_true",
+        help="One-time maintenance: switch an old database to incremental "
+        "auto_vacuum with a full VACUUM (blocks writers, needs free disk space "
+        "of about the database size), then exit",
+    )
+    args = parser.parse_args()
     db_manager = DatabaseManager()
 
+    if args.convert_auto_vacuum:
+        converted = db_manager.convert_auto_vacuum()
+        print("Converted to incremental auto_vacuum" if converted else "Failed")
+        sys.exit(0 if converted else 1)
+
     # Показываем статистику до очистки
     stats = db_manager.get_database_stats()
     print("Database statistics before cleanup:")
     for key, value in stats.items():
         print(f"  {key}: {value}")
 
-    # Подтверждение
+    # Payload можно удалять, только когда старых записей точно не осталось:
+    # иначе оставшиеся записи ссылались бы на удаленные payload
+    records_cleaned = bool(stats)
     if stats.get("records_older_than_3_months", 0) > 0:
-        deleted_count, total_before = db_manager.delete_old_records(3)
-        print(f"Deleted {deleted_count} records")
+        started = time.monotonic()
+        deleted_count = db_manager.delete_old_records(
+            3, progress=lambda deleted: print(f"  deleted so far: {deleted}")
+        )
+        elapsed = time.monotonic() - started
+        records_cleaned = deleted_count is not None
+        deleted_count = deleted_count or 0
+        DELETED.set(deleted_count, "records")
+        DURATION.set(elapsed, "records")
+        THROUGHPUT.set(deleted_count / elapsed if elapsed else 0.0)
+        print(f"Deleted {deleted_count} records in {elapsed:.1f}s")
+
+        # Возвращаем освободившееся место на диске
+        started = time.monotonic()
+        free_pages = db_manager.reclaim_space()
+        DURATION.set(time.monotonic() - started, "reclaim_space")
+        print(f"Reclaimed {free_pages} free pages")
 
         # Показываем статистику после очистки
         stats_after = db_manager.get_database_stats()
@@ -29,6 +79,29 @@ def main():
     else:
         print("No records older than 3 months found")
 
+    # Сжатые payload, на которые ссылались только удаленные записи
+    if records_cleaned:
+        started = time.monotonic()
+        deleted_payloads = db_manager.delete_unused_payloads(3)
+        DELETED.set(deleted_payloads, "payloads")
+        DURATION.set(time.monotonic() - started, "payloads")
+        print(f"Deleted {deleted_payloads} unused payloads")
+    else:
+        print("Record cleanup failed, unused payloads are kept until next run")
+
+    # Агрегаты хранятся дольше сырых данных и удаляются по своему сроку
+    started = time.monotonic()
+    deleted_rollups = db_manager.delete_old_rollups()
+    DELETED.set(deleted_rollups, "rollups")
+    DURATION.set(time.monotonic() - started, "rollups")
+    print(f"Deleted {deleted_rollups} expired rollup intervals")
+
+    # Процесс завершается раньше следующего опроса Prometheus: метрики
+    # забирает textfile collector node_exporter
+    if CLEANER_METRICS_TEXTFILE:
+        LAST_RUN.set(time.time())
+        REGISTRY.write_textfile(CLEANER_METRICS_TEXTFILE)
+
 
 if __name__ == "__main__":
     main()
@@ -11,6 +11,17 @@ MQTT_PORT = int(os.getenv("MQTT_PORT", 1883))
 MQTT_USER = str(os.getenv("MQTT_USER", ""))
 MQTT_PASSWORD = str(os.getenv("MQTT_PASSWORD", ""))
 MQTT_TOPIC = os.getenv("MQTT_TOPIC", "myapp/sensors/temperature")
+# Подписки через запятую, у каждой может быть свой QoS: "a/+/b:1,c/#:0"
+# (по умолчанию - одна подписка на MQTT_TOPIC)
+MQTT_SUBSCRIPTIONS = os.getenv("MQTT_SUBSCRIPTIONS", MQTT_TOPIC)
+MQTT_QOS = int(os.getenv("MQTT_QOS", 0))  # QoS подписок без явного QoS
+# Группа общей подписки ($share/<группа>/<топик>): реплики mqtt_logger с
+# одной группой делят сообщения между собой, а не получают каждое
+MQTT_SHARED_GROUP = os.getenv("MQTT_SHARED_GROUP", "")
+MQTT_PROTOCOL = os.getenv("MQTT_PROTOCOL", "3.1.1")  # 3.1 | 3.1.1 | 5
+# Постоянный client id: сессия с подписками QoS 1/2 сохраняется брокером
+# между переподключениями (пусто - случайный id и чистая сессия)
+MQTT_CLIENT_ID = os.getenv("MQTT_CLIENT_ID", "")
 
 # Настройки базы данных
 DB_PATH = str(
@@ -20,11 +31,93 @@ DB_PATH = str(
     )
 )
 
+# Настройки соединений SQLite (см. ConnectionManager)
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", 10.0))  # Секунды
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # В режиме WAL безопасно
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", 16384))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 128 * 1024 * 1024))  # Байты
+SQLITE_STATEMENT_CACHE_SIZE = int(os.getenv("SQLITE_STATEMENT_CACHE_SIZE", 256))
+
+# Настройки очистки старых записей (mqtt_logs_cleaner)
+CLEANER_CHUNK_SIZE = int(os.getenv("CLEANER_CHUNK_SIZE", 5000))  # Записей за транзакцию
+CLEANER_CHUNK_PAUSE = float(os.getenv("CLEANER_CHUNK_PAUSE", 0.2))  # Секунды
+CLEANER_VACUUM_PAGES = int(os.getenv("CLEANER_VACUUM_PAGES", 2000))  # Страниц за шаг
+
+# Агрегаты по минутам и часам (rollup_1m, rollup_1h), хранятся дольше сырых данных
+# JSON-путь числового поля payload; если поля нет, берется сам payload-число
+ROLLUP_VALUE_PATH = os.getenv("ROLLUP_VALUE_PATH", "$.payload.voltage")
+# Пути по шаблонам топиков "шаблон=путь,..." (как PAYLOAD_INDEXES): первый
+# совпавший шаблон, топики без совпадений - по ROLLUP_VALUE_PATH. Меняет
+# только новые интервалы
+ROLLUP_VALUE_PATHS = os.getenv("ROLLUP_VALUE_PATHS", "")
+ROLLUP_1M_RETENTION_DAYS = int(os.getenv("ROLLUP_1M_RETENTION_DAYS", 365))
+ROLLUP_1H_RETENTION_DAYS = int(os.getenv("ROLLUP_1H_RETENTION_DAYS", 0))  # 0 - вечно
+
+# Хранение payload: text - текстом в партиции, compressed - в таблице payloads
+# (одинаковые payload хранятся один раз, сжатие общим словарем zlib)
+PAYLOAD_STORAGE = os.getenv("PAYLOAD_STORAGE", "text")
+PAYLOAD_DICT_SIZE = int(os.getenv("PAYLOAD_DICT_SIZE", 8192))  # Байты
+# Сколько новых уникальных payload сжать, прежде чем обучить новый словарь
+PAYLOAD_DICT_RETRAIN = int(os.getenv("PAYLOAD_DICT_RETRAIN", 50000))
+# Размер кэша hash -> id уникальных payload в процессе-писателе
+PAYLOAD_CACHE_SIZE = int(os.getenv("PAYLOAD_CACHE_SIZE", 100000))
+# Индексы полей payload для фильтров /api/data: "шаблон=JSON-путь,..." (шаблон
+# fnmatch по топику, без учета регистра). Поле с типизированной колонкой
+# (sensor_id, voltage) индексируется по ней, остальные - выражением
+# json_extract, которое работает только при PAYLOAD_STORAGE=text
+PAYLOAD_INDEXES = os.getenv(
+    "PAYLOAD_INDEXES", "*radiohead*=$.payload.sensor_id,*radiohead*=$.payload.voltage"
+)
+
 # Настройки приложения
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Писать в лог (INFO) каждое N-е принятое сообщение; 0 - только на уровне DEBUG
+MESSAGE_LOG_EVERY = int(os.getenv("MESSAGE_LOG_EVERY", 0))
+# Порт HTTP с метриками Prometheus в mqtt_logger (0 - не слушать)
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9108))
+# Файл метрик mqtt_logs_cleaner для textfile collector node_exporter (пусто - нет)
+CLEANER_METRICS_TEXTFILE = os.getenv("CLEANER_METRICS_TEXTFILE", "")
 
 BATCH_SIZE = int(os.getenv("BATCH_SIZE", 300))  # Размер пачки
 BATCH_TIMEOUT = int(
     os.getenv("BATCH_TIMEOUT", 180.0)
 )  # Таймаут в секундах (даже если не набралось BATCH_SIZE)
+# Потоки декодирования пачек перед записью в БД (0 - в самом потоке записи)
+DECODE_WORKERS = int(os.getenv("DECODE_WORKERS", 2))
+# Очередь приема сообщений перед потоком записи в БД
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 10000))
+# Поведение при переполнении очереди: block | drop_oldest | spill
+INGEST_OVERFLOW_POLICY = os.getenv("INGEST_OVERFLOW_POLICY", "block")
+# Файл для записей, не поместившихся в очередь (политика spill)
+INGEST_SPILL_PATH = os.getenv("INGEST_SPILL_PATH", f"{DB_PATH}.spill")
+# Журнал принятых сообщений для восстановления после падения (пусто - отключен)
+INGEST_SPOOL_PATH = os.getenv("INGEST_SPOOL_PATH", f"{DB_PATH}.spool")
+# Интервал группового fsync журнала, секунды
+INGEST_SPOOL_FSYNC_INTERVAL = float(os.getenv("INGEST_SPOOL_FSYNC_INTERVAL", 1.0))
+# После скольких записей журнал с незакоммиченными записями запечатывается в сегмент
+INGEST_SPOOL_SEGMENT_RECORDS = int(os.getenv("INGEST_SPOOL_SEGMENT_RECORDS", 10000))
+# Как часто писать в лог счетчики потока записи, секунды
+WRITER_STATS_INTERVAL = int(os.getenv("WRITER_STATS_INTERVAL", 60))
 UNICORN_PORT = int(os.getenv("UNICORN_PORT", 5283))
+# Количество процессов uvicorn, обслуживающих одну и ту же базу
+UNICORN_WORKERS = int(os.getenv("UNICORN_WORKERS", 1))
+# Размер пула потоков для чтения из БД в каждом процессе API
+API_DB_READERS = int(os.getenv("API_DB_READERS", 4))
+# Кэш готовых ответов /api/data: объем в мегабайтах (0 - выключен) и
+# наибольший срок жизни ответа в секундах
+API_DATA_CACHE_MB = int(os.getenv("API_DATA_CACHE_MB", 64))
+API_DATA_CACHE_TTL = float(os.getenv("API_DATA_CACHE_TTL", 300.0))
+# Наибольшее число топиков в одном запросе /api/data (после раскрытия + и #)
+API_DATA_MAX_TOPICS = int(os.getenv("API_DATA_MAX_TOPICS", 1000))
+# Сколько строк читать за один запрос при потоковой выгрузке /api/export
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 5000))
+# Живой поток /api/tail: период проверки новых пачек (секунды), записей за
+# один запрос, очередь подписчика (порций; отстающий клиент отключается) и
+# период keep-alive комментария SSE (секунды)
+API_TAIL_POLL_INTERVAL = float(os.getenv("API_TAIL_POLL_INTERVAL", 0.5))
+API_TAIL_BATCH_SIZE = int(os.getenv("API_TAIL_BATCH_SIZE", 1000))
+API_TAIL_QUEUE_SIZE = int(os.getenv("API_TAIL_QUEUE_SIZE", 100))
+API_TAIL_KEEPALIVE = float(os.getenv("API_TAIL_KEEPALIVE", 15.0))
+
+# Размер порции строк при онлайн-миграции схемы (каждая порция - отдельная транзакция)
+MIGRATION_CHUNK_SIZE = int(os.getenv("MIGRATION_CHUNK_SIZE", 5000))
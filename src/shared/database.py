@@ -1,131 +1,1900 @@
+import hashlib
+import heapq
+import json
 import logging
+import re
 import sqlite3
 import os
-from datetime import datetime, timedelta
-from threading import RLock, Timer
-from typing import Tuple
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
+from fnmatch import fnmatchcase
+from itertools import islice
+from threading import Lock, Thread, current_thread
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from urllib.request import pathname2url
 
-from .config import BATCH_SIZE, BATCH_TIMEOUT, DB_PATH
+from .config import (
+    CLEANER_CHUNK_PAUSE,
+    CLEANER_CHUNK_SIZE,
+    CLEANER_VACUUM_PAGES,
+    DB_PATH,
+    MIGRATION_CHUNK_SIZE,
+    PAYLOAD_CACHE_SIZE,
+    PAYLOAD_DICT_RETRAIN,
+    PAYLOAD_DICT_SIZE,
+    PAYLOAD_INDEXES,
+    PAYLOAD_STORAGE,
+    ROLLUP_1H_RETENTION_DAYS,
+    ROLLUP_1M_RETENTION_DAYS,
+    ROLLUP_VALUE_PATH,
+    ROLLUP_VALUE_PATHS,
+    SQLITE_BUSY_TIMEOUT,
+    SQLITE_CACHE_SIZE_KB,
+    SQLITE_MMAP_SIZE,
+    SQLITE_STATEMENT_CACHE_SIZE,
+    SQLITE_SYNCHRONOUS,
+)
 
-from .utils.decode_radiohead_payload import decode_radiohead_payload
-from .utils.parse_payload_as_json import parse_payload_as_json
-from .utils.serialize_json_payload_as_str import serialize_json_payload_as_str
+from .decoders import DecodedRecord, Record
+from .decoders import registry as decoder_registry
+from .payload_codec import PayloadCodec, payload_hash, train_dictionary
 
 logger = logging.getLogger(__name__)
 
-radiohead_topic_name = "radiohead"
 
+# Версия схемы хранится в PRAGMA user_version
+# 0 - исходная схема (topic TEXT в каждой строке sensor_data)
+# 1 - словарь topics + sensor_data.topic_id + индекс (topic_id, timestamp)
+# 2 - каталог топиков: first_seen, last_seen, message_count в topics
+# 3 - помесячные партиции sensor_data_YYYYMM, sensor_data - представление над ними
+# 4 - счетчики daily_stats (записей по дню и топику)
+# 5 - агрегаты rollup_1m и rollup_1h
+# 6 - последнее сообщение каждого топика в latest_values
+# 7 - типизированные колонки sensor_id и voltage в партициях
+# 8 - сжатые уникальные payload в таблице payloads, партиции ссылаются на них
+# 9 - timestamp партиций в миллисекундах Unix (INTEGER) вместо текста
+SCHEMA_VERSION = 9
 
-class DatabaseManager:
-    def __init__(self, db_path: str = DB_PATH):
+# Шаги миграции: версия схемы -> метод DatabaseManager, переводящий базу в нее
+MIGRATIONS = {
+    1: "migrate_legacy_sensor_data",
+    2: "migrate_topic_catalog",
+    3: "migrate_to_partitions",
+    4: "migrate_daily_stats",
+    5: "migrate_rollups",
+    6: "migrate_latest_values",
+    7: "migrate_typed_columns",
+    8: "migrate_payload_store",
+    9: "migrate_epoch_timestamps",
+}
+
+# Партиции: sensor_data_YYYYMM хранит записи одного месяца (UTC)
+PARTITION_PREFIX = "sensor_data_"
+PARTITION_GLOB = PARTITION_PREFIX + "[0-9]" * 6
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Метка времени записи (sensor_data.timestamp) - время приема сообщения в
+# миллисекундах Unix (UTC), INTEGER. Служебные таблицы (topics, daily_stats,
+# агрегаты, latest_values) хранят время текстом (format_timestamp)
+EPOCH = datetime(1970, 1, 1)
+DAY_MS = 24 * 60 * 60 * 1000
+
+# Агрегаты: разрешение -> (таблица, формат strftime начала интервала) и
+# срок хранения в днях (0 - без удаления)
+ROLLUPS = {
+    "1m": ("rollup_1m", "%Y-%m-%d %H:%M:00"),
+    "1h": ("rollup_1h", "%Y-%m-%d %H:00:00"),
+}
+ROLLUP_RETENTION_DAYS = {
+    "1m": ROLLUP_1M_RETENTION_DAYS,
+    "1h": ROLLUP_1H_RETENTION_DAYS,
+}
+
+
+# Типизированные колонки партиций (заполняются декодерами, см. shared.decoders)
+# и JSON-пути payload, значения которых они хранят
+TYPED_COLUMNS = {
+    "sensor_id": "INTEGER",
+    "voltage": "REAL",
+}
+TYPED_FIELD_PATHS = {
+    "$.payload.sensor_id": "sensor_id",
+    "$.payload.voltage": "voltage",
+}
+
+# Колонки партиций, добавленные после версии 3 (ADD COLUMN при миграции)
+PARTITION_EXTRA_COLUMNS = {
+    **TYPED_COLUMNS,
+    "payload_id": "INTEGER REFERENCES payloads(id)",
+}
+
+# JSON-путь SQLite к полю payload: $.a.b, $.a[0]. Проверенный путь можно
+# подставлять в SQL литералом (выражения индексов не принимают параметры)
+FIELD_PATH_PATTERN = re.compile(r"^\$(\.[A-Za-z_][A-Za-z0-9_]*|\[[0-9]+\])+$")
+
+# Фильтр записей по полю payload: (JSON-путь, оператор, значение)
+FieldFilter = Tuple[str, str, Union[int, float, str]]
+FILTER_OPERATORS = ("=", "!=", "<", "<=", ">", ">=")
+
+# Текст payload записи партиции: в режиме PAYLOAD_STORAGE=compressed колонка
+# payload пуста, а сам payload распаковывается из payloads SQL-функцией
+PAYLOAD_SQL = """
+    CASE WHEN payload_id IS NULL THEN payload ELSE (
+        SELECT inflate_payload(data, dict_id) FROM payloads
+        WHERE payloads.id = payload_id
+    ) END
+"""
+
+
+def numeric_value_sql(path: str, bare_number: bool = False) -> Tuple[str, tuple]:
+    """
+    SQL-выражение числового значения поля payload и его параметры
+
+    Для полей с типизированной колонкой значение берется из нее, и JSON
+    разбирается только для строк, где колонка пуста. Вложенный CASE не дает
+    json_type разбирать payload, не являющийся JSON
+
+    Args:
+        path: JSON-путь поля
+        bare_number: Если поля нет, использовать сам payload, когда это число
+    """
+    fallback = (
+        "WHEN json_type(payload) IN ('integer', 'real') "
+        "THEN json_extract(payload, '$')"
+        if bare_number
+        else ""
+    )
+    expression = f"""
+        CASE WHEN json_valid(payload) THEN
+            CASE WHEN json_type(payload, ?) IN ('integer', 'real')
+                     THEN json_extract(payload, ?)
+                 {fallback}
+            END
+        END
+    """
+    column = TYPED_FIELD_PATHS.get(path)
+    if column is not None:
+        expression = f"COALESCE({column}, {expression})"
+    return expression, (path, path)
+
+
+def field_index_sql(path: str) -> str:
+    """
+    Индексируемое SQL-выражение поля payload в партиции (см. PAYLOAD_INDEXES)
+
+    Поле с типизированной колонкой - сама колонка, остальные - json_extract
+    по тексту payload партиции
+    """
+    column = TYPED_FIELD_PATHS.get(path)
+    if column is not None:
+        return column
+    return f"(CASE WHEN json_valid(payload) THEN json_extract(payload, '{path}') END)"
+
+
+def field_value_sql(path: str) -> str:
+    """
+    SQL-выражение поля payload для любой записи партиции, без индекса
+
+    Как numeric_value_sql, но значение любого типа JSON, а путь - литерал
+    """
+    payload = f"({PAYLOAD_SQL})"
+    value = (
+        f"(CASE WHEN json_valid({payload}) "
+        f"THEN json_extract({payload}, '{path}') END)"
+    )
+    column = TYPED_FIELD_PATHS.get(path)
+    if column is not None:
+        value = f"COALESCE({column}, {value})"
+    return value
+
+
+def record_json_sql(topic: str, raw_payload: bool = False) -> str:
+    """
+    SQL-выражение текста JSON-объекта записи {"id", "topic", "payload",
+    "timestamp"} по колонкам id, payload и timestamp (мс) выборки
+
+    Экранирования требуют только topic (SQL-выражение готового JSON-литерала)
+    и payload; id и время - цифры
+
+    Args:
+        raw_payload: Вставлять payload, являющийся JSON, как есть (вложенным
+            значением, а не экранированной строкой); прочие payload
+            остаются строками
+    """
+    payload = (
+        "CASE WHEN json_valid(payload) THEN payload ELSE json_quote(payload) END"
+        if raw_payload
+        else "json_quote(payload)"
+    )
+    return (
+        f"""'{{"id":' || id || ',"topic":' || {topic} || ',"payload":' || """
+        f"""{payload} || ',"timestamp":"' || {timestamp_sql()} || '"}}'"""
+    )
+
+
+def parse_topic_paths(spec: str) -> List[Tuple[str, str]]:
+    """
+    Разбирает "шаблон=путь,..." (PAYLOAD_INDEXES, ROLLUP_VALUE_PATHS) в пары
+    (шаблон топика в нижнем регистре, JSON-путь)
+
+    Raises:
+        ValueError: Элемент без шаблона или с некорректным JSON-путем
+    """
+    indexes = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        pattern, _, path = item.rpartition("=")
+        if not pattern or not FIELD_PATH_PATTERN.match(path):
+            raise ValueError(f"Invalid topic path {item!r}, expected pattern=$.path")
+        indexes.append((pattern.lower(), path))
+    return indexes
+
+
+def utc_now() -> str:
+    """Текущее время UTC в формате CURRENT_TIMESTAMP"""
+    return datetime.now(timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+def utc_now_ms() -> int:
+    """Текущее время - метка времени записи: миллисекунды Unix (UTC)"""
+    return time.time_ns() // 1_000_000
+
+
+def to_db_timestamp(value: datetime) -> int:
+    """Метка времени записи (мс Unix) для datetime; наивное время считается UTC"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - EPOCH) // timedelta(milliseconds=1)
+
+
+def format_timestamp(timestamp: int) -> str:
+    """Текст 'YYYY-MM-DD HH:MM:SS.fff' метки времени записи - для ответов API"""
+    moment = EPOCH + timedelta(milliseconds=timestamp)
+    return f"{moment.strftime(TIMESTAMP_FORMAT)}.{timestamp % 1000:03d}"
+
+
+def parse_timestamp(text: str) -> int:
+    """Метка времени записи из текста 'YYYY-MM-DD HH:MM:SS[.fff]' (UTC)"""
+    return to_db_timestamp(datetime.fromisoformat(text))
+
+
+def timestamp_day(timestamp: int) -> str:
+    """День 'YYYY-MM-DD' метки времени записи (ключ daily_stats)"""
+    return (EPOCH + timedelta(milliseconds=timestamp)).strftime("%Y-%m-%d")
+
+
+def timestamp_sql(column: str = "timestamp") -> str:
+    """SQL-выражение текста метки времени, как у format_timestamp"""
+    return (
+        f"strftime('{TIMESTAMP_FORMAT}', {column} / 1000, 'unixepoch') "
+        f"|| printf('.%03d', {column} % 1000)"
+    )
+
+
+def epoch_ms_sql(column: str) -> str:
+    """SQL-выражение: текст 'YYYY-MM-DD HH:MM:SS[.fff]' -> мс Unix (миграции)"""
+    return (
+        f"(CAST(strftime('%s', {column}) AS INTEGER) * 1000 "
+        f"+ CAST(substr(strftime('%f', {column}), 4) AS INTEGER))"
+    )
+
+
+def partition_for(timestamp: int) -> str:
+    """Имя партиции для метки времени записи"""
+    moment = EPOCH + timedelta(milliseconds=timestamp)
+    return f"{PARTITION_PREFIX}{moment.year:04d}{moment.month:02d}"
+
+
+def partition_bounds(partition: str) -> Tuple[int, int]:
+    """Границы партиции [start, end) - метки времени записей"""
+    year, month = int(partition[-6:-2]), int(partition[-2:])
+    start = to_db_timestamp(datetime(year, month, 1))
+    year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return start, to_db_timestamp(datetime(year, month, 1))
+
+
+class ConnectionManager:
+    """
+    Долгоживущие соединения SQLite, по одному на поток
+
+    Соединение открывается при первом обращении из потока и живет, пока жив
+    поток, поэтому кэш подготовленных выражений (cached_statements) реально
+    переиспользуется между запросами. Каждое соединение настраивается
+    PRAGMA-параметрами из config; сам режим WAL хранится в файле базы и
+    включается в DatabaseManager.init_database.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        read_only: bool = False,
+        functions: Optional[Dict[str, Tuple[int, Callable]]] = None,
+    ):
+        """
+        Args:
+            db_path: Путь к файлу базы данных
+            read_only: Открывать соединения только для чтения
+            functions: SQL-функции для каждого соединения: имя -> (число
+                аргументов, функция). Регистрируются как детерминированные
+        """
         self.db_path = db_path
-        # Глобальные переменные для батча
-        self.batch_buffer = []
-        self.batch_lock = RLock()
-        self.batch_timer = None
-        self.init_database()
+        self.read_only = read_only
+        self.functions = functions or {}
+        self._connections: Dict[Thread, sqlite3.Connection] = {}
+        self._lock = Lock()
 
-    def get_connection(self) -> sqlite3.Connection:
-        """Создает и возвращает соединение с базой данных"""
-        conn = sqlite3.connect(self.db_path)
+    def get(self) -> sqlite3.Connection:
+        """Возвращает соединение текущего потока, открывая его при необходимости"""
+        thread = current_thread()
+        conn = self._connections.get(thread)
+        if conn is None:
+            conn = self._connect()
+            with self._lock:
+                self._close_dead_threads()
+                self._connections[thread] = conn
+        return conn
+
+    def _connect(self) -> sqlite3.Connection:
+        database = self.db_path
+        if self.read_only:
+            # Соединение только для чтения: случайная запись из API невозможна
+            database = f"file:{pathname2url(os.path.abspath(self.db_path))}?mode=ro"
+        conn = sqlite3.connect(
+            database,
+            uri=self.read_only,
+            timeout=SQLITE_BUSY_TIMEOUT,
+            cached_statements=SQLITE_STATEMENT_CACHE_SIZE,
+            # Соединение используется только своим потоком, но закрыть его
+            # может close_all или уборка после завершения потока
+            check_same_thread=False,
+        )
         conn.row_factory = sqlite3.Row  # Это позволяет использовать row['column_name']
+        conn.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        for name, (arguments, function) in self.functions.items():
+            conn.create_function(name, arguments, function, deterministic=True)
         return conn
 
+    def _close_dead_threads(self) -> None:
+        """Закрывает соединения потоков, которые уже завершились"""
+        for thread in [t for t in self._connections if not t.is_alive()]:
+            self._connections.pop(thread).close()
+
+    def close_all(self) -> None:
+        """Закрывает все открытые соединения"""
+        with self._lock:
+            for conn in self._connections.values():
+                conn.close()
+            self._connections.clear()
+
+
+class DatabaseManager:
+    def __init__(self, db_path: str = DB_PATH, read_only: bool = False):
+        """
+        Args:
+            db_path: Путь к файлу базы данных
+            read_only: Открывать соединения только для чтения. Схема при этом
+                не создается и не мигрируется - это делает процесс-писатель
+        """
+        self.db_path = db_path
+        self.read_only = read_only
+        self.codec = PayloadCodec(db_path)
+        self.connections = ConnectionManager(
+            db_path, read_only, {"inflate_payload": (2, self.codec.inflate)}
+        )
+        # Кэш словаря топиков name -> id (id никогда не меняются)
+        self.topic_ids: Dict[str, int] = {}
+        # Хранилище payload (PAYLOAD_STORAGE=compressed): кэш hash -> (id,
+        # день last_seen), недавние новые payload для обучения словаря и
+        # число payload, сжатых с последнего обучения
+        self.payload_ids: "OrderedDict[bytes, Tuple[int, str]]" = OrderedDict()
+        self.payload_samples: deque = deque(maxlen=1024)
+        self.payloads_since_training = 0
+        # Индексы полей payload партиций: (шаблон топика, JSON-путь)
+        self.field_indexes = parse_topic_paths(PAYLOAD_INDEXES)
+        # Поля значений агрегатов: (шаблон топика, JSON-путь)
+        self.rollup_value_paths = parse_topic_paths(ROLLUP_VALUE_PATHS)
+        if not read_only:
+            self.init_database()
+
+    def get_connection(self) -> sqlite3.Connection:
+        """Возвращает долгоживущее соединение текущего потока"""
+        return self.connections.get()
+
+    def close(self) -> None:
+        """Закрывает все соединения с базой данных"""
+        self.connections.close_all()
+
     def init_database(self):
         """Инициализирует базу данных и создает таблицы"""
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
 
-                # Создаем таблицу для хранения данных сенсоров
+                # sensor_data - таблица (до версии 3) или представление
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sensor_data'")
+                fresh = cursor.fetchone() is None
+                if fresh:
+                    # Освобожденные при удалении партиций страницы возвращаются
+                    # ОС через PRAGMA incremental_vacuum (см. reclaim_space).
+                    # Включается только до создания первой таблицы
+                    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+                # WAL: читатели (mqtt_logs_api) не ждут писателя (mqtt_logger)
+                # и наоборот. Режим сохраняется в файле базы
+                cursor.execute("PRAGMA journal_mode = WAL")
+
+                legacy_layout = self._is_legacy_layout(cursor)
+                cursor.execute("PRAGMA user_version")
+                version = 0 if legacy_layout else cursor.fetchone()[0]
+
+                # Словарь и каталог топиков: каждая строка sensor_data хранит
+                # только topic_id, а счетчики обновляет insert_batch
+                cursor.execute(
+                    """
+                CREATE TABLE IF NOT EXISTS topics (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE,
+                    first_seen DATETIME,
+                    last_seen DATETIME,
+                    message_count INTEGER NOT NULL DEFAULT 0
+                )
+                """
+                )
+
+                # Служебное состояние приема (например, seq журнала IngestSpool),
+                # обновляется в той же транзакции, что и пачка данных
                 cursor.execute(
                     """
-                CREATE TABLE IF NOT EXISTS sensor_data (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    topic TEXT NOT NULL,
-                    payload TEXT NOT NULL,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+                CREATE TABLE IF NOT EXISTS ingest_state (
+                    key TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL
                 )
                 """
                 )
 
-                # Создаем индекс для быстрого поиска по времени
+                # Счетчики записей по дню и топику: обновляются insert_batch и
+                # очисткой, поэтому статистика не требует COUNT(*) по данным
                 cursor.execute(
                     """
-                CREATE INDEX IF NOT EXISTS idx_timestamp 
-                ON sensor_data(timestamp)
+                CREATE TABLE IF NOT EXISTS daily_stats (
+                    day TEXT NOT NULL,
+                    topic_id INTEGER NOT NULL REFERENCES topics(id),
+                    row_count INTEGER NOT NULL,
+                    first_timestamp DATETIME NOT NULL,
+                    last_timestamp DATETIME NOT NULL,
+                    PRIMARY KEY (day, topic_id)
+                ) WITHOUT ROWID
+                """
+                )
+
+                # Агрегаты по топику и интервалу: обновляются insert_batch
+                # и переживают удаление сырых данных
+                for table, _ in ROLLUPS.values():
+                    cursor.execute(
+                        f"""
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        topic_id INTEGER NOT NULL REFERENCES topics(id),
+                        bucket DATETIME NOT NULL,
+                        message_count INTEGER NOT NULL,
+                        value_count INTEGER NOT NULL,
+                        min_value REAL,
+                        max_value REAL,
+                        sum_value REAL,
+                        last_value REAL,
+                        last_timestamp DATETIME NOT NULL,
+                        PRIMARY KEY (topic_id, bucket)
+                    ) WITHOUT ROWID
+                    """
+                    )
+
+                # Последнее сообщение топика; commit_seq - номер пачки, в
+                # которой оно записано (по нему API дочитывает только изменения)
+                cursor.execute(
+                    """
+                CREATE TABLE IF NOT EXISTS latest_values (
+                    topic_id INTEGER PRIMARY KEY REFERENCES topics(id),
+                    record_id INTEGER NOT NULL,
+                    payload TEXT,
+                    timestamp DATETIME NOT NULL,
+                    commit_seq INTEGER NOT NULL
+                )
+                """
+                )
+                cursor.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_latest_values_commit_seq "
+                    "ON latest_values(commit_seq)"
+                )
+
+                # Словари сжатия payload; не меняются, удаляются неиспользуемые
+                cursor.execute(
+                    """
+                CREATE TABLE IF NOT EXISTS payload_dicts (
+                    id INTEGER PRIMARY KEY,
+                    created DATETIME NOT NULL,
+                    data BLOB NOT NULL
+                )
+                """
+                )
+
+                # Уникальные payload (PAYLOAD_STORAGE=compressed): сжатый текст
+                # и день последней записи, ссылающейся на него
+                cursor.execute(
+                    """
+                CREATE TABLE IF NOT EXISTS payloads (
+                    id INTEGER PRIMARY KEY,
+                    hash BLOB NOT NULL UNIQUE,
+                    dict_id INTEGER REFERENCES payload_dicts(id),
+                    data BLOB NOT NULL,
+                    last_seen TEXT NOT NULL
+                )
+                """
+                )
+                cursor.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_payloads_last_seen "
+                    "ON payloads(last_seen)"
+                )
+                self.codec.refresh(cursor)
+
+                if fresh:
+                    # Создаем партицию текущего месяца и представление sensor_data
+                    self._ensure_partition(cursor, partition_for(utc_now_ms()))
+                    version = SCHEMA_VERSION
+                    cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+                conn.commit()
+
+            self.migrate_schema(version)
+            self.sync_field_indexes()
+
+            logger.info("Database initialized successfully")
+
+        except sqlite3.Error as e:
+            logger.error(f"Database initialization error: {e}")
+            raise
+
+    def migrate_schema(self, version: int) -> None:
+        """Последовательно применяет миграции от version до SCHEMA_VERSION"""
+        if version < 9:
+            # Миграции 4-8 уже читают timestamp партиций как миллисекунды:
+            # текстовые метки переводятся до них (шаг 9 затем ничего не найдет)
+            self.migrate_epoch_timestamps()
+        if 3 <= version < 8:
+            # Миграции 5-6 читают типизированные колонки (numeric_value_sql) и
+            # payload_id (PAYLOAD_SQL), которые шаги 7-8 добавляют позже:
+            # колонки добавляются в существующие партиции заранее
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                self._add_partition_columns(cursor)
+        for target in range(version + 1, SCHEMA_VERSION + 1):
+            logger.info(f"Migrating database schema to version {target}")
+            getattr(self, MIGRATIONS[target])()
+            with self.get_connection() as conn:
+                conn.execute(f"PRAGMA user_version = {target}")
+
+    @staticmethod
+    def _create_sensor_data_table(cursor: sqlite3.Cursor, table: str) -> None:
+        cursor.execute(
+            f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            topic_id INTEGER NOT NULL REFERENCES topics(id),
+            payload TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+        )
+
+    @staticmethod
+    def _create_sensor_data_indexes(cursor: sqlite3.Cursor) -> None:
+        # Индекс для выборки "последние N по топику": поиск по topic_id и
+        # обход в порядке timestamp без сортировки - O(log n + limit)
+        cursor.execute(
+            """
+        CREATE INDEX IF NOT EXISTS idx_topic_timestamp
+        ON sensor_data(topic_id, timestamp)
+        """
+        )
+
+        # Создаем индекс для быстрого поиска по времени
+        cursor.execute(
+            """
+        CREATE INDEX IF NOT EXISTS idx_timestamp 
+        ON sensor_data(timestamp)
+        """
+        )
+
+    @staticmethod
+    def _is_legacy_layout(cursor: sqlite3.Cursor) -> bool:
+        """Проверяет, хранит ли sensor_data топик текстом (схема версии 0)"""
+        cursor.execute("PRAGMA table_info(sensor_data)")
+        columns = {row[1] for row in cursor.fetchall()}
+        return "topic" in columns and "topic_id" not in columns
+
+    def migrate_legacy_sensor_data(self) -> int:
+        """
+        Онлайн-миграция sensor_data(topic TEXT) в схему со словарем топиков
+
+        Строки копируются в sensor_data_v1 порциями по MIGRATION_CHUNK_SIZE,
+        каждая порция - отдельная короткая транзакция, поэтому логгер может
+        продолжать запись между порциями. Прогресс - MAX(id) новой таблицы,
+        так что прерванная миграция продолжается с того же места. В конце
+        хвост докопируется и таблицы подменяются в одной транзакции.
+
+        Returns:
+            int: Количество перенесенных записей
+        """
+        logger.info("Migrating sensor_data to the normalized topic layout")
+        migrated = 0
+        try:
+            while True:
+                with self.get_connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute("BEGIN IMMEDIATE")
+                    if not self._is_legacy_layout(cursor):
+                        # Миграцию уже завершил другой процесс
+                        conn.rollback()
+                        return migrated
+                    self._create_sensor_data_table(cursor, "sensor_data_v1")
+                    copied = self._copy_legacy_chunk(cursor)
+                    conn.commit()
+
+                migrated += copied
+                if copied < MIGRATION_CHUNK_SIZE:
+                    break
+                logger.info(f"Migrated {migrated} records")
+
+            # Финальный шаг: хвост, записанный во время миграции, и подмена таблиц
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                if not self._is_legacy_layout(cursor):
+                    conn.rollback()
+                    return migrated
+                while True:
+                    copied = self._copy_legacy_chunk(cursor)
+                    migrated += copied
+                    if copied < MIGRATION_CHUNK_SIZE:
+                        break
+                cursor.execute("DROP TABLE sensor_data")
+                cursor.execute("ALTER TABLE sensor_data_v1 RENAME TO sensor_data")
+                self._create_sensor_data_indexes(cursor)
+                cursor.execute("PRAGMA user_version = 1")
+                conn.commit()
+
+            logger.info(f"Migration finished, {migrated} records migrated")
+            return migrated
+
+        except sqlite3.Error as e:
+            logger.error(f"Migration error: {e}")
+            raise
+
+    def migrate_topic_catalog(self) -> None:
+        """
+        Добавляет в topics счетчики каталога и заполняет их по sensor_data
+
+        Каждый топик пересчитывается отдельной транзакцией по индексу
+        idx_topic_timestamp, поэтому запись не блокируется надолго
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("PRAGMA table_info(topics)")
+            columns = {row[1] for row in cursor.fetchall()}
+            for column, definition in (
+                ("first_seen", "DATETIME"),
+                ("last_seen", "DATETIME"),
+                ("message_count", "INTEGER NOT NULL DEFAULT 0"),
+            ):
+                if column not in columns:
+                    cursor.execute(
+                        f"ALTER TABLE topics ADD COLUMN {column} {definition}"
+                    )
+            conn.commit()
+
+            cursor.execute("SELECT id FROM topics")
+            topic_ids = [row[0] for row in cursor.fetchall()]
+
+        for topic_id in topic_ids:
+            with self.get_connection() as conn:
+                conn.execute(
+                    """
+                    UPDATE topics SET
+                        message_count = (
+                            SELECT COUNT(*) FROM sensor_data WHERE topic_id = :id
+                        ),
+                        first_seen = (
+                            SELECT MIN(timestamp) FROM sensor_data WHERE topic_id = :id
+                        ),
+                        last_seen = (
+                            SELECT MAX(timestamp) FROM sensor_data WHERE topic_id = :id
+                        )
+                    WHERE id = :id
+                    """,
+                    {"id": topic_id},
+                )
+
+    def migrate_to_partitions(self) -> int:
+        """
+        Онлайн-миграция таблицы sensor_data в помесячные партиции
+
+        Строки переносятся порциями по MIGRATION_CHUNK_SIZE (по возрастанию id),
+        каждая порция - отдельная транзакция; прогресс хранится в ingest_state.
+        В финальной транзакции докопируется хвост, таблица удаляется, а на ее
+        месте создается представление sensor_data над партициями.
+
+        Returns:
+            int: Количество перенесенных записей
+        """
+        logger.info("Migrating sensor_data to monthly partitions")
+        migrated = 0
+        try:
+            while True:
+                with self.get_connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute("BEGIN IMMEDIATE")
+                    if not self._is_unpartitioned(cursor):
+                        # Миграцию уже завершил другой процесс
+                        conn.rollback()
+                        return migrated
+                    copied = self._copy_partition_chunk(cursor)
+                    conn.commit()
+
+                migrated += copied
+                if copied == 0:
+                    break
+                logger.info(f"Migrated {migrated} records")
+
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                if not self._is_unpartitioned(cursor):
+                    conn.rollback()
+                    return migrated
+                while True:
+                    copied = self._copy_partition_chunk(cursor)
+                    migrated += copied
+                    if copied == 0:
+                        break
+
+                # Сквозная нумерация id продолжается после максимального id таблицы
+                cursor.execute(
+                    """
+                    SELECT MAX(
+                        COALESCE((SELECT MAX(id) FROM sensor_data), 0),
+                        COALESCE((SELECT seq FROM sqlite_sequence
+                                  WHERE name = 'sensor_data'), 0)
+                    )
+                    """
+                )
+                cursor.execute(
+                    "INSERT OR REPLACE INTO ingest_state (key, value) "
+                    "VALUES ('last_row_id', ?)",
+                    (cursor.fetchone()[0],),
+                )
+                cursor.execute(
+                    "DELETE FROM ingest_state WHERE key = 'partition_migration_id'"
+                )
+                cursor.execute("DROP TABLE sensor_data")
+                self._ensure_partition(cursor, partition_for(utc_now_ms()))
+                self._rebuild_sensor_data_view(cursor)
+                conn.commit()
+
+            logger.info(f"Partitioning finished, {migrated} records migrated")
+            return migrated
+
+        except sqlite3.Error as e:
+            logger.error(f"Migration error: {e}")
+            raise
+
+    def migrate_daily_stats(self) -> None:
+        """
+        Заполняет daily_stats по существующим данным
+
+        Каждый день пересчитывается отдельной транзакцией по индексу
+        timestamp; значения абсолютные, поэтому повторный запуск безопасен
+        """
+        for partition, day, start, end in self._partition_days():
+            with self.get_connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute(
+                    f"""
+                    INSERT OR REPLACE INTO daily_stats
+                        (day, topic_id, row_count, first_timestamp, last_timestamp)
+                    SELECT ?, topic_id, COUNT(*), {timestamp_sql("MIN(timestamp)")},
+                           {timestamp_sql("MAX(timestamp)")}
+                    FROM {partition}
+                    WHERE timestamp >= ? AND timestamp < ?
+                    GROUP BY topic_id
+                    """,
+                    (day, start, end),
+                )
+
+    def migrate_rollups(self) -> None:
+        """
+        Заполняет rollup_1m и rollup_1h по существующим данным
+
+        Как и migrate_daily_stats: по дню за транзакцию, значения абсолютные
+        """
+        for partition, _, start, end in self._partition_days():
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                for resolution in ROLLUPS:
+                    self._update_rollups(
+                        cursor,
+                        resolution,
+                        partition,
+                        "timestamp >= ? AND timestamp < ?",
+                        (start, end),
+                        replace=True,
+                    )
+
+    def migrate_latest_values(self) -> None:
+        """Заполняет latest_values последней записью каждого топика"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, name FROM topics")
+            topics = cursor.fetchall()
+
+        for topic_id, name in topics:
+            rows = self.get_sensor_data(name, 1)
+            if not rows:
+                continue
+            record_id, _, payload, timestamp = rows[0]
+            with self.get_connection() as conn:
+                conn.execute(
+                    """
+                    INSERT OR IGNORE INTO latest_values
+                        (topic_id, record_id, payload, timestamp, commit_seq)
+                    VALUES (?, ?, ?, ?, 0)
+                    """,
+                    (topic_id, record_id, payload, timestamp),
+                )
+
+    def migrate_typed_columns(self) -> None:
+        """
+        Добавляет колонки TYPED_COLUMNS в партиции и заполняет их по payload
+
+        ADD COLUMN меняет только схему. Значения переносятся для топиков, у
+        которых есть декодер, порциями по MIGRATION_CHUNK_SIZE id, каждая -
+        отдельной транзакцией; повторный запуск безопасен
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            partitions = self._add_partition_columns(cursor)
+            conn.commit()
+
+            cursor.execute("SELECT id, name FROM topics")
+            topic_ids = [
+                topic_id
+                for topic_id, name in cursor.fetchall()
+                if decoder_registry.decoder_for(name) is not None
+            ]
+        if not topic_ids:
+            return
+
+        assignments = []
+        params: list = []
+        for path, column in TYPED_FIELD_PATHS.items():
+            value, value_params = numeric_value_sql(path)
+            assignments.append(f"{column} = {value}")
+            params.extend(value_params)
+        placeholders = ", ".join("?" * len(topic_ids))
+
+        for partition in partitions:
+            last_id = 0
+            while True:
+                with self.get_connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute("BEGIN IMMEDIATE")
+                    cursor.execute(
+                        f"""
+                        SELECT MAX(id) FROM (
+                            SELECT id FROM {partition} WHERE id > ? ORDER BY id LIMIT ?
+                        )
+                        """,
+                        (last_id, MIGRATION_CHUNK_SIZE),
+                    )
+                    high_id = cursor.fetchone()[0]
+                    if high_id is None:
+                        break
+                    cursor.execute(
+                        f"""
+                        UPDATE {partition} SET {", ".join(assignments)}
+                        WHERE id > ? AND id <= ? AND topic_id IN ({placeholders})
+                        """,
+                        (*params, last_id, high_id, *topic_ids),
+                    )
+                    last_id = high_id
+
+    def migrate_payload_store(self) -> None:
+        """
+        Добавляет в партиции ссылку payload_id на таблицу payloads
+
+        Существующие записи остаются с текстом в payload: ссылку получают
+        только новые записи в режиме PAYLOAD_STORAGE=compressed
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            self._add_partition_columns(cursor)
+            conn.commit()
+
+    def migrate_epoch_timestamps(self) -> None:
+        """
+        Переводит timestamp партиций из текста 'YYYY-MM-DD HH:MM:SS' в
+        миллисекунды Unix
+
+        В SQLite любое число меньше любого текста, поэтому непереведенные
+        строки - это диапазон timestamp >= '' индекса по timestamp. Строки
+        переводятся порциями по MIGRATION_CHUNK_SIZE, каждая - отдельной
+        транзакцией; повторный запуск безопасен. Объявленный тип DATETIME
+        старых партиций остается: у него числовое сродство, и целые
+        хранятся как есть
+        """
+        with self.get_connection() as conn:
+            partitions = self.list_partitions(conn.cursor())
+
+        for partition in partitions:
+            converted = 0
+            while True:
+                with self.get_connection() as conn:
+                    cursor = conn.cursor()
+                    cursor.execute("BEGIN IMMEDIATE")
+                    cursor.execute(
+                        f"""
+                        UPDATE {partition} SET timestamp = {epoch_ms_sql("timestamp")}
+                        WHERE id IN (
+                            SELECT id FROM {partition} WHERE timestamp >= '' LIMIT ?
+                        )
+                        """,
+                        (MIGRATION_CHUNK_SIZE,),
+                    )
+                    chunk = cursor.rowcount
+                converted += chunk
+                if chunk < MIGRATION_CHUNK_SIZE:
+                    break
+                logger.info(f"Converted {converted} timestamps in {partition}")
+            if converted:
+                logger.info(f"Converted {converted} timestamps in {partition}")
+
+    def _add_partition_columns(self, cursor: sqlite3.Cursor) -> List[str]:
+        """
+        Добавляет недостающие PARTITION_EXTRA_COLUMNS во все партиции
+
+        ADD COLUMN меняет только схему. Представление пересоздается, так как
+        ссылается на новые колонки
+
+        Returns:
+            list: Имена партиций
+        """
+        partitions = self.list_partitions(cursor)
+        for partition in partitions:
+            cursor.execute(f"PRAGMA table_info({partition})")
+            existing = {row[1] for row in cursor.fetchall()}
+            for column, column_type in PARTITION_EXTRA_COLUMNS.items():
+                if column not in existing:
+                    cursor.execute(
+                        f"ALTER TABLE {partition} ADD COLUMN {column} {column_type}"
+                    )
+        self._rebuild_sensor_data_view(cursor)
+        return partitions
+
+    def _partition_days(self) -> Iterator[Tuple[str, str, int, int]]:
+        """Дни всех партиций: (партиция, день, начало дня, начало следующего)"""
+        with self.get_connection() as conn:
+            partitions = self.list_partitions(conn.cursor())
+
+        for partition in partitions:
+            start, end = partition_bounds(partition)
+            for day_start in range(start, end, DAY_MS):
+                yield partition, timestamp_day(day_start), day_start, day_start + DAY_MS
+
+    @staticmethod
+    def _is_unpartitioned(cursor: sqlite3.Cursor) -> bool:
+        """Проверяет, является ли sensor_data таблицей (схема до версии 3)"""
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sensor_data'"
+        )
+        return cursor.fetchone() is not None
+
+    def _copy_partition_chunk(self, cursor: sqlite3.Cursor) -> int:
+        """Переносит очередную порцию строк таблицы sensor_data в партиции"""
+        cursor.execute(
+            "SELECT value FROM ingest_state WHERE key = 'partition_migration_id'"
+        )
+        row = cursor.fetchone()
+        last_id = row[0] if row else 0
+
+        cursor.execute(
+            """
+            SELECT MAX(id) FROM (
+                SELECT id FROM sensor_data WHERE id > ? ORDER BY id LIMIT ?
+            )
+            """,
+            (last_id, MIGRATION_CHUNK_SIZE),
+        )
+        high_id = cursor.fetchone()[0]
+        if high_id is None:
+            return 0
+
+        cursor.execute(
+            """
+            SELECT DISTINCT substr(timestamp, 1, 7) FROM sensor_data
+            WHERE id > ? AND id <= ?
+            """,
+            (last_id, high_id),
+        )
+        copied = 0
+        for (month,) in cursor.fetchall():
+            # Таблица хранит время текстом: в партицию - миллисекунды
+            partition = f"{PARTITION_PREFIX}{month[:4]}{month[5:7]}"
+            self._ensure_partition(cursor, partition, rebuild_view=False)
+            cursor.execute(
+                f"""
+                INSERT INTO {partition} (id, topic_id, payload, timestamp)
+                SELECT id, topic_id, payload, {epoch_ms_sql("timestamp")}
+                FROM sensor_data
+                WHERE id > ? AND id <= ? AND substr(timestamp, 1, 7) = ?
+                """,
+                (last_id, high_id, month),
+            )
+            copied += cursor.rowcount
+
+        cursor.execute(
+            "INSERT OR REPLACE INTO ingest_state (key, value) "
+            "VALUES ('partition_migration_id', ?)",
+            (high_id,),
+        )
+        return copied
+
+    @staticmethod
+    def list_partitions(cursor: sqlite3.Cursor) -> List[str]:
+        """Имена партиций по возрастанию месяца"""
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ? "
+            "ORDER BY name",
+            (PARTITION_GLOB,),
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+    def _partitions_between(
+        self, cursor: sqlite3.Cursor, lower: Optional[int], upper: Optional[int]
+    ) -> List[str]:
+        """Партиции, пересекающиеся с [lower, upper], по возрастанию месяца"""
+        partitions = []
+        for partition in self.list_partitions(cursor):
+            start, end = partition_bounds(partition)
+            if (lower is None or end > lower) and (upper is None or start <= upper):
+                partitions.append(partition)
+        return partitions
+
+    def _ensure_partition(
+        self, cursor: sqlite3.Cursor, partition: str, rebuild_view: bool = True
+    ) -> None:
+        """Создает партицию, если ее еще нет, и включает ее в sensor_data"""
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+            (partition,),
+        )
+        if cursor.fetchone() is not None:
+            return
+
+        logger.info(f"Creating partition {partition}")
+        # id назначает insert_batch из сквозного счетчика last_row_id,
+        # поэтому id уникальны и возрастают во всех партициях сразу;
+        # timestamp - время приема в миллисекундах Unix
+        cursor.execute(
+            f"""
+        CREATE TABLE {partition} (
+            id INTEGER PRIMARY KEY,
+            topic_id INTEGER NOT NULL REFERENCES topics(id),
+            payload TEXT NOT NULL,
+            timestamp INTEGER NOT NULL,
+            sensor_id INTEGER,
+            voltage REAL,
+            payload_id INTEGER REFERENCES payloads(id)
+        )
+        """
+        )
+        # Выборка "последние N по топику": поиск по topic_id и обход в порядке
+        # timestamp без сортировки - O(log n + limit) в каждой партиции
+        cursor.execute(
+            f"CREATE INDEX idx_{partition}_topic_timestamp "
+            f"ON {partition}(topic_id, timestamp)"
+        )
+        cursor.execute(
+            f"CREATE INDEX idx_{partition}_timestamp ON {partition}(timestamp)"
+        )
+        self._create_field_indexes(cursor, partition)
+        if rebuild_view:
+            self._rebuild_sensor_data_view(cursor)
+
+    def _field_index_names(self, partition: str) -> Dict[str, str]:
+        """Имена индексов полей PAYLOAD_INDEXES в партиции: имя -> JSON-путь"""
+        return {
+            f"idx_{partition}_field_{hashlib.sha1(path.encode()).hexdigest()[:10]}": path
+            for path in sorted({path for _, path in self.field_indexes})
+        }
+
+    def _create_field_indexes(self, cursor: sqlite3.Cursor, partition: str) -> None:
+        """
+        Создает недостающие индексы полей payload в партиции
+
+        Индекс частичный (только записи, где поле есть): строки без поля не
+        занимают места, а фильтр по полю находит записи топика через индекс
+        (topic_id, поле, timestamp) вместо чтения всех записей диапазона
+        """
+        for name, path in self._field_index_names(partition).items():
+            expression = field_index_sql(path)
+            cursor.execute(
+                f"""
+                CREATE INDEX IF NOT EXISTS {name}
+                ON {partition}(topic_id, {expression}, timestamp)
+                WHERE {expression} IS NOT NULL
+                """
+            )
+
+    def sync_field_indexes(self) -> None:
+        """
+        Приводит индексы полей payload всех партиций к PAYLOAD_INDEXES
+
+        Недостающие индексы создаются (в том числе в старых партициях, что на
+        большой базе занимает время), а индексы полей, убранных из настройки,
+        удаляются
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                for partition in self.list_partitions(cursor):
+                    wanted = self._field_index_names(partition)
+                    cursor.execute(
+                        "SELECT name FROM sqlite_master "
+                        "WHERE type = 'index' AND tbl_name = ? AND name GLOB ?",
+                        (partition, f"idx_{partition}_field_*"),
+                    )
+                    existing = {row[0] for row in cursor.fetchall()}
+                    for name in existing - set(wanted):
+                        logger.info(f"Dropping payload field index {name}")
+                        cursor.execute(f"DROP INDEX {name}")
+                    for name in set(wanted) - existing:
+                        logger.info(
+                            f"Creating payload field index {name} ({wanted[name]})"
+                        )
+                    self._create_field_indexes(cursor, partition)
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error syncing payload field indexes: {e}")
+
+    def _field_filter_sql(self, topic: str, path: str) -> str:
+        """
+        SQL-выражение поля для фильтра записей топика
+
+        Если поле топика индексировано (см. PAYLOAD_INDEXES), выражение
+        совпадает с выражением индекса, и SQLite ищет по индексу. Выражение
+        json_extract индекса читает колонку payload, поэтому годится только
+        при PAYLOAD_STORAGE=text; иначе поле разбирается из текста payload
+        каждой записи диапазона
+        """
+        if path in TYPED_FIELD_PATHS or PAYLOAD_STORAGE == "text":
+            name = topic.lower()
+            for pattern, indexed in self.field_indexes:
+                if indexed == path and fnmatchcase(name, pattern):
+                    return field_index_sql(path)
+        return field_value_sql(path)
+
+    def _rebuild_sensor_data_view(self, cursor: sqlite3.Cursor) -> None:
+        """
+        Пересоздает представление sensor_data как UNION ALL всех партиций
+
+        SQLite переносит условия WHERE в каждую ветку и для ORDER BY ... LIMIT
+        сливает упорядоченные по индексам ветки (MERGE), поэтому запросы к
+        sensor_data работают через индексы партиций без изменений. Колонка
+        payload представления - всегда текст (см. PAYLOAD_SQL)
+        """
+        partitions = self.list_partitions(cursor)
+        cursor.execute("DROP VIEW IF EXISTS sensor_data")
+        cursor.execute(
+            "CREATE VIEW sensor_data AS "
+            + " UNION ALL ".join(
+                f"SELECT id, topic_id, {PAYLOAD_SQL} AS payload, timestamp, "
+                f"{', '.join(TYPED_COLUMNS)} FROM {partition}"
+                for partition in partitions
+            )
+        )
+
+    def drop_partition(self, partition: str) -> None:
+        """Удаляет партицию целиком и исключает ее из sensor_data"""
+        if partition == partition_for(utc_now_ms()):
+            # В текущую партицию пишет логгер, и представлению
+            # нужна хотя бы одна ветка
+            raise ValueError(f"Refusing to drop the current partition {partition}")
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(f"DROP TABLE IF EXISTS {partition}")
+            self._rebuild_sensor_data_view(cursor)
+            self._increment_state(cursor, "purge_seq")
+            start, end = partition_bounds(partition)
+            days = (timestamp_day(start), timestamp_day(end))
+            # Счетчики каталога топиков уменьшаются на записи партиции по
+            # daily_stats, не читая саму партицию
+            cursor.execute(
                 """
+                UPDATE topics SET message_count = message_count - (
+                    SELECT SUM(row_count) FROM daily_stats
+                    WHERE topic_id = topics.id AND day >= ? AND day < ?
+                )
+                WHERE id IN (
+                    SELECT topic_id FROM daily_stats WHERE day >= ? AND day < ?
                 )
+                """,
+                days * 2,
+            )
+            cursor.execute("DELETE FROM daily_stats WHERE day >= ? AND day < ?", days)
+            conn.commit()
+        logger.info(f"Dropped partition {partition}")
+
+    @staticmethod
+    def _copy_legacy_chunk(cursor: sqlite3.Cursor) -> int:
+        """Переносит очередную порцию строк из старой sensor_data в sensor_data_v1"""
+        cursor.execute("SELECT COALESCE(MAX(id), 0) FROM sensor_data_v1")
+        last_id = cursor.fetchone()[0]
+
+        cursor.execute(
+            """
+            INSERT OR IGNORE INTO topics (name)
+            SELECT DISTINCT topic FROM (
+                SELECT topic FROM sensor_data WHERE id > ? ORDER BY id LIMIT ?
+            )
+            """,
+            (last_id, MIGRATION_CHUNK_SIZE),
+        )
+        cursor.execute(
+            """
+            INSERT INTO sensor_data_v1 (id, topic_id, payload, timestamp)
+            SELECT s.id, t.id, s.payload, s.timestamp
+            FROM sensor_data s JOIN topics t ON t.name = s.topic
+            WHERE s.id > ?
+            ORDER BY s.id
+            LIMIT ?
+            """,
+            (last_id, MIGRATION_CHUNK_SIZE),
+        )
+        return cursor.rowcount
+
+    def _resolve_topic_ids(
+        self, cursor: sqlite3.Cursor, names: Iterable[str]
+    ) -> Dict[str, int]:
+        """
+        Возвращает id топиков, добавляя отсутствующие в словарь
+
+        Новые id не попадают в кэш до коммита вызывающей транзакции:
+        после отката они могут достаться другому топику.
+        """
+        resolved = {}
+        for name in names:
+            topic_id = self.topic_ids.get(name)
+            if topic_id is None:
+                cursor.execute(
+                    "INSERT OR IGNORE INTO topics (name) VALUES (?)", (name,)
+                )
+                if cursor.rowcount:
+                    # Появился новый топик: список топиков изменился
+                    self._increment_state(cursor, "catalog_version")
+                cursor.execute("SELECT id FROM topics WHERE name = ?", (name,))
+                topic_id = cursor.fetchone()[0]
+            resolved[name] = topic_id
+        return resolved
+
+    @staticmethod
+    def _increment_state(cursor: sqlite3.Cursor, key: str) -> int:
+        """Увеличивает счетчик в ingest_state на единицу и возвращает его"""
+        cursor.execute(
+            """
+            INSERT INTO ingest_state (key, value) VALUES (?, 1)
+            ON CONFLICT(key) DO UPDATE SET value = value + 1
+            RETURNING value
+            """,
+            (key,),
+        )
+        return cursor.fetchone()[0]
+
+    def _lookup_topic_id(self, cursor: sqlite3.Cursor, name: str) -> Optional[int]:
+        """Возвращает id топика или None, если такого топика нет"""
+        topic_id = self.topic_ids.get(name)
+        if topic_id is None:
+            cursor.execute("SELECT id FROM topics WHERE name = ?", (name,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            topic_id = self.topic_ids[name] = row[0]
+        return topic_id
+
+    @staticmethod
+    def prepare_sensor_record(topic: str, payload: str) -> Tuple[str, str]:
+        """
+        Декодирует одну запись (topic, payload) так же, как insert_batch
+
+        insert_batch декодирует пачки сам, отдельный вызов не нужен
+        """
+        decoded_topic, decoded_payload, _, _ = decoder_registry.decode_batch(
+            [(topic, payload)]
+        )[0]
+        return decoded_topic, decoded_payload
+
+    def insert_batch(
+        self,
+        records: List[Record],
+        spool_seq: Optional[int] = None,
+        received: Optional[List[int]] = None,
+    ) -> bool:
+        """
+        Вставляет пачку записей (topic, payload) одной транзакцией
+
+        Перед вставкой пачка декодируется реестром shared.decoders: топик и
+        payload могут измениться, а sensor_id и voltage попадают в колонки
+
+        Args:
+            records: Принятые сообщения (topic, payload)
+            spool_seq: Номер последней записи пачки в журнале IngestSpool.
+                Сохраняется в той же транзакции, что и данные
+            received: Время приема каждой записи, мс Unix (UTC); None - сейчас
+
+        Returns:
+            bool: True, если пачка закоммичена. При ошибке записи не теряются -
+            повторной вставкой занимается вызывающий код (BatchWriter)
+        """
+        return self.insert_decoded(
+            decoder_registry.decode_batch(records), spool_seq, received
+        )
+
+    def insert_decoded(
+        self,
+        decoded: List[DecodedRecord],
+        spool_seq: Optional[int] = None,
+        received: Optional[List[int]] = None,
+    ) -> bool:
+        """
+        Вставляет уже декодированную пачку одной транзакцией (см. insert_batch)
+
+        Метка времени записи - время приема сообщения, а не коммита пачки,
+        поэтому записи пачки могут попасть в разные дни и партиции. В режиме
+        PAYLOAD_STORAGE=compressed payload сохраняются в payloads (см.
+        _store_payloads), а партиция хранит только ссылку на него
+
+        Args:
+            received: Время приема каждой записи, мс Unix (UTC); None - сейчас
+        """
+        if not decoded and spool_seq is None:
+            return True
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                topic_ids = self._resolve_topic_ids(
+                    cursor, {record[0] for record in decoded}
+                )
+                if received is None:
+                    received = [utc_now_ms()] * len(decoded)
+                first_id = self._allocate_ids(cursor, len(decoded))
+                rows = [
+                    (
+                        first_id + offset,
+                        topic_ids[topic],
+                        payload,
+                        timestamp,
+                        sensor_id,
+                        voltage,
+                    )
+                    for offset, ((topic, payload, sensor_id, voltage), timestamp) in (
+                        enumerate(zip(decoded, received))
+                    )
+                ]
+                partitions: Dict[str, list] = {}
+                for row in rows:
+                    partitions.setdefault(partition_for(row[3]), []).append(row)
+                for partition in partitions:
+                    self._ensure_partition(cursor, partition)
+
+                compressed = PAYLOAD_STORAGE == "compressed"
+                if compressed:
+                    # last_seen payload - день самой поздней записи пачки
+                    payload_ids, pending = self._store_payloads(
+                        cursor,
+                        [record[1] for record in decoded],
+                        timestamp_day(max(received, default=utc_now_ms())),
+                    )
+                    for partition, partition_rows in partitions.items():
+                        cursor.executemany(
+                            f"""
+                            INSERT INTO {partition} (id, topic_id, payload, timestamp,
+                                                     sensor_id, voltage, payload_id)
+                            VALUES (?, ?, '', ?, ?, ?, ?)
+                            """,
+                            [
+                                (
+                                    record_id,
+                                    topic_id,
+                                    timestamp,
+                                    sensor_id,
+                                    voltage,
+                                    payload_ids[record_id - first_id],
+                                )
+                                for (
+                                    record_id,
+                                    topic_id,
+                                    _,
+                                    timestamp,
+                                    sensor_id,
+                                    voltage,
+                                ) in partition_rows
+                            ],
+                        )
+                    # Агрегатам нужен текст payload: считаем их по временной
+                    # копии пачки, а не распаковкой только что сжатого
+                    cursor.execute(
+                        """
+                        CREATE TEMP TABLE IF NOT EXISTS batch_payloads (
+                            id INTEGER PRIMARY KEY,
+                            topic_id INTEGER,
+                            payload TEXT,
+                            timestamp INTEGER,
+                            sensor_id INTEGER,
+                            voltage REAL
+                        )
+                        """
+                    )
+                    cursor.execute("DELETE FROM temp.batch_payloads")
+                    cursor.executemany(
+                        "INSERT INTO temp.batch_payloads VALUES (?, ?, ?, ?, ?, ?)",
+                        rows,
+                    )
+                else:
+                    for partition, partition_rows in partitions.items():
+                        cursor.executemany(
+                            f"""
+                            INSERT INTO {partition}
+                                (id, topic_id, payload, timestamp, sensor_id, voltage)
+                            VALUES (?, ?, ?, ?, ?, ?)
+                            """,
+                            partition_rows,
+                        )
+
+                # Счетчики по топику и по дню с топиком: (число, первая, последняя)
+                topic_counts: Dict[int, list] = {}
+                day_counts: Dict[Tuple[int, int], list] = {}
+                for _, topic_id, _, timestamp, _, _ in rows:
+                    for counts, key in (
+                        (topic_counts, topic_id),
+                        (day_counts, (timestamp // DAY_MS, topic_id)),
+                    ):
+                        if key in counts:
+                            entry = counts[key]
+                            entry[0] += 1
+                            entry[1] = min(entry[1], timestamp)
+                            entry[2] = max(entry[2], timestamp)
+                        else:
+                            counts[key] = [1, timestamp, timestamp]
+                # Каталог топиков: счетчики и время первого и последнего
+                # сообщения. Пачки из файла переполнения и журнала приходят
+                # позже более новых записей, поэтому границы только расширяются
+                cursor.executemany(
+                    """
+                    UPDATE topics SET
+                        message_count = message_count + ?,
+                        first_seen = MIN(COALESCE(first_seen, ?), ?),
+                        last_seen = MAX(COALESCE(last_seen, ''), ?)
+                    WHERE id = ?
+                    """,
+                    [
+                        (
+                            count,
+                            format_timestamp(first),
+                            format_timestamp(first),
+                            format_timestamp(last),
+                            key,
+                        )
+                        for key, (count, first, last) in topic_counts.items()
+                    ],
+                )
+                # Счетчики статистики за дни записей пачки
+                cursor.executemany(
+                    """
+                    INSERT INTO daily_stats
+                        (day, topic_id, row_count, first_timestamp, last_timestamp)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(day, topic_id) DO UPDATE SET
+                        row_count = row_count + excluded.row_count,
+                        first_timestamp = MIN(first_timestamp, excluded.first_timestamp),
+                        last_timestamp = MAX(last_timestamp, excluded.last_timestamp)
+                    """,
+                    [
+                        (
+                            timestamp_day(first),
+                            topic_id,
+                            count,
+                            format_timestamp(first),
+                            format_timestamp(last),
+                        )
+                        for (_, topic_id), (count, first, last) in day_counts.items()
+                    ],
+                )
+                # Агрегаты: интервалы считаются по меткам времени записей
+                for resolution in ROLLUPS:
+                    if compressed:
+                        self._update_rollups(
+                            cursor, resolution, "temp.batch_payloads", "1", ()
+                        )
+                        continue
+                    for partition in partitions:
+                        self._update_rollups(
+                            cursor,
+                            resolution,
+                            partition,
+                            "id BETWEEN ? AND ?",
+                            (first_id, first_id + len(decoded) - 1),
+                        )
+                # Номер коммита: по нему читатели узнают об изменениях
+                commit_seq = self._increment_state(cursor, "commit_seq")
+                # Последнее по времени приема сообщение каждого топика пачки;
+                # сохраненное значение заменяется, только если оно не новее.
+                # commit_seq - номер последней пачки с записями топика
+                # (get_topic_versions) - обновляется всегда
+                latest: Dict[int, tuple] = {}
+                for row in rows:
+                    current = latest.get(row[1])
+                    if current is None or row[3] >= current[3]:
+                        latest[row[1]] = row
+                cursor.executemany(
+                    """
+                    INSERT INTO latest_values
+                        (topic_id, record_id, payload, timestamp, commit_seq)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(topic_id) DO UPDATE SET
+                        record_id = CASE WHEN excluded.timestamp >= timestamp
+                            THEN excluded.record_id ELSE record_id END,
+                        payload = CASE WHEN excluded.timestamp >= timestamp
+                            THEN excluded.payload ELSE payload END,
+                        timestamp = MAX(timestamp, excluded.timestamp),
+                        commit_seq = excluded.commit_seq
+                    """,
+                    [
+                        (
+                            topic_id,
+                            record_id,
+                            payload,
+                            format_timestamp(timestamp),
+                            commit_seq,
+                        )
+                        for topic_id, (record_id, _, payload, timestamp, _, _) in (
+                            latest.items()
+                        )
+                    ],
+                )
+                if spool_seq is not None:
+                    cursor.execute(
+                        """
+                        INSERT INTO ingest_state (key, value) VALUES ('spool_seq', ?)
+                        ON CONFLICT(key) DO UPDATE SET value = MAX(value, excluded.value)
+                        """,
+                        (spool_seq,),
+                    )
+                conn.commit()
+                self.topic_ids.update(topic_ids)
+                if compressed:
+                    self._remember_payloads(*pending)
+                logger.debug(f"Data of len {len(decoded)} inserted")
+                return True
+
+        except sqlite3.Error as e:
+            logger.error(f"Error inserting data: {e}")
+            return False
+
+    def _store_payloads(
+        self, cursor: sqlite3.Cursor, payloads: List[str], day: str
+    ) -> Tuple[List[int], tuple]:
+        """
+        Сохраняет уникальные payload пачки в payloads и возвращает их id
+
+        Одинаковые payload хранятся один раз (ключ - hash): известные берутся
+        из кэша payload_ids или находятся по hash, им обновляется last_seen.
+        last_seen только растет: пачка из журнала или файла переполнения
+        бывает старше уже записанных, а payload нужен самой новой записи.
+        Новые сжимаются текущим словарем; словарь обучается заново на
+        недавних новых payload после PAYLOAD_DICT_RETRAIN сжатых, а первый -
+        как только их наберется на PAYLOAD_DICT_SIZE байт. Кэш и кодек
+        обновляются только после коммита (_remember_payloads)
+
+        Returns:
+            tuple: id для каждого payload и аргументы _remember_payloads
+        """
+        stored: Dict[bytes, Tuple[int, str]] = {}
+        new: Dict[bytes, str] = {}
+        for payload in payloads:
+            digest = payload_hash(payload)
+            if digest in stored or digest in new:
+                continue
+            cached = self.payload_ids.get(digest)
+            if cached is not None and cached[1] >= day:
+                stored[digest] = cached
+                continue
+            if cached is not None:
+                # Запись могла быть удалена очисткой - тогда вставим заново
+                cursor.execute(
+                    "UPDATE payloads SET last_seen = MAX(last_seen, ?) WHERE id = ? "
+                    "RETURNING id, last_seen",
+                    (day, cached[0]),
+                )
+                row = cursor.fetchone()
+                if row is not None:
+                    stored[digest] = tuple(row)
+                    continue
+            cursor.execute(
+                "UPDATE payloads SET last_seen = MAX(last_seen, ?) WHERE hash = ? "
+                "RETURNING id, last_seen",
+                (day, digest),
+            )
+            row = cursor.fetchone()
+            if row is not None:
+                stored[digest] = tuple(row)
+            else:
+                new[digest] = payload
+
+        dictionary = None
+        if new:
+            self.payload_samples.extend(new.values())
+            if self.payloads_since_training + len(new) >= PAYLOAD_DICT_RETRAIN or (
+                self.codec.current is None
+                and sum(map(len, self.payload_samples)) >= PAYLOAD_DICT_SIZE
+            ):
+                data = train_dictionary(self.payload_samples)
+                cursor.execute(
+                    "INSERT INTO payload_dicts (created, data) VALUES (?, ?) "
+                    "RETURNING id",
+                    (utc_now(), data),
+                )
+                dictionary = (cursor.fetchone()[0], data)
+            dict_id = dictionary[0] if dictionary else self.codec.current
+            for digest, payload in new.items():
+                cursor.execute(
+                    """
+                    INSERT INTO payloads (hash, dict_id, data, last_seen)
+                    VALUES (?, ?, ?, ?)
+                    RETURNING id
+                    """,
+                    (
+                        digest,
+                        dict_id,
+                        self.codec.compress(
+                            payload, dict_id, dictionary[1] if dictionary else None
+                        ),
+                        day,
+                    ),
+                )
+                stored[digest] = (cursor.fetchone()[0], day)
+
+        payload_ids = [stored[payload_hash(payload)][0] for payload in payloads]
+        return payload_ids, (stored, len(new), dictionary)
+
+    def _remember_payloads(
+        self,
+        stored: Dict[bytes, Tuple[int, str]],
+        new_count: int,
+        dictionary: Optional[Tuple[int, bytes]],
+    ) -> None:
+        """
+        Обновляет кэш payload_ids и словари кодека после коммита пачки
+
+        Args:
+            stored: Сохраненные payload пачки: hash -> (id, день last_seen)
+            new_count: Сколько из них сжато впервые
+            dictionary: Обученный в пачке словарь (id, байты) или None
+        """
+        for digest, value in stored.items():
+            cached = self.payload_ids.get(digest)
+            # Более поздний день того же payload в кэше не заменяется
+            if cached is None or cached[0] != value[0] or value[1] >= cached[1]:
+                self.payload_ids[digest] = value
+            self.payload_ids.move_to_end(digest)
+        while len(self.payload_ids) > PAYLOAD_CACHE_SIZE:
+            self.payload_ids.popitem(last=False)
+        if dictionary is not None:
+            self.codec.add(*dictionary)
+            self.payloads_since_training = new_count
+        else:
+            self.payloads_since_training += new_count
+
+    def _rollup_value_sql(self) -> Tuple[str, tuple]:
+        """
+        SQL-выражение значения записи для агрегатов и его параметры
+
+        Поле выбирается по топику: первый совпавший шаблон ROLLUP_VALUE_PATHS,
+        иначе ROLLUP_VALUE_PATH. Шаблон сравнивается с именем топика в
+        SQLite (GLOB по имени в нижнем регистре); подзапрос id топиков
+        шаблона не зависит от строки и выполняется один раз на запрос
+        """
+        value, params = numeric_value_sql(ROLLUP_VALUE_PATH, bare_number=True)
+        if not self.rollup_value_paths:
+            return value, params
+        branches, branch_params = [], []
+        for pattern, path in self.rollup_value_paths:
+            path_value, path_params = numeric_value_sql(path, bare_number=True)
+            branches.append(
+                "WHEN topic_id IN (SELECT id FROM topics WHERE lower(name) GLOB ?) "
+                f"THEN {path_value}"
+            )
+            branch_params.extend((pattern, *path_params))
+        return (
+            f"CASE {' '.join(branches)} ELSE {value} END",
+            (*branch_params, *params),
+        )
+
+    def _update_rollups(
+        self,
+        cursor: sqlite3.Cursor,
+        resolution: str,
+        partition: str,
+        condition: str,
+        params: tuple,
+        replace: bool = False,
+    ) -> None:
+        """
+        Добавляет в агрегаты разрешения resolution записи партиции по условию
+
+        Значение записи - числовое поле топика (ROLLUP_VALUE_PATHS или
+        ROLLUP_VALUE_PATH) либо сам payload, если это число; JSON разбирается
+        в SQLite, а не в Python. Вместо
+        партиции можно передать таблицу с теми же колонками (temp.batch_payloads)
+
+        Args:
+            replace: Заменить интервалы, а не прибавить к ним (пересчет
+                по полным данным при миграции)
+        """
+        table, bucket_format = ROLLUPS[resolution]
+        bucket = f"strftime('{bucket_format}', timestamp / 1000, 'unixepoch')"
+        value, value_params = self._rollup_value_sql()
+        if replace:
+            conflict = ""
+        else:
+            conflict = """
+            ON CONFLICT(topic_id, bucket) DO UPDATE SET
+                message_count = message_count + excluded.message_count,
+                value_count = value_count + excluded.value_count,
+                min_value = MIN(
+                    COALESCE(min_value, excluded.min_value),
+                    COALESCE(excluded.min_value, min_value)
+                ),
+                max_value = MAX(
+                    COALESCE(max_value, excluded.max_value),
+                    COALESCE(excluded.max_value, max_value)
+                ),
+                sum_value = COALESCE(sum_value, 0) + COALESCE(excluded.sum_value, 0),
+                -- Пачка может содержать записи старше уже учтенных
+                -- (переполнение, журнал): последнее значение меняют
+                -- только более новые записи
+                last_value = CASE
+                    WHEN excluded.last_timestamp >= last_timestamp
+                        THEN COALESCE(excluded.last_value, last_value)
+                    ELSE COALESCE(last_value, excluded.last_value)
+                END,
+                last_timestamp = MAX(last_timestamp, excluded.last_timestamp)
+            """
+        cursor.execute(
+            f"""
+            INSERT {"OR REPLACE " if replace else ""}INTO {table} (
+                topic_id, bucket, message_count, value_count, min_value,
+                max_value, sum_value, last_value, last_timestamp
+            )
+            SELECT topic_id, bucket, COUNT(*), COUNT(value), MIN(value),
+                   MAX(value), SUM(value), MAX(last_value),
+                   {timestamp_sql("MAX(timestamp)")}
+            FROM (
+                SELECT topic_id, timestamp, value, {bucket} AS bucket,
+                       -- Последнее числовое значение интервала
+                       FIRST_VALUE(value) OVER (
+                           PARTITION BY topic_id, {bucket}
+                           ORDER BY value IS NULL, timestamp DESC, id DESC
+                       ) AS last_value
+                FROM (
+                    SELECT id, topic_id, timestamp, {value} AS value
+                    FROM {partition}
+                    WHERE {condition}
+                )
+            )
+            WHERE true
+            GROUP BY topic_id, bucket
+            {conflict}
+            """,
+            (*value_params, *params),
+        )
+
+    @staticmethod
+    def _allocate_ids(cursor: sqlite3.Cursor, count: int) -> int:
+        """Резервирует count сквозных id записей и возвращает первый из них"""
+        cursor.execute(
+            """
+            INSERT INTO ingest_state (key, value) VALUES ('last_row_id', ?)
+            ON CONFLICT(key) DO UPDATE SET value = value + excluded.value
+            RETURNING value
+            """,
+            (count,),
+        )
+        return cursor.fetchone()[0] - count + 1
+
+    def get_state_versions(self) -> Dict[str, int]:
+        """
+        Счетчики изменений из ingest_state
+
+        Returns:
+            dict: catalog_version (растет при появлении нового топика),
+            commit_seq (растет с каждой закоммиченной пачкой) и purge_seq
+            (растет с каждым удалением старых записей)
+        """
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT key, value FROM ingest_state "
+                "WHERE key IN ('catalog_version', 'commit_seq', 'purge_seq')"
+            )
+            versions = {"catalog_version": 0, "commit_seq": 0, "purge_seq": 0}
+            versions.update({row[0]: row[1] for row in cursor.fetchall()})
+            return versions
 
-                conn.commit()
-                logger.info("Database initialized successfully")
+    def get_last_row_id(self) -> int:
+        """Наибольший id закоммиченных записей (сквозной счетчик last_row_id)"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT value FROM ingest_state WHERE key = 'last_row_id'")
+            row = cursor.fetchone()
+            return row[0] if row else 0
 
-        except sqlite3.Error as e:
-            logger.error(f"Database initialization error: {e}")
-            raise
+    def get_records_after(self, after_id: int, limit: int) -> list:
+        """
+        Записи всех топиков с id больше after_id, в порядке id
 
-    def insert_sensor_data(self, topic: str, payload: str) -> bool:
-        """Вставляет данные сенсора в базу данных"""
-        # Подготавливаем запись для батча
-        modified_topic = topic
-        modified_payload = payload
-        if radiohead_topic_name in topic.lower():
-            json_payload = parse_payload_as_json(modified_payload)
-            json_payload["payload"] = decode_radiohead_payload(
-                json_payload.get("payload", [])
-            )
-            modified_topic = f"{topic}/{json_payload['payload']['sensor_id']}"
-            modified_payload = serialize_json_payload_as_str(json_payload)
-
-        record = (modified_topic, modified_payload)
-        with self.batch_lock:
-            self.batch_buffer.append(record)
-            # Проверяем, достигли ли мы размера батча
-            if len(self.batch_buffer) >= BATCH_SIZE:
-                self.insert_batch()
-            elif len(self.batch_buffer) == 1:
-                # Если это первое сообщение в батче, запускаем таймер
-                self.start_batch_timer()
-
-        return True
-
-    def insert_batch(self) -> bool:
-        """Вставляет данные сенсора в базу данных"""
-        with self.batch_lock:
-            if not self.batch_buffer:
-                # Если буфер пуст, сбрасываем таймер и выходим
-                self.batch_timer = None
-                return False
-
-            current_batch = self.batch_buffer
-            self.batch_buffer = []
-            # Перезапускаем таймер для следующего батча
-            self.batch_timer = None
+        id назначаются пачке при записи из сквозного счетчика, поэтому
+        записи с id выше уже прочитанного - ровно новые коммиты; в каждой
+        партиции это поиск по первичному ключу
+
+        Returns:
+            list: Строки (id, topic, JSON-объект записи как в
+            get_sensor_data_json)
+        """
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.executemany(
-                    "INSERT INTO sensor_data (topic, payload) VALUES (?, ?)",
-                    current_batch,
+                cursor.execute(
+                    f"""
+                    SELECT id, topic, {record_json_sql("json_quote(topic)")} FROM (
+                        SELECT d.id, t.name AS topic, d.payload, d.timestamp
+                        FROM sensor_data d JOIN topics t ON t.id = d.topic_id
+                        WHERE d.id > ?
+                        ORDER BY d.id
+                        LIMIT ?
+                    )
+                    """,
+                    (after_id, limit),
                 )
-                conn.commit()
-                logger.info(f"Data of len {len(current_batch)} inserted")
-                return True
+                return cursor.fetchall()
 
         except sqlite3.Error as e:
-            logger.error(f"Error inserting data: {e}")
-            # В случае ошибки можно добавить данные обратно в буфер
-            with self.batch_lock:
-                self.batch_buffer = current_batch + self.batch_buffer
-            return False
+            logger.error(f"Error fetching new records: {e}")
+            return []
 
-    # Функция для перезапуска таймера
-    def start_batch_timer(self) -> None:
-        if self.batch_timer is None:
-            logger.info("New Timer started")
-            self.batch_timer = Timer(BATCH_TIMEOUT, self.insert_batch)
-            self.batch_timer.daemon = True
-            self.batch_timer.start()
+    def get_spool_seq(self) -> int:
+        """Номер последней записи журнала IngestSpool, закоммиченной в БД"""
+        with self.get_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT value FROM ingest_state WHERE key = 'spool_seq'")
+            row = cursor.fetchone()
+            return row[0] if row else 0
 
     def get_recent_data(self, limit: int = 10) -> list:
         """Получает последние записи из базы данных"""
@@ -133,8 +1902,13 @@ class DatabaseManager:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
-                    "SELECT id, topic, payload, timestamp FROM sensor_data "
-                    "ORDER BY timestamp DESC LIMIT ?",
+                    f"""
+                    SELECT d.id, t.name AS topic, d.payload,
+                           {timestamp_sql("d.timestamp")} AS timestamp
+                    FROM sensor_data d JOIN topics t ON t.id = d.topic_id
+                    ORDER BY d.timestamp DESC
+                    LIMIT ?
+                    """,
                     (limit,),
                 )
                 return cursor.fetchall()
@@ -143,60 +1917,290 @@ class DatabaseManager:
             logger.error(f"Error fetching data: {e}")
             return []
 
-    def delete_old_records(self, months: int = 3) -> Tuple[int, int]:
+    def delete_old_records(
+        self,
+        months: int = 3,
+        chunk_size: int = CLEANER_CHUNK_SIZE,
+        pause: float = CLEANER_CHUNK_PAUSE,
+        progress: Optional[Callable[[int], None]] = None,
+    ) -> Optional[int]:
         """
         Удаляет записи старше указанного количества месяцев
 
+        Партиции, целиком лежащие до границы, удаляются через DROP TABLE.
+        В граничной партиции записи удаляются диапазонами id по chunk_size
+        строк, каждый диапазон - отдельная короткая транзакция, а между
+        ними выдерживается пауза pause: блокировка записи держится
+        миллисекунды, и логгер продолжает писать во время очистки.
+
         Args:
             months: Количество месяцев для хранения данных
+            chunk_size: Сколько записей удалять одной транзакцией
+            pause: Пауза между транзакциями, секунды
+            progress: Вызывается с общим числом удаленных записей после
+                каждой транзакции
 
         Returns:
-            Tuple: (количество удаленных записей, общее количество записей до удаления)
+            Optional[int]: Количество удаленных записей или None, если
+                удаление прервалось ошибкой (старые записи могли остаться)
         """
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
 
-                # Получаем общее количество записей до удаления
-                cursor.execute("SELECT COUNT(*) FROM sensor_data")
-                total_before = cursor.fetchone()[0]
+                # Метка времени, старше которой удаляем записи
+                cutoff = self._cutoff(months)
 
-                if total_before == 0:
-                    logger.info("No records to delete")
-                    return 0, 0
+                deleted_count = 0
+                for partition in self.list_partitions(cursor):
+                    start, end = partition_bounds(partition)
+                    if start >= cutoff:
+                        break
+                    if end <= cutoff:
+                        # Вся партиция старше границы: удаляем таблицу целиком
+                        cursor.execute(
+                            "SELECT COALESCE(SUM(row_count), 0) FROM daily_stats "
+                            "WHERE day >= ? AND day < ?",
+                            (timestamp_day(start), timestamp_day(end)),
+                        )
+                        partition_count = cursor.fetchone()[0]
+                        self.drop_partition(partition)
+                        deleted_count += partition_count
+                        if progress:
+                            progress(deleted_count)
+                    else:
+                        # Граничная партиция: удаляем только старые записи
+                        deleted_count = self._delete_in_chunks(
+                            partition,
+                            cutoff,
+                            chunk_size,
+                            pause,
+                            deleted_count,
+                            progress,
+                        )
 
-                # Вычисляем дату, старше которой удаляем записи
-                cutoff_date = (datetime.now() - timedelta(days=months * 30)).strftime(
-                    "%Y-%m-%d %H:%M:%S"
+                logger.info(
+                    f"Deleted {deleted_count} records older than {months} months"
                 )
 
-                # Удаляем старые записи
+                return deleted_count
+
+        except sqlite3.Error as e:
+            logger.error(f"Error deleting old records: {e}")
+            return None
+
+    def _delete_in_chunks(
+        self,
+        partition: str,
+        cutoff: int,
+        chunk_size: int,
+        pause: float,
+        deleted_count: int,
+        progress: Optional[Callable[[int], None]],
+    ) -> int:
+        """Удаляет записи партиции старше метки cutoff диапазонами id"""
+        started = time.monotonic()
+        partition_deleted = 0
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        while True:
+            with conn:
+                # Диапазон id очередной порции по индексу timestamp: записи
+                # вставляются по возрастанию времени приема, поэтому диапазон
+                # почти сплошной, а лишнее отсекает условие timestamp в DELETE
                 cursor.execute(
-                    "DELETE FROM sensor_data WHERE timestamp < ?", (cutoff_date,)
+                    f"""
+                    SELECT MIN(id), MAX(id) FROM (
+                        SELECT id FROM {partition}
+                        WHERE timestamp < ?
+                        ORDER BY timestamp
+                        LIMIT ?
+                    )
+                    """,
+                    (cutoff, chunk_size),
                 )
+                low_id, high_id = cursor.fetchone()
+                if low_id is None:
+                    break
+                chunk_deleted = self._delete_chunk(
+                    cursor, partition, low_id, high_id, cutoff
+                )
+                # Номер удаления: кэши ответов API сбрасываются по нему
+                self._increment_state(cursor, "purge_seq")
 
-                deleted_count = cursor.rowcount
-                conn.commit()
+            partition_deleted += chunk_deleted
+            deleted_count += chunk_deleted
+            elapsed = time.monotonic() - started
+            logger.info(
+                f"Deleted {partition_deleted} records from {partition} "
+                f"({partition_deleted / elapsed if elapsed else 0:.0f} records/s)"
+            )
+            if progress:
+                progress(deleted_count)
+            time.sleep(pause)
+        return deleted_count
+
+    @staticmethod
+    def _delete_chunk(
+        cursor: sqlite3.Cursor,
+        partition: str,
+        low_id: int,
+        high_id: int,
+        cutoff: int,
+    ) -> int:
+        """
+        Удаляет порцию устаревших записей и вычитает ее из daily_stats и
+        счетчиков каталога топиков
 
-                # Получаем количество записей после удаления
-                cursor.execute("SELECT COUNT(*) FROM sensor_data")
-                total_after = cursor.fetchone()[0]
+        Returns:
+            int: Количество удаленных записей
+        """
+        cursor.execute(
+            f"""
+            SELECT strftime('%Y-%m-%d', timestamp / 1000, 'unixepoch'),
+                   topic_id, COUNT(*)
+            FROM {partition}
+            WHERE id BETWEEN ? AND ? AND timestamp < ?
+            GROUP BY 1, 2
+            """,
+            (low_id, high_id, cutoff),
+        )
+        deleted = cursor.fetchall()
+        cursor.execute(
+            f"DELETE FROM {partition} WHERE id BETWEEN ? AND ? AND timestamp < ?",
+            (low_id, high_id, cutoff),
+        )
+        chunk_deleted = cursor.rowcount
 
-                logger.info(
-                    f"Deleted {deleted_count} records older than {months} months. "
-                    f"Total before: {total_before}, after: {total_after}"
+        topic_counts: Dict[int, int] = {}
+        for _, topic_id, count in deleted:
+            topic_counts[topic_id] = topic_counts.get(topic_id, 0) + count
+        cursor.executemany(
+            "UPDATE topics SET message_count = message_count - ? WHERE id = ?",
+            [(count, topic_id) for topic_id, count in topic_counts.items()],
+        )
+
+        # Только дни и топики, затронутые порцией. Границы дня заново берутся
+        # из оставшихся записей этого дня (поиск по индексу (topic_id,
+        # timestamp)); день без записей удаляется из статистики
+        for day, topic_id, count in deleted:
+            day_start = parse_timestamp(day)
+            cursor.execute(
+                f"""
+                SELECT {timestamp_sql("MIN(timestamp)")},
+                       {timestamp_sql("MAX(timestamp)")}
+                FROM {partition}
+                WHERE topic_id = ? AND timestamp >= ? AND timestamp < ?
+                """,
+                (topic_id, day_start, day_start + DAY_MS),
+            )
+            first, last = cursor.fetchone()
+            if first is None:
+                cursor.execute(
+                    "DELETE FROM daily_stats WHERE day = ? AND topic_id = ?",
+                    (day, topic_id),
+                )
+            else:
+                cursor.execute(
+                    """
+                    UPDATE daily_stats SET row_count = row_count - ?,
+                        first_timestamp = ?, last_timestamp = ?
+                    WHERE day = ? AND topic_id = ?
+                    """,
+                    (count, first, last, day, topic_id),
                 )
+        return chunk_deleted
+
+    @staticmethod
+    def _cutoff(months: int) -> int:
+        """Граница хранения: записи с меткой времени меньше нее устарели"""
+        return utc_now_ms() - months * 30 * DAY_MS
 
-                return deleted_count, total_before
+    def reclaim_space(
+        self, step_pages: int = CLEANER_VACUUM_PAGES, pause: float = CLEANER_CHUNK_PAUSE
+    ) -> int:
+        """
+        Возвращает ОС страницы, освобожденные удалением данных
+
+        Свободные страницы отдаются через PRAGMA incremental_vacuum порциями
+        по step_pages с паузой между ними, чтобы не держать блокировку записи
+        долго. В базах, созданных до партиционирования, режим auto_vacuum
+        другой: там страницы переиспользуются новыми записями, а файл не
+        уменьшается до convert_auto_vacuum
+
+        Returns:
+            int: Количество освобожденных страниц
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("PRAGMA freelist_count")
+                free_pages = cursor.fetchone()[0]
+                cursor.execute("PRAGMA auto_vacuum")
+                if cursor.fetchone()[0] != 2:
+                    logger.warning(
+                        "Database is not in incremental auto_vacuum mode, free "
+                        "pages are kept for reuse; run the cleaner with "
+                        "--convert-auto-vacuum in a maintenance window"
+                    )
+                    free_pages = 0
+                else:
+                    while True:
+                        cursor.execute("PRAGMA freelist_count")
+                        if cursor.fetchone()[0] == 0:
+                            break
+                        cursor.execute(
+                            f"PRAGMA incremental_vacuum({step_pages})"
+                        ).fetchall()
+                        time.sleep(pause)
+                # Переносим изменения из WAL в файл базы и обрезаем WAL
+                cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+                logger.info(f"Reclaimed {free_pages} free pages")
+                return free_pages
 
         except sqlite3.Error as e:
-            logger.error(f"Error deleting old records: {e}")
-            return 0, 0
+            logger.error(f"Error reclaiming space: {e}")
+            return 0
+
+    def convert_auto_vacuum(self) -> bool:
+        """
+        Переводит базу в режим auto_vacuum = INCREMENTAL полным VACUUM
+
+        Разовая операция обслуживания для баз, созданных до
+        партиционирования: VACUUM переписывает весь файл, держит блокировку
+        записи все это время (логгер ждет) и временно требует еще столько же
+        места на диске. Поэтому выполняется только по явному запросу
+
+        Returns:
+            bool: True, если база уже была или стала INCREMENTAL
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("PRAGMA auto_vacuum")
+                if cursor.fetchone()[0] == 2:
+                    logger.info("Database is already in incremental auto_vacuum mode")
+                    return True
+                logger.warning(
+                    "Converting database to incremental auto_vacuum with VACUUM"
+                )
+                cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                cursor.execute("VACUUM")
+                cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+                cursor.execute("PRAGMA auto_vacuum")
+                return cursor.fetchone()[0] == 2
+
+        except sqlite3.Error as e:
+            logger.error(f"Error converting auto_vacuum mode: {e}")
+            return False
 
     def get_old_records_count(self, months: int = 3) -> int:
         """
         Возвращает количество записей старше указанного количества месяцев
 
+        Полные дни берутся из daily_stats, по данным считается только
+        часть дня, на который приходится граница
+
         Args:
             months: Количество месяцев
 
@@ -207,16 +2211,21 @@ class DatabaseManager:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
 
-                cutoff_date = (datetime.now() - timedelta(days=months * 30)).strftime(
-                    "%Y-%m-%d %H:%M:%S"
+                cutoff = self._cutoff(months)
+
+                cursor.execute(
+                    "SELECT COALESCE(SUM(row_count), 0) FROM daily_stats WHERE day < ?",
+                    (timestamp_day(cutoff),),
                 )
+                full_days = cursor.fetchone()[0]
 
                 cursor.execute(
-                    "SELECT COUNT(*) FROM sensor_data WHERE timestamp < ?",
-                    (cutoff_date,),
+                    "SELECT COUNT(*) FROM sensor_data "
+                    "WHERE timestamp >= ? AND timestamp < ?",
+                    (cutoff - cutoff % DAY_MS, cutoff),
                 )
 
-                return cursor.fetchone()[0]
+                return full_days + cursor.fetchone()[0]
 
         except sqlite3.Error as e:
             logger.error(f"Error counting old records: {e}")
@@ -224,7 +2233,7 @@ class DatabaseManager:
 
     def get_database_stats(self) -> dict:
         """
-        Возвращает статистику базы данных
+        Возвращает статистику базы данных по счетчикам daily_stats
 
         Returns:
             dict: Статистика БД
@@ -233,64 +2242,671 @@ class DatabaseManager:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
 
-                stats = {}
+                cursor.execute(
+                    """
+                    SELECT COALESCE(SUM(row_count), 0),
+                           MIN(first_timestamp),
+                           MAX(last_timestamp)
+                    FROM daily_stats
+                    """
+                )
+                total, oldest, newest = cursor.fetchone()
 
-                # Общее количество записей
-                cursor.execute("SELECT COUNT(*) FROM sensor_data")
-                stats["total_records"] = cursor.fetchone()[0]
+                return {
+                    # Общее количество записей
+                    "total_records": total,
+                    # Самая старая запись
+                    "oldest_record": oldest,
+                    # Самая новая запись
+                    "newest_record": newest,
+                    # Количество записей старше 3 месяцев
+                    "records_older_than_3_months": self.get_old_records_count(3),
+                }
 
-                # Самая старая запись
-                cursor.execute("SELECT MIN(timestamp) FROM sensor_data")
-                stats["oldest_record"] = cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            logger.error(f"Error getting database stats: {e}")
+            return {}
 
-                # Самая новая запись
-                cursor.execute("SELECT MAX(timestamp) FROM sensor_data")
-                stats["newest_record"] = cursor.fetchone()[0]
+    def get_topic_stats(self, topic: Optional[str] = None) -> list:
+        """
+        Статистика хранимых записей по топикам из счетчиков daily_stats
 
-                # Количество записей старше 3 месяцев
-                stats["records_older_than_3_months"] = self.get_old_records_count(3)
+        Args:
+            topic: Топик; None - все топики
 
-                return stats
+        Returns:
+            list: Строки (topic, records, oldest_record, newest_record)
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    SELECT t.name AS topic,
+                           SUM(s.row_count) AS records,
+                           MIN(s.first_timestamp) AS oldest_record,
+                           MAX(s.last_timestamp) AS newest_record
+                    FROM daily_stats s JOIN topics t ON t.id = s.topic_id
+                    WHERE ? IS NULL OR t.name = ?
+                    GROUP BY t.name
+                    ORDER BY t.name
+                    """,
+                    (topic, topic),
+                )
+                return cursor.fetchall()
 
         except sqlite3.Error as e:
-            logger.error(f"Error getting database stats: {e}")
-            return {}
+            logger.error(f"Error getting topic stats: {e}")
+            return []
 
-    def get_sensor_data(self, topic: str, limit: int = 10) -> list:
-        """Получает последние записи из базы данных"""
+    def check_connection(self) -> bool:
+        """Быстрая проверка доступности базы: без чтения данных"""
+        try:
+            with self.get_connection() as conn:
+                conn.execute("SELECT 1 FROM ingest_state LIMIT 1").fetchall()
+                return True
+
+        except sqlite3.Error as e:
+            logger.error(f"Database health check failed: {e}")
+            return False
+
+    def get_sensor_data(
+        self,
+        topic: str,
+        limit: int = 10,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        after: Optional[Tuple[int, int]] = None,
+        ascending: bool = False,
+        filters: Tuple[FieldFilter, ...] = (),
+    ) -> list:
+        """
+        Получает записи топика в порядке (timestamp, id)
+
+        Постраничный обход по ключу: следующая страница запрашивается с
+        after = (timestamp, id) последней записи предыдущей, поэтому любая
+        страница стоит O(log n + limit) независимо от глубины
+
+        Args:
+            topic: Топик
+            limit: Максимальное количество записей
+            since: Нижняя граница timestamp, мс Unix (включительно)
+            until: Верхняя граница timestamp, мс Unix (не включительно)
+            after: Ключ (timestamp, id), после которого продолжить обход
+            ascending: От старых к новым; по умолчанию сначала новые
+            filters: Условия (JSON-путь, оператор, значение) на поля payload;
+                записи без поля не проходят ни одно условие
+
+        Returns:
+            list: Строки (id, topic, payload, timestamp); timestamp - текст
+            format_timestamp
+
+        Raises:
+            ValueError: Неизвестный оператор или некорректный JSON-путь фильтра
+        """
+        return self._select_sensor_data(
+            f"id, ? AS topic, payload, {timestamp_sql()} AS timestamp",
+            topic,
+            topic,
+            limit,
+            since,
+            until,
+            after,
+            ascending,
+            filters,
+        )
+
+    def get_sensor_data_json(
+        self,
+        topic: str,
+        limit: int = 10,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        after: Optional[Tuple[int, int]] = None,
+        ascending: bool = False,
+        filters: Tuple[FieldFilter, ...] = (),
+        raw_payload: bool = False,
+    ) -> List[Tuple[int, int, str]]:
+        """
+        Те же записи, что get_sensor_data, но уже в виде JSON-объектов
+
+        Текст объекта {"id", "topic", "payload", "timestamp"} собирается в
+        SQLite из хранимых байтов, поэтому ответ API склеивается из строк без
+        dict и json.dumps на каждую запись
+
+        Args:
+            raw_payload: Вставлять payload, являющийся JSON, как есть
+                (вложенным значением, а не экранированной строкой); прочие
+                payload остаются строками
+
+        Returns:
+            list: Строки (id, timestamp мс Unix, JSON-объект записи)
+        """
+        # Топик - готовый JSON-литерал параметром
+        return self._select_sensor_data(
+            f"id, timestamp, {record_json_sql('?', raw_payload)}",
+            json.dumps(topic, ensure_ascii=False),
+            topic,
+            limit,
+            since,
+            until,
+            after,
+            ascending,
+            filters,
+        )
+
+    def get_sensor_data_merged(
+        self,
+        topics: Tuple[str, ...],
+        limit: int = 10,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        after: Optional[Tuple[int, int]] = None,
+        ascending: bool = False,
+        filters: Tuple[FieldFilter, ...] = (),
+        raw_payload: bool = False,
+    ) -> List[Tuple[int, int, str]]:
+        """
+        Записи нескольких топиков одной лентой в порядке (timestamp, id)
+
+        K-way слияние обходов get_sensor_data_json по каждому топику: обход
+        читает порциями, начиная с равной доли limit и удваивая порцию, когда
+        топик ее исчерпал, поэтому "последние 100 записей 200 топиков" - это
+        примерно по одной записи на топик, а не 200 * 100. id сквозные, так
+        что ключ (timestamp, id) - общий курсор для всех топиков
+
+        Returns:
+            list: Строки (id, timestamp мс Unix, JSON-объект записи)
+        """
+        if not topics:
+            return []
+        if len(topics) == 1:
+            return self.get_sensor_data_json(
+                topics[0], limit, since, until, after, ascending, filters, raw_payload
+            )
+
+        def scan(topic: str) -> Iterator[Tuple[int, int, str]]:
+            chunk, key = -(-limit // len(topics)), after
+            while True:
+                rows = self.get_sensor_data_json(
+                    topic, chunk, since, until, key, ascending, filters, raw_payload
+                )
+                yield from rows
+                if len(rows) < chunk:
+                    return
+                chunk, key = min(chunk * 2, limit), (rows[-1][1], rows[-1][0])
+
+        merged = heapq.merge(
+            *(scan(topic) for topic in topics),
+            key=lambda row: (row[1], row[0]),
+            reverse=not ascending,
+        )
+        return list(islice(merged, limit))
+
+    def _select_sensor_data(
+        self,
+        projection: str,
+        projection_param: object,
+        topic: str,
+        limit: int,
+        since: Optional[int],
+        until: Optional[int],
+        after: Optional[Tuple[int, int]],
+        ascending: bool,
+        filters: Tuple[FieldFilter, ...],
+    ) -> list:
+        """
+        Обход записей топика для get_sensor_data и get_sensor_data_json
+
+        projection - список колонок результата поверх выборки (id, timestamp,
+        payload) партиции с одним параметром projection_param
+        """
+        for path, operator, _ in filters:
+            if operator not in FILTER_OPERATORS or not FIELD_PATH_PATTERN.match(path):
+                raise ValueError(f"Invalid filter {path} {operator}")
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                topic_id = self._lookup_topic_id(cursor, topic)
+                if topic_id is None:
+                    return []
+
+                conditions = ["topic_id = ?"]
+                params: list = [topic_id]
+                if since is not None:
+                    conditions.append("timestamp >= ?")
+                    params.append(since)
+                if until is not None:
+                    conditions.append("timestamp < ?")
+                    params.append(until)
+                for path, operator, value in filters:
+                    conditions.append(
+                        f"{self._field_filter_sql(topic, path)} {operator} ?"
+                    )
+                    params.append(value)
+                lower, upper = since, until
+                sign = ">" if ascending else "<"
+                order = "ASC" if ascending else "DESC"
+
+                # Части обхода: (партиция, доп. условие, параметры)
+                segments: list = []
+                if after is not None:
+                    after_timestamp, after_id = after
+                    # Сначала остаток записей с той же меткой времени (принятых
+                    # в ту же миллисекунду): поиск по (topic_id, timestamp,
+                    # rowid), а не перебор всей группы, как при (timestamp, id) < (?, ?)
+                    segments.append(
+                        (
+                            partition_for(after_timestamp),
+                            f"timestamp = ? AND id {sign} ?",
+                            [after_timestamp, after_id],
+                        )
+                    )
+                    if ascending:
+                        lower = max(lower or after_timestamp, after_timestamp)
+                    else:
+                        upper = min(upper or after_timestamp, after_timestamp)
+
+                # Партиции не пересекаются по времени, поэтому обходим их по
+                # очереди вместо представления: ORDER BY (timestamp, id) по
+                # UNION ALL потребовал бы сортировки всего диапазона, а внутри
+                # партиции порядок дает индекс (topic_id, timestamp) + rowid
+                partitions = self._partitions_between(cursor, lower, upper)
+                if not ascending:
+                    partitions.reverse()
+                for partition in partitions:
+                    if after is None:
+                        segments.append((partition, "1", []))
+                    else:
+                        segments.append(
+                            (partition, f"timestamp {sign} ?", [after_timestamp])
+                        )
+
+                existing = set(partitions)
+                rows: list = []
+                for partition, condition, extra in segments:
+                    if partition not in existing:
+                        continue
+                    # Проекция - над подзапросом с LIMIT: SQLite его не
+                    # раскрывает, и payload (в режиме compressed - распаковка)
+                    # вычисляется один раз на запись, даже если проекция
+                    # использует его дважды
+                    cursor.execute(
+                        f"""
+                        SELECT {projection} FROM (
+                            SELECT id, timestamp, {PAYLOAD_SQL} AS payload
+                            FROM {partition}
+                            WHERE {" AND ".join(conditions)} AND {condition}
+                            ORDER BY timestamp {order}, id {order}
+                            LIMIT ?
+                        )
+                        """,
+                        (projection_param, *params, *extra, limit - len(rows)),
+                    )
+                    rows.extend(cursor.fetchall())
+                    if len(rows) >= limit:
+                        break
+                return rows
+
+        except sqlite3.Error as e:
+            logger.error(f"Error fetching data: {e}")
+            return []
+
+    def get_series_buckets(
+        self, topic: str, path: str, since: int, until: int, width: int
+    ) -> List[Tuple[int, float, float, float, int]]:
+        """
+        Агрегаты числового поля payload по интервалам времени
+
+        Группировка выполняется в SQLite при проходе по индексу (topic_id,
+        timestamp), в Python попадает не больше одной строки на интервал
+
+        Args:
+            topic: Топик
+            path: JSON-путь к полю в payload, например $.payload.voltage
+            since: Начало диапазона, мс Unix (включительно)
+            until: Конец диапазона, мс Unix (не включительно)
+            width: Ширина интервала, секунды
+
+        Returns:
+            list: Строки (номер интервала от since, min, max, sum, count)
+        """
+        start = since // 1000
+        value, value_params = numeric_value_sql(path)
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                topic_id = self._lookup_topic_id(cursor, topic)
+                if topic_id is None:
+                    return []
+
+                # Интервал может попасть на границу месяца: складываем
+                # агрегаты соседних партиций
+                buckets: Dict[int, list] = {}
+                for partition in self._partitions_between(cursor, since, until):
+                    cursor.execute(
+                        f"""
+                        SELECT (timestamp / 1000 - ?) / ?,
+                               MIN(value), MAX(value), SUM(value), COUNT(value)
+                        FROM ({self._series_sql(partition, value)})
+                        WHERE value IS NOT NULL
+                        GROUP BY 1
+                        """,
+                        (start, width, *value_params, topic_id, since, until),
+                    )
+                    for bucket, low, high, total, count in cursor.fetchall():
+                        if bucket not in buckets:
+                            buckets[bucket] = [low, high, total, count]
+                            continue
+                        merged = buckets[bucket]
+                        merged[0] = min(merged[0], low)
+                        merged[1] = max(merged[1], high)
+                        merged[2] += total
+                        merged[3] += count
+                return [
+                    (bucket, *buckets[bucket])  # pyright: ignore[reportReturnType]
+                    for bucket in sorted(buckets)
+                ]
+
+        except sqlite3.Error as e:
+            logger.error(f"Error aggregating series: {e}")
+            return []
+
+    def iter_series(
+        self, topic: str, path: str, since: int, until: int
+    ) -> Iterator[Tuple[int, str, float]]:
+        """
+        Точки (epoch-секунды, timestamp, значение) числового поля payload
+
+        Строки читаются курсором по мере обхода, без загрузки всего
+        диапазона в память. Генератор нужно исчерпать в том же потоке
+
+        Args:
+            topic: Топик
+            path: JSON-путь к полю в payload, например $.payload.voltage
+            since: Начало диапазона, мс Unix (включительно)
+            until: Конец диапазона, мс Unix (не включительно)
+        """
+        value, value_params = numeric_value_sql(path)
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                topic_id = self._lookup_topic_id(cursor, topic)
+                if topic_id is None:
+                    return
+                for partition in self._partitions_between(cursor, since, until):
+                    cursor.execute(
+                        f"""
+                        SELECT timestamp / 1000, {timestamp_sql()}, value
+                        FROM ({self._series_sql(partition, value)})
+                        WHERE value IS NOT NULL
+                        """,
+                        (*value_params, topic_id, since, until),
+                    )
+                    yield from cursor
+
+        except sqlite3.Error as e:
+            logger.error(f"Error reading series: {e}")
+
+    @staticmethod
+    def _series_sql(partition: str, value: str) -> str:
+        """
+        Записи топика за период с числовым значением поля payload (value)
+
+        Параметры: параметры value, topic_id, since, until
+        """
+        return f"""
+            SELECT timestamp, {value} AS value
+            FROM (
+                SELECT id, timestamp, {PAYLOAD_SQL} AS payload, sensor_id, voltage
+                FROM {partition}
+                WHERE topic_id = ? AND timestamp >= ? AND timestamp < ?
+            )
+            ORDER BY timestamp, id
+        """
+
+    def get_rollups(
+        self,
+        topic: str,
+        resolution: str,
+        since: Optional[int] = None,
+        until: Optional[int] = None,
+        limit: int = 1000,
+    ) -> list:
+        """
+        Агрегаты топика по интервалам, от старых к новым
+
+        Args:
+            topic: Топик
+            resolution: Разрешение из ROLLUPS ("1m" или "1h")
+            since: Начало интервалов, мс Unix (включительно)
+            until: Конец интервалов, мс Unix (не включительно)
+            limit: Максимальное количество интервалов
+
+        Returns:
+            list: Строки (timestamp, message_count, value_count, min, max,
+            avg, last, last_timestamp)
+        """
+        table = ROLLUPS[resolution][0]
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
+                topic_id = self._lookup_topic_id(cursor, topic)
+                if topic_id is None:
+                    return []
+                # Диапазон по первичному ключу (topic_id, bucket); bucket -
+                # текст начала интервала с точностью до секунды
+                lower = format_timestamp(since)[:19] if since is not None else ""
+                upper = (
+                    format_timestamp(until)[:19]
+                    if until is not None
+                    else "9999-12-31 23:59:59"
+                )
                 cursor.execute(
-                    """
-                    SELECT id, topic, payload, timestamp
-                    FROM sensor_data
-                    WHERE topic = ?
-                    ORDER BY timestamp DESC
+                    f"""
+                    SELECT bucket AS timestamp, message_count, value_count,
+                           min_value AS min, max_value AS max,
+                           sum_value / value_count AS avg,
+                           last_value AS last, last_timestamp
+                    FROM {table}
+                    WHERE topic_id = ? AND bucket >= ? AND bucket < ?
+                    ORDER BY bucket
                     LIMIT ?
                     """,
-                    (topic, limit),
+                    (topic_id, lower, upper, limit),
+                )
+                return cursor.fetchall()
+
+        except sqlite3.Error as e:
+            logger.error(f"Error fetching rollups: {e}")
+            return []
+
+    def delete_old_rollups(self) -> int:
+        """
+        Удаляет агрегаты старше ROLLUP_*_RETENTION_DAYS
+
+        Удаление идет по топикам - диапазоном первичного ключа, без
+        просмотра всей таблицы
+
+        Returns:
+            int: Количество удаленных интервалов
+        """
+        deleted_count = 0
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT id FROM topics ORDER BY id")
+                topic_ids = [row[0] for row in cursor.fetchall()]
+                for resolution, (table, _) in ROLLUPS.items():
+                    days = ROLLUP_RETENTION_DAYS[resolution]
+                    if days <= 0:
+                        continue
+                    cutoff_date = (
+                        datetime.now(timezone.utc) - timedelta(days=days)
+                    ).strftime(TIMESTAMP_FORMAT)
+                    for topic_id in topic_ids:
+                        cursor.execute(
+                            f"DELETE FROM {table} WHERE topic_id = ? AND bucket < ?",
+                            (topic_id, cutoff_date),
+                        )
+                        deleted_count += cursor.rowcount
+                        conn.commit()
+            logger.info(f"Deleted {deleted_count} expired rollup intervals")
+            return deleted_count
+
+        except sqlite3.Error as e:
+            logger.error(f"Error deleting rollups: {e}")
+            return deleted_count
+
+    def delete_unused_payloads(
+        self, months: int = 3, chunk_size: int = CLEANER_CHUNK_SIZE
+    ) -> int:
+        """
+        Удаляет payload, на которые не ссылаются записи моложе months месяцев
+
+        last_seen - день последней записи с этим payload, поэтому payload с
+        last_seen раньше дня отсечения нужен только уже удаленным записям.
+        Удаление идет порциями по chunk_size, затем удаляются словари, на
+        которые больше ничего не ссылается (кроме текущего)
+
+        Returns:
+            int: Количество удаленных payload
+        """
+        cutoff_day = timestamp_day(self._cutoff(months))
+        deleted_count = 0
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                while True:
+                    cursor.execute(
+                        """
+                        DELETE FROM payloads WHERE id IN (
+                            SELECT id FROM payloads WHERE last_seen < ? LIMIT ?
+                        )
+                        """,
+                        (cutoff_day, chunk_size),
+                    )
+                    deleted = cursor.rowcount
+                    conn.commit()
+                    deleted_count += deleted
+                    if deleted < chunk_size:
+                        break
+                cursor.execute(
+                    """
+                    DELETE FROM payload_dicts
+                    WHERE id < (SELECT MAX(id) FROM payload_dicts)
+                      AND id NOT IN (
+                          SELECT dict_id FROM payloads WHERE dict_id IS NOT NULL
+                      )
+                    """
                 )
+                conn.commit()
+            logger.info(f"Deleted {deleted_count} unused payloads")
+            return deleted_count
+
+        except sqlite3.Error as e:
+            logger.error(f"Error deleting payloads: {e}")
+            return deleted_count
+
+    def get_all_topics(self, prefix: Optional[str] = None) -> list:
+        """Получает список топиков, при необходимости только с заданным префиксом"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                # Словарь топиков вместо DISTINCT по всей таблице данных
+                if prefix:
+                    # Диапазон по уникальному индексу name вместо LIKE
+                    cursor.execute(
+                        """
+                        SELECT name AS topic
+                        FROM topics
+                        WHERE name >= ? AND name < ?
+                        ORDER BY name
+                        """,
+                        (prefix, prefix + "\U0010ffff"),
+                    )
+                else:
+                    cursor.execute(
+                        """
+                        SELECT name AS topic
+                        FROM topics
+                        ORDER BY name
+                        """,
+                    )
                 return cursor.fetchall()
 
         except sqlite3.Error as e:
             logger.error(f"Error fetching data: {e}")
             return []
 
-    def get_all_topics(self) -> list:
-        """Получает последние записи из базы данных"""
+    def get_latest_values(self, after_seq: int = 0) -> list:
+        """
+        Последние сообщения топиков
+
+        Args:
+            after_seq: Только записанные пачками с commit_seq больше этого
+
+        Returns:
+            list: Строки (topic, id, payload, timestamp)
+        """
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     """
-                    SELECT DISTINCT topic 
-                    FROM sensor_data 
-                    ORDER BY topic
+                    SELECT t.name AS topic, l.record_id AS id, l.payload, l.timestamp
+                    FROM latest_values l JOIN topics t ON t.id = l.topic_id
+                    WHERE l.commit_seq > ?
                     """,
+                    (after_seq,),
                 )
                 return cursor.fetchall()
 
         except sqlite3.Error as e:
-            logger.error(f"Error fetching data: {e}")
+            logger.error(f"Error fetching latest values: {e}")
+            return []
+
+    def get_topic_versions(self, after_seq: int = 0) -> list:
+        """
+        Номер последней пачки с записями каждого топика
+
+        Args:
+            after_seq: Только топики, записанные пачками с commit_seq больше этого
+
+        Returns:
+            list: Строки (topic, commit_seq)
+        """
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    SELECT t.name AS topic, l.commit_seq
+                    FROM latest_values l JOIN topics t ON t.id = l.topic_id
+                    WHERE l.commit_seq > ?
+                    """,
+                    (after_seq,),
+                )
+                return cursor.fetchall()
+
+        except sqlite3.Error as e:
+            logger.error(f"Error fetching topic versions: {e}")
+            return []
+
+    def get_topic_catalog(self) -> list:
+        """Каталог топиков со счетчиками, отсортированный по имени"""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    SELECT name AS topic, first_seen, last_seen, message_count
+                    FROM topics
+                    ORDER BY name
+                    """,
+                )
+                return cursor.fetchall()
+
+        except sqlite3.Error as e:
+            logger.error(f"Error fetching topic catalog: {e}")
             return []
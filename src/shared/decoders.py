@@ -0,0 +1,141 @@
+import logging
+from fnmatch import fnmatchcase
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from .metrics import REGISTRY
+from .utils.decode_radiohead_payload import decode_radiohead_payloads
+from .utils.parse_payload_as_json import parse_payload_as_json
+from .utils.serialize_json_payload_as_str import serialize_json_payload_as_str
+
+logger = logging.getLogger(__name__)
+
+DECODE_FAILURES = REGISTRY.counter(
+    "mqtt_decode_failures_total",
+    "Messages stored undecoded or with replaced bytes, by reason",
+    ["reason"],
+)
+
+# Принятое сообщение: (topic, payload); payload - байты MQTT или уже текст
+Record = Tuple[str, Union[str, bytes]]
+# Сообщение с временем приема: (topic, payload, received), received - мс Unix
+ReceivedRecord = Tuple[str, Union[str, bytes], int]
+# Запись для вставки: (topic, payload, sensor_id, voltage) - последние два
+# попадают в типизированные колонки партиций, None - нет значения
+DecodedRecord = Tuple[str, str, Optional[int], Optional[float]]
+BatchDecoder = Callable[[List[Tuple[str, str]]], List[DecodedRecord]]
+
+
+def payload_text(payload: Union[str, bytes]) -> str:
+    """Текст payload; некорректные байты UTF-8 заменяются символом U+FFFD"""
+    if isinstance(payload, str):
+        return payload
+    try:
+        return payload.decode()
+    except UnicodeDecodeError:
+        logger.warning("Payload is not valid UTF-8, replacing invalid bytes")
+        DECODE_FAILURES.inc("invalid_utf8")
+        return payload.decode(errors="replace")
+
+
+class DecoderRegistry:
+    """
+    Декодеры payload по шаблону топика (fnmatch, без учета регистра)
+
+    Декодер получает сразу все сообщения пачки со своими топиками и
+    возвращает записи в том же порядке. Сообщения, для которых декодера
+    нет, сохраняются как есть. Декодирование выполняется потоками
+    декодирования BatchWriter (или DatabaseManager.insert_batch), а не в
+    сетевом потоке MQTT.
+    """
+
+    def __init__(self):
+        self.decoders: List[Tuple[str, BatchDecoder]] = []
+        self.by_topic: Dict[str, Optional[BatchDecoder]] = {}
+
+    def register(self, pattern: str, decoder: BatchDecoder) -> None:
+        """Добавляет декодер; при совпадении нескольких шаблонов побеждает первый"""
+        self.decoders.append((pattern.lower(), decoder))
+        self.by_topic.clear()
+
+    def decoder_for(self, topic: str) -> Optional[BatchDecoder]:
+        """Декодер для топика или None"""
+        if topic not in self.by_topic:
+            self.by_topic[topic] = next(
+                (
+                    decoder
+                    for pattern, decoder in self.decoders
+                    if fnmatchcase(topic.lower(), pattern)
+                ),
+                None,
+            )
+        return self.by_topic[topic]
+
+    def decode_batch(self, records: List[Record]) -> List[DecodedRecord]:
+        """Декодирует пачку, сохраняя порядок записей"""
+        records = [(topic, payload_text(payload)) for topic, payload in records]
+        decoded: List[Optional[DecodedRecord]] = [None] * len(records)
+        groups: Dict[BatchDecoder, List[int]] = {}
+        for index, (topic, payload) in enumerate(records):
+            decoder = self.decoder_for(topic)
+            if decoder is None:
+                decoded[index] = (topic, payload, None, None)
+            else:
+                groups.setdefault(decoder, []).append(index)
+
+        for decoder, indexes in groups.items():
+            batch = [records[index] for index in indexes]
+            try:
+                results = decoder(batch)
+            except Exception as e:
+                # Ошибка декодера не должна терять сообщения: сохраняем как есть
+                logger.error(f"Decoder failed on a batch of {len(batch)}: {e}")
+                DECODE_FAILURES.inc("decoder_error", amount=len(batch))
+                results = [(topic, payload, None, None) for topic, payload in batch]
+            for index, result in zip(indexes, results):
+                decoded[index] = result
+        return decoded  # pyright: ignore[reportReturnType]
+
+
+def decode_radiohead_records(records: List[Tuple[str, str]]) -> List[DecodedRecord]:
+    """
+    Пачка сообщений RadioHead: байты payload -> sensor_id и voltage
+
+    Топик дополняется sensor_id, а в payload байты заменяются
+    расшифровкой, как и раньше. Сообщения с некорректными байтами
+    сохраняются без изменений.
+    """
+    messages = [parse_payload_as_json(payload) for _, payload in records]
+    valid = []
+    for index, message in enumerate(messages):
+        raw = message.get("payload") if isinstance(message, dict) else None
+        if (
+            isinstance(raw, list)
+            and len(raw) >= 4
+            and all(isinstance(byte, int) and 0 <= byte <= 255 for byte in raw[:4])
+        ):
+            valid.append(index)
+        else:
+            logger.warning(f"Malformed RadioHead payload from {records[index][0]}")
+            DECODE_FAILURES.inc("malformed_radiohead")
+
+    decoded: List[DecodedRecord] = [
+        (topic, payload, None, None) for topic, payload in records
+    ]
+    values = decode_radiohead_payloads([messages[index]["payload"] for index in valid])
+    for index, value in zip(valid, values):
+        message = messages[index]
+        message["payload"] = value
+        decoded[index] = (
+            f"{records[index][0]}/{value['sensor_id']}",
+            serialize_json_payload_as_str(message),
+            value["sensor_id"],
+            value["voltage"],
+        )
+    return decoded
+
+
+radiohead_topic_pattern = "*radiohead*"
+
+# Реестр по умолчанию, используется DatabaseManager
+registry = DecoderRegistry()
+registry.register(radiohead_topic_pattern, decode_radiohead_records)
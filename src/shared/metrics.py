@@ -0,0 +1,259 @@
+import logging
+import os
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Callable, Dict, List, Sequence, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы гистограмм задержки по умолчанию, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+# Значение метки для серий сверх max_series (ограничение кардинальности)
+OVERFLOW_LABEL = "__other__"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    Метрика с метками в текстовом формате Prometheus
+
+    Серия (набор значений меток) создается при первом обращении. Число
+    серий ограничено max_series: новые значения меток сверх него
+    складываются в серию со значениями OVERFLOW_LABEL - топик с
+    миллионом имен не раздует процесс.
+    """
+
+    metric_type = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        max_series: int = 1000,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.max_series = max_series
+        self.lock = Lock()
+        self.series: Dict[Tuple[str, ...], list] = {}
+
+    def _series(self, labels: Tuple[str, ...]) -> list:
+        series = self.series.get(labels)
+        if series is None:
+            if len(labels) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self.lock:
+                if labels not in self.series and len(self.series) >= self.max_series:
+                    labels = (OVERFLOW_LABEL,) * len(self.labelnames)
+                series = self.series.setdefault(labels, self._new_series())
+        return series
+
+    def _new_series(self) -> list:
+        return [0]
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        with self.lock:
+            items = [(labels, list(series)) for labels, series in self.series.items()]
+        for labels, series in items:
+            lines.extend(self._render_series(labels, series))
+        return lines
+
+    def _render_series(self, labels: Tuple[str, ...], series: list) -> List[str]:
+        formatted = _format_labels(self.labelnames, labels)
+        return [f"{self.name}{formatted} {_format_value(series[0])}"]
+
+
+class Counter(Metric):
+    """Монотонный счетчик"""
+
+    metric_type = "counter"
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        series = self._series(labels)
+        with self.lock:
+            series[0] += amount
+
+
+class Gauge(Metric):
+    """Значение, которое может расти и уменьшаться"""
+
+    metric_type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.functions: Dict[Tuple[str, ...], Callable[[], float]] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        self._series(labels)[0] = value
+
+    def set_function(self, function: Callable[[], float], *labels: str) -> None:
+        """Значение серии вычисляется функцией в момент выдачи метрик"""
+        self._series(labels)
+        self.functions[labels] = function
+
+    def render(self) -> List[str]:
+        for labels, function in list(self.functions.items()):
+            try:
+                self._series(labels)[0] = function()
+            except Exception as e:
+                logger.warning(f"Failed to collect {self.name}: {e}")
+        return super().render()
+
+
+class Histogram(Metric):
+    """Распределение значений по интервалам (cumulative buckets)"""
+
+    metric_type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+        max_series: int = 1000,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, max_series)
+
+    def _new_series(self) -> list:
+        # Счетчики интервалов (последний - +Inf), сумма
+        return [0] * (len(self.buckets) + 1) + [0.0]
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series(labels)
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series[index] += 1
+            series[-1] += value
+
+    def _render_series(self, labels: Tuple[str, ...], series: list) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, float("inf")), series[:-1]):
+            cumulative += count
+            formatted = _format_labels(
+                (*self.labelnames, "le"), (*labels, _format_value(bound))
+            )
+            lines.append(f"{self.name}_bucket{formatted} {cumulative}")
+        formatted = _format_labels(self.labelnames, labels)
+        lines.append(f"{self.name}_sum{formatted} {_format_value(series[-1])}")
+        lines.append(f"{self.name}_count{formatted} {cumulative}")
+        return lines
+
+
+MetricType = TypeVar("MetricType", bound=Metric)
+
+
+class MetricsRegistry:
+    """Набор метрик процесса и их выдача в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self.lock = Lock()
+
+    def _register(self, metric: MetricType) -> MetricType:
+        with self.lock:
+            # Повторная регистрация (например, второй экземпляр компонента)
+            # возвращает уже существующую метрику
+            existing = self.metrics.setdefault(metric.name, metric)
+            return existing  # pyright: ignore[reportReturnType]
+
+    def counter(self, name: str, documentation: str, *args, **kwargs) -> Counter:
+        return self._register(Counter(name, documentation, *args, **kwargs))
+
+    def gauge(self, name: str, documentation: str, *args, **kwargs) -> Gauge:
+        return self._register(Gauge(name, documentation, *args, **kwargs))
+
+    def histogram(self, name: str, documentation: str, *args, **kwargs) -> Histogram:
+        return self._register(Histogram(name, documentation, *args, **kwargs))
+
+    def render(self) -> bytes:
+        """Все метрики в текстовом формате Prometheus"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return ("\n".join(lines) + "\n").encode()
+
+    def write_textfile(self, path: str) -> None:
+        """
+        Атомарно записывает метрики в файл (textfile collector node_exporter)
+
+        Для коротких процессов вроде mqtt_logs_cleaner, которые не живут до
+        следующего опроса Prometheus
+        """
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as metrics_file:
+            metrics_file.write(self.render())
+        os.replace(temporary_path, path)
+
+
+# Реестр процесса по умолчанию
+REGISTRY = MetricsRegistry()
+
+
+def start_metrics_server(
+    port: int, host: str = "0.0.0.0", registry: MetricsRegistry = REGISTRY
+) -> ThreadingHTTPServer:
+    """Отдает метрики по HTTP (GET /metrics) из фонового потока"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Опросы Prometheus не засоряют лог
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Serving metrics on {host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def count_buckets(maximum: int) -> Tuple[int, ...]:
+    """Степени двойки до maximum включительно: границы для размеров пачек"""
+    bounds = []
+    bound = 1
+    while bound < maximum:
+        bounds.append(bound)
+        bound *= 2
+    bounds.append(maximum)
+    return tuple(bounds)
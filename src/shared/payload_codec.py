@@ -0,0 +1,130 @@
+import hashlib
+import os
+import sqlite3
+import zlib
+from contextlib import closing
+from threading import Lock
+from typing import Dict, Iterable, Optional
+from urllib.request import pathname2url
+
+from .config import PAYLOAD_DICT_SIZE
+
+
+def payload_hash(payload: str) -> bytes:
+    """Адрес payload в таблице payloads: 16 байт BLAKE2b от текста"""
+    return hashlib.blake2b(payload.encode(), digest_size=16).digest()
+
+
+def train_dictionary(samples: Iterable[str], size: int = PAYLOAD_DICT_SIZE) -> bytes:
+    """
+    Словарь zlib из недавних payload
+
+    Словарь - это просто текст, на который ссылается сжатие: небольшие
+    однотипные JSON-сообщения сжимаются в основном за счет общих ключей и
+    фрагментов значений. zlib лучше находит совпадения в конце словаря,
+    поэтому самые свежие образцы ставятся последними.
+    """
+    dictionary = bytearray()
+    seen = set()
+    for sample in reversed(list(samples)):
+        if sample in seen:
+            continue
+        seen.add(sample)
+        dictionary[:0] = sample.encode()
+        if len(dictionary) >= size:
+            break
+    return bytes(dictionary[-size:])
+
+
+class PayloadCodec:
+    """
+    Сжатие payload общим словарем zlib (raw deflate без заголовка)
+
+    Словари хранятся в таблице payload_dicts и никогда не меняются:
+    сжатый payload ссылается на id своего словаря, NULL - сжат без словаря.
+    Распаковка выполняется SQL-функцией inflate_payload(data, dict_id),
+    которую ConnectionManager регистрирует на каждом соединении, поэтому
+    payload распаковывается только там, где его читают. Словарь, которого
+    процесс еще не видел, дочитывается отдельным соединением.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.lock = Lock()
+        self.dictionaries: Dict[int, bytes] = {}
+        # Подготовленные компрессоры: установка словаря стоит дороже копии
+        self.compressors: Dict[Optional[int], "zlib._Compress"] = {}
+
+    @property
+    def current(self) -> Optional[int]:
+        """id самого нового известного словаря"""
+        return max(self.dictionaries, default=None)
+
+    def refresh(self, cursor: sqlite3.Cursor) -> None:
+        """Дочитывает словари, созданные после уже известных"""
+        cursor.execute(
+            "SELECT id, data FROM payload_dicts WHERE id > ? ORDER BY id",
+            (self.current or 0,),
+        )
+        for dict_id, data in cursor.fetchall():
+            self.add(dict_id, data)
+
+    def dictionary(self, dict_id: int) -> bytes:
+        """Байты словаря; неизвестный словарь читается из базы"""
+        dictionary = self.dictionaries.get(dict_id)
+        if dictionary is None:
+            # Вызывается изнутри SQL-функции: запрос через то же соединение
+            # вложил бы выражение в выполняющееся, поэтому открываем свое
+            database = f"file:{pathname2url(os.path.abspath(self.db_path))}?mode=ro"
+            with closing(sqlite3.connect(database, uri=True)) as conn:
+                row = conn.execute(
+                    "SELECT data FROM payload_dicts WHERE id = ?", (dict_id,)
+                ).fetchone()
+            if row is None:
+                raise KeyError(f"Unknown payload dictionary {dict_id}")
+            dictionary = row[0]
+            self.add(dict_id, dictionary)
+        return dictionary
+
+    def add(self, dict_id: int, dictionary: bytes) -> None:
+        with self.lock:
+            self.dictionaries[dict_id] = dictionary
+
+    def compress(
+        self,
+        payload: str,
+        dict_id: Optional[int] = None,
+        dictionary: Optional[bytes] = None,
+    ) -> bytes:
+        """
+        Сжимает payload словарем dict_id
+
+        Байты еще не закоммиченного словаря передаются явно (dictionary): для
+        него компрессор не кэшируется, так как при откате id достанется
+        другому словарю
+        """
+        compressor = self.compressors.get(dict_id) if dictionary is None else None
+        if compressor is None:
+            if dict_id is None:
+                compressor = zlib.compressobj(9, zlib.DEFLATED, -15)
+            else:
+                compressor = zlib.compressobj(
+                    9,
+                    zlib.DEFLATED,
+                    -15,
+                    zdict=dictionary or self.dictionary(dict_id),
+                )
+            if dictionary is None:
+                self.compressors[dict_id] = compressor
+        worker = compressor.copy()
+        return worker.compress(payload.encode()) + worker.flush()
+
+    def inflate(self, data: Optional[bytes], dict_id: Optional[int]) -> Optional[str]:
+        """Распаковывает payload (SQL-функция inflate_payload)"""
+        if data is None:
+            return None
+        if dict_id is None:
+            decompressor = zlib.decompressobj(-15)
+        else:
+            decompressor = zlib.decompressobj(-15, zdict=self.dictionary(dict_id))
+        return (decompressor.decompress(data) + decompressor.flush()).decode()
@@ -1,22 +1,34 @@
+import struct
 from typing import List, TypedDict
 
 """Decode RadioHead payload"""
 
+# Bytes 0-3: 16-bit sensor ID and 16-bit voltage in hundredths of a volt,
+# both little-endian unsigned. Shared by the single and batch decoders
+RADIOHEAD_LAYOUT = struct.Struct("<HH")
+VOLTAGE_SCALE = 100.0
+
 
 class Payload(TypedDict):
     sensor_id: int
     voltage: float
 
 
-def decode_radiohead_payload(payload: List[int]) -> Payload:
-    # Extract 16-bit sensor ID (bytes 0-1)
-    sensor_id = (payload[1] << 8) | payload[0]
-
-    # Extract 16-bit voltage (bytes 2-3)
-    voltage_raw = (payload[3] << 8) | payload[2]
-    voltage = voltage_raw / 100.0
-
+def _payload(sensor_id: int, voltage_raw: int) -> Payload:
     return {
         "sensor_id": sensor_id,
-        "voltage": voltage,
+        "voltage": voltage_raw / VOLTAGE_SCALE,
     }
+
+
+def decode_radiohead_payload(payload: List[int]) -> Payload:
+    return _payload(*RADIOHEAD_LAYOUT.unpack(bytes(payload[: RADIOHEAD_LAYOUT.size])))
+
+
+def decode_radiohead_payloads(payloads: List[List[int]]) -> List[Payload]:
+    """Decode a batch of RadioHead payloads in one pass over a byte buffer"""
+    # The layout bytes of every payload, back to back
+    buffer = bytearray()
+    for payload in payloads:
+        buffer += bytes(payload[: RADIOHEAD_LAYOUT.size])
+    return [_payload(*values) for values in RADIOHEAD_LAYOUT.iter_unpack(buffer)]
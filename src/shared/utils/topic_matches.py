@@ -0,0 +1,14 @@
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """Совпадает ли топик с фильтром подписки MQTT (+ и #)"""
+    if topic.startswith("$") and topic_filter[:1] in ("+", "#"):
+        return False
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    for index, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if index >= len(topic_levels):
+            return False
+        if level != "+" and level != topic_levels[index]:
+            return False
+    return len(filter_levels) == len(topic_levels)
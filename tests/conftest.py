@@ -0,0 +1,19 @@
+import os
+import tempfile
+
+import pytest
+
+# shared.config читает окружение при импорте: база тестов - во временном
+# каталоге, пачки коммитятся раз в секунду
+os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="mqtt-tests-"), "test.db")
+os.environ.setdefault("BATCH_TIMEOUT", "1")
+
+
+@pytest.fixture
+def db_manager(tmp_path):
+    """Новая база в каталоге теста"""
+    from shared.database import DatabaseManager
+
+    db_manager = DatabaseManager(str(tmp_path / "test.db"))
+    yield db_manager
+    db_manager.close()
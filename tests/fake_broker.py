@@ -0,0 +1,245 @@
+import logging
+import socket
+import struct
+from itertools import count
+from threading import Lock, Thread
+from typing import Dict, List, Optional, Tuple
+
+from shared.utils.topic_matches import topic_matches
+
+logger = logging.getLogger(__name__)
+
+# Типы пакетов MQTT 3.1.1
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK = 8, 9, 10, 11
+PINGREQ, PINGRESP, DISCONNECT = 12, 13, 14
+
+
+def _encode_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(encoded)
+
+
+def _encode_string(value: str) -> bytes:
+    data = value.encode()
+    return struct.pack("!H", len(data)) + data
+
+
+def _packet(packet_type: int, flags: int, body: bytes) -> bytes:
+    return bytes([packet_type << 4 | flags]) + _encode_length(len(body)) + body
+
+
+class _Session:
+    """Подключенный клиент: сокет и подписки (фильтр -> QoS)"""
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.client_id = ""
+        self.subscriptions: Dict[str, int] = {}
+        self.lock = Lock()
+        self.packet_ids = count(1)
+
+    def send(self, data: bytes) -> None:
+        with self.lock:
+            self.sock.sendall(data)
+
+    def recv_exact(self, size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            chunk = self.sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("Client closed the connection")
+            data += chunk
+        return data
+
+
+class FakeBroker:
+    """
+    Минимальный брокер MQTT 3.1.1 в процессе - для тестов и бенчмарков приема
+
+    Лежит в tests/, а не в пакетах сервисов: в образы он не попадает.
+
+    Поддерживает CONNECT, SUBSCRIBE/UNSUBSCRIBE с фильтрами + и #, PUBLISH с
+    QoS 0-2 и общие подписки $share/<группа>/<фильтр> (сообщение получает
+    один участник группы по кругу). Исходящие сообщения отправляются с QoS
+    не выше 1; retained, will, сессии и MQTT v5 не поддерживаются.
+
+    Пример:
+        broker = FakeBroker()
+        port = broker.start()
+        ...  # MQTTClient(callback, broker="127.0.0.1", port=port)
+        broker.publish("sensors/a", b"42", qos=1)
+        broker.stop()
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.server: Optional[socket.socket] = None
+        self.sessions: List[_Session] = []
+        self.lock = Lock()
+        # Очередь выдачи в общих подписках: (группа, фильтр) -> номер
+        self.shared_turns: Dict[Tuple[str, str], int] = {}
+        self.published = 0
+
+    def start(self) -> int:
+        """Начинает принимать подключения и возвращает порт"""
+        self.server = socket.create_server((self.host, self.port))
+        self.port = self.server.getsockname()[1]
+        Thread(target=self._accept_loop, name="fake-broker", daemon=True).start()
+        logger.info(f"Fake MQTT broker listening on {self.host}:{self.port}")
+        return self.port
+
+    def stop(self) -> None:
+        """Закрывает сервер и все подключения"""
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+        with self.lock:
+            sessions, self.sessions = self.sessions, []
+        for session in sessions:
+            session.sock.close()
+
+    def publish(self, topic: str, payload: bytes, qos: int = 0) -> int:
+        """
+        Доставляет сообщение подписчикам, как если бы его опубликовал клиент
+
+        Returns:
+            int: Количество получивших сообщение клиентов
+        """
+        self.published += 1
+        deliveries: Dict[_Session, int] = {}
+        groups: Dict[Tuple[str, str], List[Tuple[_Session, int]]] = {}
+        with self.lock:
+            for session in self.sessions:
+                for topic_filter, granted in session.subscriptions.items():
+                    if topic_filter.startswith("$share/"):
+                        _, group, shared_filter = topic_filter.split("/", 2)
+                        if topic_matches(shared_filter, topic):
+                            groups.setdefault((group, shared_filter), []).append(
+                                (session, granted)
+                            )
+                    elif topic_matches(topic_filter, topic):
+                        deliveries[session] = max(deliveries.get(session, 0), granted)
+            for key, members in groups.items():
+                turn = self.shared_turns.get(key, 0)
+                self.shared_turns[key] = turn + 1
+                session, granted = members[turn % len(members)]
+                deliveries[session] = max(deliveries.get(session, 0), granted)
+
+        for session, granted in deliveries.items():
+            delivery_qos = min(qos, granted, 1)
+            body = _encode_string(topic)
+            if delivery_qos:
+                body += struct.pack("!H", next(session.packet_ids) % 65535 + 1)
+            try:
+                session.send(_packet(PUBLISH, delivery_qos << 1, body + payload))
+            except OSError:
+                logger.warning(f"Failed to deliver to {session.client_id}")
+        return len(deliveries)
+
+    def _accept_loop(self) -> None:
+        while self.server is not None:
+            try:
+                sock, _ = self.server.accept()
+            except OSError:
+                return
+            session = _Session(sock)
+            with self.lock:
+                self.sessions.append(session)
+            Thread(
+                target=self._serve,
+                args=(session,),
+                name="fake-broker-client",
+                daemon=True,
+            ).start()
+
+    def _serve(self, session: _Session) -> None:
+        try:
+            while True:
+                header = session.recv_exact(1)[0]
+                length, multiplier = 0, 1
+                while True:
+                    byte = session.recv_exact(1)[0]
+                    length += (byte & 0x7F) * multiplier
+                    multiplier *= 128
+                    if not byte & 0x80:
+                        break
+                body = session.recv_exact(length)
+                if not self._handle(session, header >> 4, header & 0x0F, body):
+                    break
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            with self.lock:
+                if session in self.sessions:
+                    self.sessions.remove(session)
+            session.sock.close()
+
+    def _handle(
+        self, session: _Session, packet_type: int, flags: int, body: bytes
+    ) -> bool:
+        """Обрабатывает пакет клиента; False - закрыть подключение"""
+        if packet_type == CONNECT:
+            name_length = struct.unpack_from("!H", body)[0]
+            # Имя протокола, уровень, флаги, keepalive, затем client id
+            offset = 2 + name_length + 4
+            id_length = struct.unpack_from("!H", body, offset)[0]
+            session.client_id = body[offset + 2 : offset + 2 + id_length].decode()
+            session.send(_packet(CONNACK, 0, b"\x00\x00"))
+        elif packet_type == SUBSCRIBE:
+            packet_id, offset, granted = body[:2], 2, bytearray()
+            while offset < len(body):
+                length = struct.unpack_from("!H", body, offset)[0]
+                topic_filter = body[offset + 2 : offset + 2 + length].decode()
+                qos = body[offset + 2 + length]
+                offset += 3 + length
+                session.subscriptions[topic_filter] = qos
+                granted.append(qos)
+            session.send(_packet(SUBACK, 0, packet_id + bytes(granted)))
+        elif packet_type == UNSUBSCRIBE:
+            packet_id, offset = body[:2], 2
+            while offset < len(body):
+                length = struct.unpack_from("!H", body, offset)[0]
+                session.subscriptions.pop(
+                    body[offset + 2 : offset + 2 + length].decode(), None
+                )
+                offset += 2 + length
+            session.send(_packet(UNSUBACK, 0, packet_id))
+        elif packet_type == PUBLISH:
+            qos = (flags >> 1) & 0x03
+            length = struct.unpack_from("!H", body)[0]
+            topic = body[2 : 2 + length].decode()
+            offset = 2 + length
+            packet_id = body[offset : offset + 2] if qos else b""
+            self.publish(topic, body[offset + len(packet_id) :], qos)
+            if qos == 1:
+                session.send(_packet(PUBACK, 0, packet_id))
+            elif qos == 2:
+                session.send(_packet(PUBREC, 0, packet_id))
+        elif packet_type == PUBREL:
+            session.send(_packet(PUBCOMP, 0, body[:2]))
+        elif packet_type == PINGREQ:
+            session.send(_packet(PINGRESP, 0, b""))
+        elif packet_type == DISCONNECT:
+            return False
+        # PUBACK и PUBCOMP от клиента: подтверждения не отслеживаются
+        return True
+
+
+if __name__ == "__main__":
+    # Локальный брокер для разработки: PYTHONPATH=src python -m tests.fake_broker
+    import time
+
+    logging.basicConfig(level=logging.INFO)
+    fake_broker = FakeBroker(port=1883)
+    fake_broker.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        fake_broker.stop()
@@ -0,0 +1,165 @@
+import json
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from mqtt_logs_api import main
+from mqtt_logs_api.async_database import AsyncDatabaseManager
+from shared.database import DAY_MS, DatabaseManager, utc_now_ms
+
+NOW = utc_now_ms()
+
+
+@pytest.fixture(scope="module")
+def db_path(tmp_path_factory):
+    """Своя база API на модуль: база DB_PATH остается пустой для test_ingest"""
+    path = str(tmp_path_factory.mktemp("api") / "api.db")
+    DatabaseManager(path).close()
+    return path
+
+
+@pytest.fixture(scope="module")
+def client(db_path):
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(main, "db_manager", AsyncDatabaseManager(db_path))
+        with TestClient(main.app) as client:
+            yield client
+
+
+@pytest.fixture
+def writer(db_path):
+    """Соединение на запись к базе API, как у логгера"""
+    db_manager = DatabaseManager(db_path)
+    yield db_manager
+    db_manager.close()
+
+
+@pytest.fixture
+def prefix():
+    """Свои топики у каждого теста: база API общая для модуля"""
+    return f"test-{uuid.uuid4().hex[:8]}"
+
+
+def _insert(writer, records: list, received: list) -> None:
+    assert writer.insert_batch(records, received=received)
+
+
+def _pages(client, params: dict) -> list:
+    """Все страницы /api/data по курсору X-Next-Cursor"""
+    pages, cursor = [], None
+    # Курсор, не продвигающий обход, не должен зацикливать тест
+    for _ in range(100):
+        response = client.get(
+            "/api/data", params={**params, **({"cursor": cursor} if cursor else {})}
+        )
+        assert response.status_code == 200
+        if not response.json():
+            return pages
+        pages.append(response.json())
+        cursor = response.headers["X-Next-Cursor"]
+    pytest.fail("cursor paging does not advance")
+
+
+@pytest.mark.parametrize("order", ["desc", "asc"])
+def test_cursor_paging_across_topics(client, writer, prefix, order):
+    """Слияние топиков по (timestamp, id): без повторов и пропусков на границах"""
+    for topic in "abc":
+        # По две записи на миллисекунду: граница страницы попадает внутрь группы
+        _insert(
+            writer,
+            [(f"{prefix}/{topic}", f"{topic}{index}") for index in range(7)],
+            [NOW - index // 2 for index in range(7)],
+        )
+
+    params = {"topic": f"{prefix}/+", "order": order}
+    [everything] = _pages(client, {**params, "limit": 1000})
+    pages = _pages(client, {**params, "limit": 4})
+
+    assert len(everything) == 21
+    keys = [(record["timestamp"], record["id"]) for record in everything]
+    assert keys == sorted(keys, reverse=order == "desc")
+    assert [len(page) for page in pages] == [4, 4, 4, 4, 4, 1]
+    assert [record for page in pages for record in page] == everything
+
+
+def test_merged_matches_single_topic_scans(writer, prefix):
+    topics = tuple(f"{prefix}/{topic}" for topic in "abc")
+    for offset, topic in enumerate(topics):
+        _insert(
+            writer,
+            [(topic, str(index)) for index in range(5)],
+            [NOW - index * 3 - offset for index in range(5)],
+        )
+
+    merged = writer.get_sensor_data_merged(topics, limit=7)
+    scans = sorted(
+        (row for topic in topics for row in writer.get_sensor_data_json(topic, 7)),
+        key=lambda row: (row[1], row[0]),
+        reverse=True,
+    )
+    assert [tuple(row) for row in merged] == [tuple(row) for row in scans[:7]]
+
+    after = (merged[-1][1], merged[-1][0])
+    rest = writer.get_sensor_data_merged(topics, limit=100, after=after)
+    assert [tuple(row) for row in rest] == [tuple(row) for row in scans[7:]]
+
+
+def test_etag_changes_only_with_topic_records(client, writer, prefix):
+    topic = f"{prefix}/a"
+    _insert(writer, [(topic, "1")], [NOW])
+    first = client.get("/api/data", params={"topic": topic})
+    etag = first.headers["ETag"]
+
+    cached = client.get(
+        "/api/data", params={"topic": topic}, headers={"If-None-Match": etag}
+    )
+    assert cached.status_code == 304
+
+    # Записи другого топика ответ не меняют
+    _insert(writer, [(f"{prefix}/b", "1")], [NOW])
+    cached = client.get(
+        "/api/data", params={"topic": topic}, headers={"If-None-Match": etag}
+    )
+    assert cached.status_code == 304
+
+    # Запоздавшая пачка старше уже записанных - тоже новая версия
+    _insert(writer, [(topic, "0")], [NOW - 60_000])
+    changed = client.get(
+        "/api/data", params={"topic": topic}, headers={"If-None-Match": etag}
+    )
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert [record["payload"] for record in changed.json()] == ["1", "0"]
+
+
+def test_etag_changes_after_retention(client, writer, prefix):
+    topic = f"{prefix}/a"
+    _insert(writer, [(topic, "old"), (topic, "new")], [NOW - 100 * DAY_MS, NOW])
+    etag = client.get("/api/data", params={"topic": topic}).headers["ETag"]
+
+    assert writer.delete_old_records(3, pause=0) >= 1
+    response = client.get(
+        "/api/data", params={"topic": topic}, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert [record["payload"] for record in response.json()] == ["new"]
+
+
+def test_invalid_filter_and_cursor_are_rejected(client, prefix):
+    for params in ({"filter": "voltage<3"}, {"cursor": "not-a-cursor"}):
+        response = client.get("/api/data", params={"topic": f"{prefix}/a", **params})
+        assert response.status_code == 400
+
+
+def test_filter_parameter(client, writer, prefix):
+    topic = f"{prefix}/a"
+    payloads = [json.dumps({"voltage": voltage}) for voltage in (3.0, 3.2, 3.4)]
+    _insert(writer, [(topic, payload) for payload in payloads], [NOW, NOW + 1, NOW + 2])
+
+    response = client.get(
+        "/api/data",
+        params={"topic": topic, "filter": "$.voltage>3.1", "order": "asc"},
+    )
+    assert [record["payload"] for record in response.json()] == payloads[1:]
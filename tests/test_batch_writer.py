@@ -0,0 +1,84 @@
+import pytest
+
+from mqtt_logger import batch_writer
+from mqtt_logger.batch_writer import BatchWriter
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(batch_writer, "RETRY_DELAY", 0.01)
+
+
+def _writer(db_manager, tmp_path, decode_workers: int = 0) -> BatchWriter:
+    return BatchWriter(
+        db_manager,
+        batch_size=4,
+        batch_timeout=0.05,
+        spill_path=str(tmp_path / "spill"),
+        spool_path=str(tmp_path / "spool"),
+        decode_workers=decode_workers,
+    )
+
+
+def _payloads(db_manager) -> list:
+    with db_manager.get_connection() as conn:
+        return [
+            row[0]
+            for row in conn.execute("SELECT payload FROM sensor_data ORDER BY id")
+        ]
+
+
+def _submit(writer: BatchWriter, count: int) -> None:
+    for index in range(count):
+        writer.submit(("sensors/a", str(index).encode(), 1_700_000_000_000 + index))
+
+
+@pytest.mark.parametrize("decode_workers", [0, 2])
+def test_writer_error_retries_batches_in_progress(db_manager, tmp_path, decode_workers):
+    """Пачки, прерванные неожиданной ошибкой, записываются заново по порядку"""
+    insert_decoded = db_manager.insert_decoded
+    failures = []
+
+    def failing_once(*args):
+        if not failures:
+            failures.append(args)
+            raise RuntimeError("injected writer error")
+        return insert_decoded(*args)
+
+    db_manager.insert_decoded = failing_once
+    writer = _writer(db_manager, tmp_path, decode_workers)
+    writer.start()
+    _submit(writer, 10)
+    writer.stop()
+
+    assert failures
+    assert writer.errors == 1
+    assert writer.abandoned == 0
+    assert _payloads(db_manager) == [str(index) for index in range(10)]
+    assert db_manager.get_spool_seq() == 10
+
+
+def test_abandoned_records_are_replayed_from_spool(db_manager, tmp_path):
+    """Записи, не записанные до остановки, воспроизводятся из журнала"""
+    insert_decoded = db_manager.insert_decoded
+
+    def failing(*args):
+        raise RuntimeError("injected writer error")
+
+    db_manager.insert_decoded = failing
+    writer = _writer(db_manager, tmp_path)
+    writer.start()
+    _submit(writer, 10)
+    writer.stop()
+
+    assert writer.abandoned == 10
+    assert _payloads(db_manager) == []
+    assert db_manager.get_spool_seq() == 0
+
+    db_manager.insert_decoded = insert_decoded
+    restarted = _writer(db_manager, tmp_path)
+    restarted.start()
+    restarted.stop()
+
+    assert restarted.replayed == 10
+    assert _payloads(db_manager) == [str(index) for index in range(10)]
@@ -0,0 +1,37 @@
+import pytest
+
+from mqtt_logs_api.downsample import lttb_points
+
+
+def _series(values: list) -> list:
+    return [(second, f"t{second}", value) for second, value in enumerate(values)]
+
+
+def test_lttb_keeps_short_series():
+    points = _series([1.0, 5.0, 2.0, 4.0])
+    assert lttb_points(points, 0, 4, 10) == [
+        {"timestamp": timestamp, "value": value} for _, timestamp, value in points
+    ]
+
+
+def test_lttb_keeps_bounds_and_peak():
+    """Первая и последняя точки всегда в ответе, выброс не усредняется"""
+    values = [0.0] * 1000
+    values[537] = 100.0
+    result = lttb_points(_series(values), 0, 1000, 50)
+
+    assert len(result) <= 50
+    assert result[0]["timestamp"] == "t0"
+    assert result[-1]["timestamp"] == "t999"
+    assert {"timestamp": "t537", "value": 100.0} in result
+    seconds = [int(point["timestamp"][1:]) for point in result]
+    assert seconds == sorted(set(seconds))
+
+
+def test_lttb_empty_series():
+    assert lttb_points([], 0, 10, 5) == []
+
+
+def test_lttb_rejects_small_limit():
+    with pytest.raises(ValueError):
+        lttb_points(_series([1.0, 2.0, 3.0]), 0, 3, 2)
@@ -0,0 +1,40 @@
+import gzip
+import json
+from urllib.parse import unquote
+
+import pytest
+
+from mqtt_logs_api.export import ExportEncoder, content_disposition, export_filename
+
+
+@pytest.mark.parametrize(
+    "name",
+    ['a"; filename="evil.sh', "датчики/кухня", "x;y=z", "../..", None],
+)
+def test_content_disposition_is_safe(name):
+    filename = export_filename("csv", True, name)
+    header = content_disposition(filename)
+
+    plain, encoded = header.split("; filename*=UTF-8''")
+    assert plain.startswith('attachment; filename="') and plain.endswith('"')
+    fallback = plain[len('attachment; filename="') : -1]
+    assert fallback and all(
+        c.isascii() and (c.isalnum() or c in "._-") for c in fallback
+    )
+    assert fallback.endswith(".csv.gz")
+    assert header.isascii() and '"' not in encoded and ";" not in encoded
+    assert unquote(encoded) == filename
+
+
+def test_export_encoder_round_trip():
+    rows = [(1, "sensors/a", '{"v": 1}', "2024-01-01 00:00:00.000")]
+    encoder = ExportEncoder("ndjson", compress=True)
+    data = gzip.decompress(encoder.header() + encoder.encode(rows) + encoder.finish())
+    assert [json.loads(line) for line in data.decode().splitlines()] == [
+        {
+            "id": 1,
+            "topic": "sensors/a",
+            "payload": '{"v": 1}',
+            "timestamp": "2024-01-01 00:00:00.000",
+        }
+    ]
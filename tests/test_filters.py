@@ -0,0 +1,89 @@
+import json
+import struct
+
+import pytest
+
+from mqtt_logs_api.filters import parse_field_filter
+from shared import database
+from shared.database import field_index_sql, field_value_sql, utc_now_ms
+
+NOW = utc_now_ms()
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("$.payload.voltage<3.3", ("$.payload.voltage", "<", 3.3)),
+        ("$.payload.voltage >= 3", ("$.payload.voltage", ">=", 3)),
+        ('$.name="kitchen"', ("$.name", "=", "kitchen")),
+        ("$.name!=kitchen", ("$.name", "!=", "kitchen")),
+        ("$.ok=true", ("$.ok", "=", 1)),
+        ("$.items[0]>0", ("$.items[0]", ">", 0)),
+    ],
+)
+def test_parse_field_filter(text, expected):
+    assert parse_field_filter(text) == expected
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["voltage<3", "$.voltage", "$.voltage<>3", "$..voltage=1", "$.a'b=1", "$.a=[1]"],
+)
+def test_parse_field_filter_rejects(text):
+    with pytest.raises(ValueError):
+        parse_field_filter(text)
+
+
+READINGS = [(3.0, "a"), (3.2, "b"), (3.4, "a"), (3.6, "b")]
+
+
+def _payload(topic: str, voltage: float, name: str) -> str:
+    if topic == "radiohead":
+        # Байты RadioHead: sensor_id 7 и напряжение в сотых долях вольта
+        raw = list(struct.pack("<HH", 7, round(voltage * 100)))
+        return json.dumps({"payload": raw, "name": name})
+    return json.dumps({"payload": {"voltage": voltage}, "name": name})
+
+
+def _voltages(rows: list) -> list:
+    return [json.loads(row["payload"])["payload"]["voltage"] for row in rows]
+
+
+@pytest.mark.parametrize("storage", ["text", "compressed"])
+@pytest.mark.parametrize(
+    "received_topic, topic", [("radiohead", "radiohead/7"), ("sensors/a", "sensors/a")]
+)
+def test_filtered_sensor_data(monkeypatch, db_manager, storage, received_topic, topic):
+    """Индексированное (radiohead, типизированная колонка) и обычное поле"""
+    monkeypatch.setattr(database, "PAYLOAD_STORAGE", storage)
+    records = [
+        (received_topic, _payload(received_topic, voltage, name))
+        for voltage, name in READINGS
+    ]
+    records.append((topic, "not json"))
+    assert db_manager.insert_batch(
+        records, received=[NOW + index for index in range(len(records))]
+    )
+
+    voltage = [("$.payload.voltage", "<", 3.3)]
+    assert _voltages(db_manager.get_sensor_data(topic, 10, filters=voltage)) == [
+        3.2,
+        3.0,
+    ]
+    both = voltage + [("$.name", "=", "b")]
+    assert _voltages(db_manager.get_sensor_data(topic, 10, filters=both)) == [3.2]
+    assert db_manager.get_sensor_data(topic, 10, filters=[("$.missing", "!=", 0)]) == []
+
+
+def test_filter_sql_uses_index_expression(db_manager):
+    assert db_manager._field_filter_sql(
+        "radiohead/7", "$.payload.voltage"
+    ) == field_index_sql("$.payload.voltage")
+    assert db_manager._field_filter_sql(
+        "sensors/a", "$.payload.voltage"
+    ) == field_value_sql("$.payload.voltage")
+
+
+def test_filter_rejects_unknown_operator(db_manager):
+    with pytest.raises(ValueError):
+        db_manager.get_sensor_data("sensors/a", 10, filters=[("$.a", "LIKE", "x")])
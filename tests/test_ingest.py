@@ -0,0 +1,85 @@
+import time
+
+import pytest
+
+from mqtt_logger.mqtt_app import MQTTApp
+from mqtt_logger.mqtt_client import MQTTClient, parse_subscriptions
+from shared.database import DatabaseManager
+
+from .fake_broker import FakeBroker
+
+
+def _wait_for(condition, timeout: float = 10.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+@pytest.fixture
+def broker():
+    broker = FakeBroker()
+    broker.start()
+    yield broker
+    broker.stop()
+
+
+def test_wildcard_subscriptions_are_committed(broker):
+    """Сообщения по подпискам "фильтр:qos" с + и # доходят до базы"""
+    app = MQTTApp()
+    app.mqtt_client = MQTTClient(
+        app.on_mqtt_message,
+        parse_subscriptions("sensors/+/temp:1, alerts/#:2, status", default_qos=0),
+        broker="127.0.0.1",
+        port=broker.port,
+    )
+    app.writer.start()
+    app.mqtt_client.connect()
+    app.mqtt_client.start()
+    try:
+        assert _wait_for(
+            lambda: broker.sessions and len(broker.sessions[0].subscriptions) == 3
+        )
+        assert broker.sessions[0].subscriptions == {
+            "sensors/+/temp": 1,
+            "alerts/#": 2,
+            "status": 0,
+        }
+
+        published = {
+            "sensors/a/temp": b'{"value": 21.5}',
+            "sensors/a/b/temp": b'{"value": 1}',  # + - ровно один уровень
+            "sensors/b/humidity": b'{"value": 2}',
+            "alerts": b"parent",  # # совпадает и с родительским уровнем
+            "alerts/door/open": b"door",
+            "status": b"online",
+            "status/extra": b"ignored",
+        }
+        delivered = [
+            topic
+            for topic, payload in published.items()
+            if broker.publish(topic, payload, qos=1)
+        ]
+        assert delivered == ["sensors/a/temp", "alerts", "alerts/door/open", "status"]
+        assert _wait_for(lambda: app.writer.received == len(delivered))
+    finally:
+        # Остановка дописывает очередь в базу
+        app.stop_and_disconnect()
+
+    db_manager = DatabaseManager(app.db_manager.db_path)
+    try:
+        with db_manager.get_connection() as conn:
+            rows = conn.execute(
+                "SELECT t.name, s.payload FROM sensor_data s "
+                "JOIN topics t ON t.id = s.topic_id ORDER BY s.id"
+            ).fetchall()
+    finally:
+        db_manager.close()
+    assert [tuple(row) for row in rows] == [
+        ("sensors/a/temp", '{"value": 21.5}'),
+        ("alerts", "parent"),
+        ("alerts/door/open", "door"),
+        ("status", "online"),
+    ]
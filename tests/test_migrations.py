@@ -0,0 +1,179 @@
+import sqlite3
+
+import pytest
+
+from shared import database
+from shared.database import SCHEMA_VERSION, DatabaseManager, parse_timestamp
+
+RADIOHEAD_1 = '{"payload": {"sensor_id": 7, "voltage": 3.3}}'
+RADIOHEAD_2 = '{"payload": {"sensor_id": 7, "voltage": 3.1}}'
+# (топик, payload, время текстом, как в схемах до версии 9)
+ROWS = [
+    ("radiohead/7", RADIOHEAD_1, "2024-01-15 10:00:00"),
+    ("sensors/a", "21.5", "2024-01-15 10:00:30"),
+    ("sensors/a", "22.5", "2024-01-15 10:59:00"),
+    ("radiohead/7", RADIOHEAD_2, "2024-02-01 12:30:00"),
+]
+
+
+def _create_v0(path: str) -> None:
+    """Исходная схема: топик текстом в каждой строке sensor_data"""
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE sensor_data (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            topic TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX idx_timestamp ON sensor_data(timestamp);
+        """
+    )
+    conn.executemany(
+        "INSERT INTO sensor_data (topic, payload, timestamp) VALUES (?, ?, ?)", ROWS
+    )
+    conn.commit()
+    conn.close()
+
+
+def _create_v3(path: str) -> None:
+    """
+    Схема версии 3: партиции без типизированных колонок и payload_id,
+    время текстом, каталог топиков заполнен
+    """
+    conn = sqlite3.connect(path)
+    conn.executescript(
+        """
+        CREATE TABLE topics (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            first_seen DATETIME,
+            last_seen DATETIME,
+            message_count INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE ingest_state (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        INSERT INTO ingest_state VALUES ('last_row_id', 4);
+        """
+    )
+    for partition in ("sensor_data_202401", "sensor_data_202402"):
+        conn.execute(
+            f"""
+            CREATE TABLE {partition} (
+                id INTEGER PRIMARY KEY,
+                topic_id INTEGER NOT NULL REFERENCES topics(id),
+                payload TEXT NOT NULL,
+                timestamp DATETIME NOT NULL
+            )
+            """
+        )
+        conn.execute(
+            f"CREATE INDEX idx_{partition}_topic_timestamp "
+            f"ON {partition}(topic_id, timestamp)"
+        )
+    topic_ids = {}
+    for record_id, (topic, payload, timestamp) in enumerate(ROWS, 1):
+        topic_id = topic_ids.setdefault(topic, len(topic_ids) + 1)
+        conn.execute(
+            "INSERT INTO topics (id, name, first_seen, last_seen, message_count) "
+            "VALUES (?, ?, ?, ?, 1) ON CONFLICT(id) DO UPDATE SET "
+            "last_seen = excluded.last_seen, message_count = message_count + 1",
+            (topic_id, topic, timestamp, timestamp),
+        )
+        conn.execute(
+            f"INSERT INTO sensor_data_{timestamp[:4]}{timestamp[5:7]} "
+            "VALUES (?, ?, ?, ?)",
+            (record_id, topic_id, payload, timestamp),
+        )
+    conn.execute(
+        "CREATE VIEW sensor_data AS "
+        "SELECT id, topic_id, payload, timestamp FROM sensor_data_202401 UNION ALL "
+        "SELECT id, topic_id, payload, timestamp FROM sensor_data_202402"
+    )
+    conn.execute("PRAGMA user_version = 3")
+    conn.commit()
+    conn.close()
+
+
+def _check_migrated(db_manager: DatabaseManager) -> None:
+    with db_manager.get_connection() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        rows = conn.execute(
+            "SELECT s.id, t.name, s.payload, s.timestamp, s.voltage "
+            "FROM sensor_data s JOIN topics t ON t.id = s.topic_id ORDER BY s.id"
+        ).fetchall()
+        assert [tuple(row) for row in rows] == [
+            (record_id, topic, payload, parse_timestamp(timestamp), voltage)
+            for record_id, (topic, payload, timestamp), voltage in zip(
+                range(1, len(ROWS) + 1), ROWS, (3.3, None, None, 3.1)
+            )
+        ]
+        daily = conn.execute(
+            "SELECT t.name, d.day, d.row_count FROM daily_stats d "
+            "JOIN topics t ON t.id = d.topic_id ORDER BY t.name, d.day"
+        ).fetchall()
+        assert [tuple(row) for row in daily] == [
+            ("radiohead/7", "2024-01-15", 1),
+            ("radiohead/7", "2024-02-01", 1),
+            ("sensors/a", "2024-01-15", 2),
+        ]
+
+    catalog = {
+        row["topic"]: row["message_count"] for row in db_manager.get_topic_catalog()
+    }
+    assert catalog == {"radiohead/7": 2, "sensors/a": 2}
+
+    assert [
+        (row["message_count"], row["min"], row["max"], row["last"])
+        for row in db_manager.get_rollups("radiohead/7", "1h")
+    ] == [(1, 3.3, 3.3, 3.3), (1, 3.1, 3.1, 3.1)]
+    assert [
+        (row["message_count"], row["min"], row["max"], row["last"])
+        for row in db_manager.get_rollups("sensors/a", "1h")
+    ] == [(2, 21.5, 22.5, 22.5)]
+
+    # Перенесенные значения записаны с commit_seq 0 (кэш API читает с -1)
+    latest = {row["topic"]: row["payload"] for row in db_manager.get_latest_values(-1)}
+    assert latest == {"radiohead/7": RADIOHEAD_2, "sensors/a": "22.5"}
+
+    # Сквозная нумерация продолжается после перенесенных записей
+    assert db_manager.insert_batch([("sensors/a", "23.5")])
+    assert db_manager.get_last_row_id() == len(ROWS) + 1
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    # Несколько порций на каждом онлайн-шаге миграции
+    monkeypatch.setattr(database, "MIGRATION_CHUNK_SIZE", 2)
+
+
+def test_migrates_v0_database(tmp_path, small_chunks):
+    path = str(tmp_path / "v0.db")
+    _create_v0(path)
+    db_manager = DatabaseManager(path)
+    try:
+        _check_migrated(db_manager)
+    finally:
+        db_manager.close()
+
+
+def test_migrates_v3_database(tmp_path, small_chunks):
+    """Шаги 5-6 читают колонки, которые добавляют шаги 7-8 (предварительный шаг)"""
+    path = str(tmp_path / "v3.db")
+    _create_v3(path)
+    db_manager = DatabaseManager(path)
+    try:
+        _check_migrated(db_manager)
+    finally:
+        db_manager.close()
+
+
+def test_migration_is_idempotent(tmp_path):
+    path = str(tmp_path / "v0.db")
+    _create_v0(path)
+    DatabaseManager(path).close()
+    db_manager = DatabaseManager(path)
+    try:
+        _check_migrated(db_manager)
+    finally:
+        db_manager.close()
@@ -0,0 +1,32 @@
+import pytest
+
+from mqtt_logger.mqtt_client import MQTTClient, parse_subscriptions
+
+
+def _ignore(topic, payload, received):
+    pass
+
+
+@pytest.mark.parametrize("protocol", ["3.1", "3.1.1", "5"])
+def test_supported_protocols(protocol):
+    """MQTT v5 (общие подписки) требует paho-mqtt >= 1.5"""
+    client = MQTTClient(_ignore, [("#", 0)], protocol=protocol)
+    assert client.client._protocol == {"3.1": 3, "3.1.1": 4, "5": 5}[protocol]
+
+
+def test_unknown_protocol_is_rejected():
+    with pytest.raises(ValueError):
+        MQTTClient(_ignore, [("#", 0)], protocol="4")
+
+
+def test_parse_subscriptions():
+    assert parse_subscriptions("a/+/b:1, c/#, d:2", default_qos=0) == [
+        ("a/+/b", 1),
+        ("c/#", 0),
+        ("d", 2),
+    ]
+    assert parse_subscriptions("a/#:1", default_qos=0, shared_group="g") == [
+        ("$share/g/a/#", 1)
+    ]
+    with pytest.raises(ValueError):
+        parse_subscriptions(" , ")
@@ -0,0 +1,42 @@
+from shared.database import format_timestamp, utc_now_ms
+
+# Середина текущей минуты: обе записи попадают в один интервал rollup_1m
+NOW = utc_now_ms() // 60_000 * 60_000 + 30_000
+
+
+def _insert(db_manager, payload: str, received: int) -> None:
+    assert db_manager.insert_batch([("sensors/a", payload)], received=[received])
+
+
+def test_older_batch_does_not_replace_latest_value(db_manager):
+    """Пачка из журнала или переполнения коммитится после более новых записей"""
+    _insert(db_manager, "22", NOW)
+    _insert(db_manager, "11", NOW - 5_000)
+
+    [latest] = db_manager.get_latest_values()
+    assert latest["payload"] == "22"
+    assert latest["timestamp"] == format_timestamp(NOW)
+
+    [rollup] = db_manager.get_rollups("sensors/a", "1m")
+    assert rollup["message_count"] == 2
+    assert rollup["last"] == 22
+    assert rollup["last_timestamp"] == format_timestamp(NOW)
+    assert (rollup["min"], rollup["max"]) == (11, 22)
+
+
+def test_older_batch_extends_topic_bounds(db_manager):
+    _insert(db_manager, "22", NOW)
+    _insert(db_manager, "11", NOW - 5_000)
+
+    [topic] = db_manager.get_topic_catalog()
+    assert topic["first_seen"] == format_timestamp(NOW - 5_000)
+    assert topic["last_seen"] == format_timestamp(NOW)
+
+
+def test_older_batch_still_bumps_topic_version(db_manager):
+    """Записи топика изменились - версия топика растет, даже если значение нет"""
+    _insert(db_manager, "22", NOW)
+    [(_, first_seq)] = db_manager.get_topic_versions()
+    _insert(db_manager, "11", NOW - 5_000)
+    [(_, second_seq)] = db_manager.get_topic_versions()
+    assert second_seq > first_seq
@@ -0,0 +1,77 @@
+import json
+
+import pytest
+
+from shared import database
+from shared.database import DAY_MS, DatabaseManager, utc_now_ms
+
+NOW = utc_now_ms()
+PAYLOAD = '{"payload": {"sensor_id": 7, "voltage": 3.3}, "rssi": -70}'
+
+
+@pytest.fixture
+def compressed(monkeypatch):
+    monkeypatch.setattr(database, "PAYLOAD_STORAGE", "compressed")
+
+
+def _payloads(db_manager: DatabaseManager) -> list:
+    with db_manager.get_connection() as conn:
+        return [
+            tuple(row)
+            for row in conn.execute(
+                "SELECT payload, timestamp FROM sensor_data ORDER BY timestamp"
+            )
+        ]
+
+
+@pytest.mark.parametrize("cold_cache", [False, True])
+def test_older_batch_keeps_payload_last_seen(compressed, db_manager, cold_cache):
+    """Пачка старше записанных не сдвигает last_seen payload назад"""
+    old = NOW - 200 * DAY_MS
+    assert db_manager.insert_batch([("sensors/a", PAYLOAD)], received=[NOW])
+    if cold_cache:
+        # Без кэша payload_ids: payload находится по hash
+        db_manager.payload_ids.clear()
+    assert db_manager.insert_batch([("sensors/a", PAYLOAD)], received=[old])
+
+    assert db_manager.delete_unused_payloads(3) == 0
+    assert _payloads(db_manager) == [(PAYLOAD, old), (PAYLOAD, NOW)]
+    assert db_manager.delete_old_records(3) == 1
+    assert _payloads(db_manager) == [(PAYLOAD, NOW)]
+
+
+def test_compressed_payloads_round_trip(compressed, db_manager, tmp_path):
+    """Payload до и после обучения словаря читаются без изменений"""
+    payloads = [
+        json.dumps({"payload": {"sensor_id": index % 13, "voltage": index / 100}})
+        for index in range(400)
+    ]
+    payloads += ["не JSON ✓", "", PAYLOAD, PAYLOAD]
+    received = [NOW + index for index in range(len(payloads))]
+    # Первая пачка обучает словарь, вторая сжимается уже им
+    assert db_manager.insert_batch(
+        [("sensors/a", payload) for payload in payloads[:300]], received=received[:300]
+    )
+    assert db_manager.insert_batch(
+        [("sensors/a", payload) for payload in payloads[300:]], received=received[300:]
+    )
+
+    with db_manager.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM payload_dicts").fetchone()[0] == 1
+        assert conn.execute(
+            "SELECT COUNT(*) FROM payloads WHERE dict_id IS NOT NULL"
+        ).fetchone()[0]
+        # Одинаковые payload хранятся один раз
+        stored = conn.execute("SELECT COUNT(*) FROM payloads").fetchone()[0]
+    assert stored == len(set(payloads))
+
+    assert _payloads(db_manager) == list(zip(payloads, received))
+    rows = db_manager.get_sensor_data("sensors/a", len(payloads), ascending=True)
+    assert [row["payload"] for row in rows] == payloads
+
+    # Новый процесс читает словари из базы
+    reopened = DatabaseManager(db_manager.db_path)
+    try:
+        assert _payloads(reopened) == list(zip(payloads, received))
+    finally:
+        reopened.close()
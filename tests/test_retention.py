@@ -0,0 +1,83 @@
+import pytest
+
+from shared.database import (
+    DAY_MS,
+    format_timestamp,
+    partition_for,
+    timestamp_day,
+    utc_now_ms,
+)
+
+NOW = utc_now_ms()
+CUTOFF = NOW - 3 * 30 * DAY_MS
+
+
+def _insert(db_manager, topic: str, timestamps: list) -> None:
+    assert db_manager.insert_batch(
+        [(topic, str(index)) for index in range(len(timestamps))],
+        received=timestamps,
+    )
+
+
+def _daily_counts(db_manager) -> dict:
+    with db_manager.get_connection() as conn:
+        return dict(
+            conn.execute(
+                "SELECT t.name, SUM(d.row_count) FROM daily_stats d "
+                "JOIN topics t ON t.id = d.topic_id GROUP BY t.name"
+            ).fetchall()
+        )
+
+
+def test_retention_updates_topic_counters(db_manager):
+    """Счетчики каталога топиков совпадают с daily_stats после очистки"""
+    # Целая старая партиция (DROP TABLE) и граничная (удаление порциями)
+    _insert(db_manager, "sensors/a", [NOW - 200 * DAY_MS + i for i in range(3)])
+    _insert(db_manager, "sensors/b", [NOW - 200 * DAY_MS])
+    _insert(db_manager, "sensors/a", [CUTOFF - 60_000 - i for i in range(4)])
+    _insert(db_manager, "sensors/a", [CUTOFF + 60_000, NOW])
+    _insert(db_manager, "sensors/b", [NOW])
+
+    assert db_manager.delete_old_records(3, chunk_size=3, pause=0) == 8
+
+    catalog = {
+        row["topic"]: row["message_count"] for row in db_manager.get_topic_catalog()
+    }
+    assert catalog == {"sensors/a": 2, "sensors/b": 1}
+    assert _daily_counts(db_manager) == catalog
+    assert partition_for(NOW - 200 * DAY_MS) not in db_manager.list_partitions(
+        db_manager.get_connection().cursor()
+    )
+
+
+def test_chunked_retention_refreshes_daily_stats(db_manager, monkeypatch):
+    """День на границе хранения: счетчик и границы дня - по оставшимся записям"""
+    day = (NOW - 100 * DAY_MS) // DAY_MS * DAY_MS
+    hour = DAY_MS // 24
+    monkeypatch.setattr(db_manager, "_cutoff", lambda months: day + 12 * hour)
+    _insert(db_manager, "sensors/a", [day + hours * hour for hours in (1, 2, 13, 14)])
+    purge_seq = db_manager.get_state_versions()["purge_seq"]
+
+    assert db_manager.delete_old_records(3, chunk_size=1, pause=0) == 2
+
+    with db_manager.get_connection() as conn:
+        stats = conn.execute(
+            "SELECT day, row_count, first_timestamp, last_timestamp FROM daily_stats"
+        ).fetchall()
+    assert [tuple(row) for row in stats] == [
+        (
+            timestamp_day(day),
+            2,
+            format_timestamp(day + 13 * hour),
+            format_timestamp(day + 14 * hour),
+        )
+    ]
+    # Каждая порция - своя транзакция и свой номер удаления
+    assert db_manager.get_state_versions()["purge_seq"] == purge_seq + 2
+
+
+def test_current_partition_is_not_dropped(db_manager):
+    _insert(db_manager, "sensors/a", [NOW])
+    with pytest.raises(ValueError):
+        db_manager.drop_partition(partition_for(NOW))
+    assert db_manager.get_sensor_data("sensors/a")